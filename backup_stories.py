@@ -0,0 +1,35 @@
+"""Back up the story library.
+
+On the JSON backend the backup is incremental: the snapshot is copied only
+when it has been rewritten, otherwise just the write-ahead log appended
+since the last run. Run it as often as you like, e.g. from cron.
+
+    python backup_stories.py --backup-dir /mnt/backups/tinytales
+    python backup_stories.py --restore /mnt/backups/tinytales
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backup-dir", help="defaults to data/backups")
+    parser.add_argument("--restore", metavar="BACKUP_DIR", help="rebuild the JSON store from a backup directory")
+    args = parser.parse_args()
+
+    from src.database import BACKUP_DIR, STORIES_FILE, backup_stories
+    from src.storage import restore_json_backup
+
+    if args.restore:
+        count = restore_json_backup(args.restore, STORIES_FILE)
+        print(f"Restored {count} stories to {STORIES_FILE}")
+        return
+
+    backup_dir = args.backup_dir or BACKUP_DIR
+    copied = backup_stories(backup_dir)
+    if copied is None:
+        raise SystemExit(1)
+    print(f"Backed up to {backup_dir} ({copied:,} bytes copied)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/bench_batch.py
+"""Batch throughput: generate_many at increasing concurrency.
+
+Runs against the local mock LLM server with a fixed per-request latency,
+so the numbers show how well in-flight requests overlap rather than how
+fast the real API is. Stories, IDs and the duplicate index are written to
+a throwaway directory.
+
+Gemini is reached over the SDK's REST transport here (gRPC can't be
+pointed at the mock), which has no real async client, so its requests
+overlap on worker threads and level off at the default executor's size.
+
+    python -m benchmarks.bench_batch --stories 64 --latency 0.2
+    python -m benchmarks.bench_batch --backend gemini
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.bench_prompts import make_requests
+from benchmarks.mock_llm_server import start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["gemini", "groq"], default="groq")
+    parser.add_argument("--stories", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock response time in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(latency_median=args.latency, latency_sigma=0)
+    workdir = tempfile.mkdtemp(prefix="tinytales-batch-")
+    os.environ.update({
+        "GROQ_API_KEY": "mock", "GROQ_BASE_URL": base_url,
+        "GOOGLE_API_KEY": "mock", "GEMINI_BASE_URL": base_url,
+        "TINYTALES_DATA_DIR": os.path.join(workdir, "data"),
+        "TINYTALES_LOGS_DIR": os.path.join(workdir, "logs"),
+    })
+
+    import src.quota
+    if args.backend == "gemini":
+        from src.story_generator import StoryGenerator
+    else:
+        from src.groq_story import StoryGenerator
+
+    # The mock server has no real quota to protect
+    src.quota.QUOTA_ENABLED = False
+
+    generator = StoryGenerator()
+    params_list = make_requests(args.stories)
+
+    for concurrency in args.concurrency:
+        start = time.perf_counter()
+        results = asyncio.run(generator.generate_many(params_list, concurrency=concurrency))
+        elapsed = time.perf_counter() - start
+        failed = sum(1 for result in results if result["error"])
+        print(f"{args.backend}  concurrency {concurrency:>4}  {args.stories / elapsed:8.1f} stories/s  ({failed} failed)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_clients.py
+"""Per-request client overhead: a fresh Groq client per story vs the pooled client.
+
+Runs against the local mock LLM server, so no API key or quota is
+needed. The mock is plain HTTP on loopback; against the real API each
+fresh client also pays DNS and a TLS handshake, so the saving is larger.
+
+    python -m benchmarks.bench_clients --requests 200
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+from groq import Groq
+
+from benchmarks.mock_llm_server import start_mock_server
+from src.clients import build_groq_client
+
+
+def _complete(client):
+    client.chat.completions.create(
+        messages=[{"role": "user", "content": "Tell me a story"}],
+        model="stub",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(latency_median=0)
+
+    def per_click():
+        # What generate_story_tab used to do on every submit
+        load_dotenv()
+        _complete(Groq(api_key="stub", base_url=base_url))
+
+    pooled_client = build_groq_client("stub", base_url=base_url)
+
+    def pooled():
+        _complete(pooled_client)
+
+    for label, run in (("fresh client per story", per_click), ("pooled client", pooled)):
+        run()  # warm up
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            run()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<24} {elapsed / args.requests * 1000:8.2f} ms/request")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
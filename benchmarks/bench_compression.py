@@ -0,0 +1,118 @@
+# benchmarks/bench_compression.py
+"""Size and read-latency report for story body compression.
+
+Loads the same synthetic library into three SQLite stores - plain JSON
+bodies, deflate without a dictionary, and deflate with a dictionary
+trained on the library - and reports, for each, the database size, the
+stored body bytes (what a cache of raw rows would hold), and get() latency.
+
+    python -m benchmarks.bench_compression                 # 100k stories
+    python -m benchmarks.bench_compression --count 10000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+READ_SAMPLE = 5000
+
+
+def _log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def build_store(path, library, compress):
+    from src.storage import SQLiteStoryStore
+
+    store = SQLiteStoryStore(path, compress=compress)
+    for start in range(0, len(library), 5000):
+        store.put_many(library[start:start + 5000])
+    return store
+
+
+def measure(store, ids):
+    conn = store._conn()
+    body_bytes, body_objects = conn.execute(
+        "SELECT SUM(LENGTH(CAST(story AS BLOB))), COUNT(*) FROM stories"
+    ).fetchone()
+    in_memory = sum(sys.getsizeof(story) for story, in conn.execute("SELECT story FROM stories"))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    timings = []
+    for story_id in ids:
+        start = time.perf_counter()
+        store.get(story_id)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "db_bytes": os.path.getsize(store.path),
+        "body_bytes": body_bytes,
+        "body_bytes_per_story": body_bytes / body_objects,
+        "body_memory_bytes": in_memory,
+        "get_p50_us": statistics.median(timings) * 1e6,
+        "get_p95_us": timings[int(len(timings) * 0.95)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--output", type=Path, help="also write the results as JSON")
+    args = parser.parse_args()
+    output = args.output.resolve() if args.output else None
+
+    workdir = Path(tempfile.mkdtemp(prefix="tinytales-compression-"))
+    os.environ["TINYTALES_DATA_DIR"] = str(workdir / "data")
+    os.environ["TINYTALES_LOGS_DIR"] = str(workdir / "logs")
+    sys.path.insert(0, str(REPO_ROOT))
+    from benchmarks.bench_suite import make_corpus
+    from src.story_parser import parse_story_pages
+
+    _log(f"generating {args.count} stories")
+    library = [
+        (metadata['id'], parse_story_pages(text), metadata)
+        for text, metadata in make_corpus(args.count)
+    ]
+    ids = [story_id for story_id, _, _ in random.Random(1).sample(library, min(READ_SAMPLE, len(library)))]
+
+    results = {}
+    _log("plain JSON bodies")
+    results["plain"] = measure(build_store(workdir / "plain.db", library, compress=False), ids)
+    _log("deflate, no dictionary")
+    store = build_store(workdir / "deflate.db", library, compress=True)
+    results["deflate"] = measure(store, ids)
+    _log("deflate with a trained dictionary")
+    start = time.perf_counter()
+    store.train_dictionary()
+    trained = time.perf_counter()
+    store.recompress()
+    results["deflate_dict"] = measure(store, ids)
+    results["deflate_dict"]["train_seconds"] = trained - start
+    results["deflate_dict"]["recompress_seconds"] = time.perf_counter() - trained
+
+    plain = results["plain"]
+    print(f"{'':14}{'db MB':>9}{'body B/story':>14}{'body mem MB':>13}{'get p50 us':>12}{'get p95 us':>12}")
+    for name, row in results.items():
+        print(
+            f"{name:14}{row['db_bytes'] / 1e6:9.1f}{row['body_bytes_per_story']:14.0f}"
+            f"{row['body_memory_bytes'] / 1e6:13.1f}{row['get_p50_us']:12.1f}{row['get_p95_us']:12.1f}"
+        )
+    for name in ("deflate", "deflate_dict"):
+        row = results[name]
+        print(
+            f"{name}: bodies {1 - row['body_bytes'] / plain['body_bytes']:.0%} smaller, "
+            f"database {1 - row['db_bytes'] / plain['db_bytes']:.0%} smaller, "
+            f"get() p50 {row['get_p50_us'] - plain['get_p50_us']:+.1f}us"
+        )
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
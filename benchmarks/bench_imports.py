@@ -0,0 +1,91 @@
+# benchmarks/bench_imports.py
+"""Cold-start import time of main.py, checked against a budget.
+
+Imports main in a fresh interpreter under ``python -X importtime`` (best of
+--repeat runs, from an empty scratch directory) and lists the slowest
+modules. Exits non-zero if the import takes longer than --budget-ms, loads
+a provider SDK (those should wait until a story is generated), or leaves
+files behind in the working directory.
+
+    python -m benchmarks.bench_imports
+    python -m benchmarks.bench_imports --budget-ms 800 --top 30
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET_MS = 1500
+# Must not be imported until a generator is actually used
+DEFERRED_MODULES = ("google.generativeai", "google.ai.generativelanguage", "grpc", "groq", "pandas")
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_main():
+    """[(module, self_us, cumulative_us, depth)] for one cold import of main, plus files it created"""
+    workdir = tempfile.mkdtemp(prefix="tinytales-imports-")
+    env = dict(
+        os.environ,
+        TINYTALES_DATA_DIR=os.path.join(workdir, "data"),
+        TINYTALES_LOGS_DIR=os.path.join(workdir, "logs"),
+        PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+    modules = [
+        (match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2)
+        for match in map(LINE.match, result.stderr.splitlines()) if match
+    ]
+    return modules, sorted(os.listdir(workdir))
+
+
+def loaded_deferred(modules):
+    """DEFERRED_MODULES (or submodules of them) among the imported ``modules``"""
+    return sorted({
+        name for name, _, _, _ in modules
+        if any(name == deferred or name.startswith(deferred + ".") for deferred in DEFERRED_MODULES)
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3, help="cold imports to run (best is kept)")
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args()
+
+    runs = [import_main() for _ in range(args.repeat)]
+    modules, created = min(runs, key=lambda run: next(m[2] for m in run[0] if m[0] == "main"))
+    total_ms = next(cumulative for name, _, cumulative, _ in modules if name == "main") / 1000
+
+    print(f"import main: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: m[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f}{self_us / 1000:10.1f}  {'  ' * depth}{name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    loaded = loaded_deferred(modules)
+    if loaded:
+        failures.append(f"loaded at startup: {', '.join(loaded)}")
+    if created:
+        failures.append(f"importing created files: {', '.join(created)}")
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_prompts.py
+"""Per-request prompt-build cost before and after the compiled template table.
+
+"Before" is benchmarks/baseline_prompts.py, a copy of the original
+builders that rebuilt the literal prompt strings on every call; "after"
+is build_story_prompt, which only splices the description into a
+memoized prefix/suffix. Both must produce the same prompt.
+
+    python -m benchmarks.bench_prompts --requests 20000
+"""
+import argparse
+import itertools
+import random
+import timeit
+
+from benchmarks import baseline_prompts
+from config import AGE_GROUPS, GENRES, GENDERS, STORY_LENGTHS
+from src.prompts import build_story_prompt
+
+
+def make_requests(count, seed=0):
+    rng = random.Random(seed)
+    combos = list(itertools.product(AGE_GROUPS, GENRES, GENDERS, STORY_LENGTHS))
+    requests = []
+    for _ in range(count):
+        age_group, genre, gender, story_length = rng.choice(combos)
+        requests.append({
+            "age_group": age_group,
+            "genre": genre,
+            "gender": gender,
+            "story_length": story_length.split()[0],
+            "description": rng.choice([None, "A little mouse who discovers a magical garden"]),
+            "include_moral": rng.random() < 0.8,
+            "include_dialogue": rng.random() < 0.8,
+            "rhyming": rng.random() < 0.2,
+        })
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests)
+    for params in requests:
+        assert build_story_prompt(params) == baseline_prompts.build_story_prompt(params)
+
+    for label, build in (("before (baseline)", baseline_prompts.build_story_prompt), ("after (compiled)", build_story_prompt)):
+        best = min(timeit.repeat(lambda: [build(p) for p in requests], number=1, repeat=args.repeat))
+        print(f"{label:<18} {best / len(requests) * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
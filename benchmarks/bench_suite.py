@@ -0,0 +1,298 @@
+# benchmarks/bench_suite.py
+"""Scale benchmarks for the storage, parsing and dedup hot paths, with regression checks.
+
+Each corpus size runs in its own process against a scratch data directory
+holding that many synthetic stories. Every operation records its time
+(best of --repeat runs) and its peak traced Python memory. Results are
+written as JSON and compared with a stored baseline; any operation slower
+or hungrier than the baseline by more than --threshold is flagged and the
+run exits non-zero.
+
+    python -m benchmarks.bench_suite                          # 1k and 10k stories
+    python -m benchmarks.bench_suite --sizes 1000 10000 100000 1000000
+    python -m benchmarks.bench_suite --save-baseline          # accept the current numbers
+
+Dedup: computing real MinHash signatures for a 1M library takes over an
+hour, so the index is filled with random signatures (a library of
+distinct stories) and queried with real story text.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = REPO_ROOT / "benchmarks" / "baseline.json"
+PER_CALL_SAMPLE = 10000  # texts used for the parse/title operations
+SAVE_SAMPLE = 200        # new stories saved into the full library
+DEDUP_SAMPLE = 200       # duplicate checks against the full index
+
+
+def _log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def make_corpus(count, seed=0):
+    """[(story_text, metadata)] of synthetic stories with realistic metadata spread"""
+    from benchmarks.mock_llm_server import make_story
+    from config import AGE_GROUPS, GENRES, GENDERS
+
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    corpus = []
+    for i in range(count):
+        text = make_story(f"Create a {rng.randint(5, 8)}-page story", rng)
+        corpus.append((text, {
+            "id": f"story_{i + 1}_bench",
+            "title": text.split('\n', 1)[0][len('Title: '):],
+            "genre": rng.choice(GENRES),
+            "gender": rng.choice(GENDERS),
+            "age_group": rng.choice(AGE_GROUPS),
+            "story_length": "6",
+            "description": None,
+            "created_at": (start + datetime.timedelta(minutes=i)).isoformat(),
+        }))
+    return corpus
+
+
+def fill_dedup_index(index, count, seed=0):
+    """Bulk-insert ``count`` random signatures, as if that many distinct stories had been saved"""
+    rng = random.Random(seed)
+    conn = index._conn()
+    now = time.time()
+    with conn:
+        for start in range(0, count, 10000):
+            signatures, bands = [], []
+            for i in range(start, min(count, start + 10000)):
+                packed = rng.randbytes(4 * index.num_perm)
+                key = f"story_{i + 1}_bench"
+                signatures.append((key, packed, 1, now))
+                signature = struct.unpack(f"<{index.num_perm}I", packed)
+                bands.extend((band, bucket, key) for band, bucket in index._buckets(signature))
+            conn.executemany(
+                "INSERT OR REPLACE INTO signatures (story_key, signature, saved, added_at) VALUES (?, ?, ?, ?)",
+                signatures
+            )
+            conn.executemany("INSERT OR IGNORE INTO bands (band, bucket, story_key) VALUES (?, ?, ?)", bands)
+
+
+def measure(fn, repeat, setup=None):
+    """(best wall seconds over ``repeat`` runs, peak traced MB of one extra run); ``setup()`` runs untimed before each"""
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak / (1024 * 1024)
+
+
+def run_size(size, repeat):
+    """Build a ``size``-story library in the current directory and time every operation on it"""
+    from src import database
+    from src.dedup import get_dedup_index, is_duplicate
+    from src.story_parser import parse_story_pages
+    from src.story_generator import StoryGenerator as GeminiGenerator
+    from src.groq_story import StoryGenerator as GroqGenerator
+
+    # The parsing helpers don't need a configured client
+    gemini = GeminiGenerator.__new__(GeminiGenerator)
+    groq = GroqGenerator.__new__(GroqGenerator)
+
+    _log(f"[{size}] generating corpus")
+    corpus = make_corpus(size + SAVE_SAMPLE * (repeat + 1))
+    library, extra = corpus[:size], corpus[size:]
+
+    # Fill the index before the store so get_dedup_index doesn't backfill it from the library
+    _log(f"[{size}] filling dedup index")
+    fill_dedup_index(get_dedup_index(), size)
+    _log(f"[{size}] loading store")
+    store = database.get_store()
+    for start in range(0, size, 5000):
+        store.put_many([
+            (metadata['id'], parse_story_pages(text), metadata) for text, metadata in library[start:start + 5000]
+        ])
+
+    texts = [text for text, _ in library[:PER_CALL_SAMPLE]]
+    unmarked = [text.replace("Page ", "Part ") for text in texts]
+    genre, age_group, gender = (library[0][1][field] for field in ("genre", "age_group", "gender"))
+    filters = [
+        {"genre": genre},
+        {"genre": genre, "age_group": age_group},
+        {"genre": genre, "age_group": age_group, "gender": gender},
+        {"created_from": "2024-01-02", "created_to": "2024-01-09"},
+    ]
+    pending_saves = iter(range(repeat + 1))
+
+    def save_batch():
+        batch = next(pending_saves)
+        for text, metadata in extra[batch * SAVE_SAMPLE:(batch + 1) * SAVE_SAMPLE]:
+            database.save_story(parse_story_pages(text), metadata)
+
+    def library_rerun():
+        # What the library tab queries on every Streamlit rerun
+        database.count_stories()
+        database.get_facet_counts()
+        database.count_stories(filters[0])
+        database.list_story_summaries(0, 10, filters[0])
+
+    operations = {
+        "save_story": (save_batch, min(SAVE_SAMPLE, len(extra))),
+        "load_stories": (database.load_stories, 1),
+        "count_filtered": (lambda: [database.count_stories(f) for f in filters], len(filters)),
+        "list_filtered": (
+            lambda: [database.list_story_summaries(3, 10, f, sort) for f in filters for sort in ("newest", "title")],
+            len(filters) * 2,
+        ),
+        "search": (lambda: [database.search_stories(q) for q in ("bunny", '"red ball"', "dragon moon")], 3),
+        "library_rerun": (library_rerun, 4),
+        "parse_strict": (lambda: [gemini._parse_story_pages(t) for t in texts], len(texts)),
+        "parse_lenient": (lambda: [groq._parse_story_pages(t) for t in texts], len(texts)),
+        "parse_lenient_fallback": (lambda: [groq._parse_story_pages(t) for t in unmarked], len(unmarked)),
+        "extract_title": (lambda: [gemini._extract_title(t) for t in texts], len(texts)),
+        "extract_title_lenient": (lambda: [groq._extract_title(t) for t in texts], len(texts)),
+        "is_duplicate": (lambda: [is_duplicate(t) for t in texts[:DEDUP_SAMPLE]], min(DEDUP_SAMPLE, len(texts))),
+    }
+
+    results = {}
+    for name, (fn, calls) in operations.items():
+        _log(f"[{size}] {name}")
+        # Start every run from an empty query cache so repeats time the store, not the cache
+        results[name] = _result(calls, *measure(fn, repeat, setup=database.query_cache.clear))
+    _log(f"[{size}] library_rerun_cached")
+    library_rerun()
+    results["library_rerun_cached"] = _result(4, *measure(library_rerun, repeat))
+    return results
+
+
+def _result(calls, seconds, peak_mb):
+    return {
+        "calls": calls,
+        "seconds": round(seconds, 6),
+        "per_call_ms": round(seconds / calls * 1000, 6),
+        "peak_mb": round(peak_mb, 3),
+    }
+
+
+def run_in_subprocess(size, repeat):
+    """Run one size in a fresh interpreter and scratch directory so sizes don't share caches or memory"""
+    with tempfile.TemporaryDirectory(prefix=f"tinytales-bench-{size}-") as workdir:
+        os.makedirs(os.path.join(workdir, "data"))
+        env = dict(
+            os.environ,
+            TINYTALES_DATA_DIR=os.path.join(workdir, "data"),
+            TINYTALES_LOGS_DIR=os.path.join(workdir, "logs"),
+            PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+        )
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_suite", "--worker", str(size), "--repeat", str(repeat)],
+            cwd=workdir, env=env, check=True, stdout=subprocess.PIPE, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline per operation; return the list of regressions"""
+    regressions = []
+    print(f"\n{'size':>8}  {'operation':<24}{'ms/call':>12}{'base':>12}{'delta':>9}{'peak MB':>10}{'base':>10}")
+    for size, operations in results.items():
+        for name, current in operations.items():
+            base = baseline.get(size, {}).get(name)
+            line = f"{size:>8}  {name:<24}{current['per_call_ms']:>12.4f}"
+            if not base:
+                print(line + f"{'-':>12}{'':>9}{current['peak_mb']:>10.2f}{'-':>10}")
+                continue
+            delta = current['per_call_ms'] / base['per_call_ms'] - 1 if base['per_call_ms'] else 0.0
+            flags = []
+            if delta > threshold:
+                flags.append("time")
+            if base['peak_mb'] and current['peak_mb'] > base['peak_mb'] * (1 + threshold) and current['peak_mb'] - base['peak_mb'] > 1:
+                flags.append("memory")
+            if flags:
+                regressions.append((size, name, flags))
+            print(
+                line + f"{base['per_call_ms']:>12.4f}{delta:>+9.0%}{current['peak_mb']:>10.2f}{base['peak_mb']:>10.2f}"
+                + (f"  REGRESSION ({', '.join(flags)})" if flags else "")
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per operation (best is kept)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging, e.g. 0.2 = 20%%")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--output", type=Path, help="results file (default: logs/benchmarks/<timestamp>.json)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        print(json.dumps(run_size(args.worker, args.repeat)))
+        return
+
+    from config import LOGS_DIR
+
+    results = {}
+    for size in args.sizes:
+        start = time.perf_counter()
+        results[str(size)] = run_in_subprocess(size, args.repeat)
+        _log(f"[{size}] done in {time.perf_counter() - start:.0f}s")
+
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL, text=True,
+    ).stdout.strip()
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": commit or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    output = args.output or LOGS_DIR / "benchmarks" / f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+    baseline = json.loads(args.baseline.read_text())["results"] if args.baseline.exists() else {}
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"\nBaseline updated: {args.baseline}")
+    elif not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+    else:
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# benchmarks/load_test.py
+"""End-to-end load test: N concurrent sessions through generate -> parse -> dedup -> save.
+
+Runs the real generators against the local mock LLM server (started here
+unless --url points at a running one) and reports throughput plus
+p50/p95/p99 latency per stage. All stories, dedup signatures and caches
+go to a throwaway data directory.
+
+    python -m benchmarks.load_test --backend groq --sessions 16 --stories 10 --latency-median 0.8
+    python -m benchmarks.load_test --backend gemini --stream --error-rate 0.05
+
+Stages: "llm" is the provider call (including prompt building and, with
+--quota, time queued for rate limits), "parse" and "dedup" are measured
+inside the generator, "save" is save_story. With --stream, pages are
+parsed as they arrive, so parsing is part of "llm" and "first_page"
+(time until the first complete page) is reported instead.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.mock_llm_server import start_mock_server, add_behaviour_arguments, behaviour_from_args
+
+STAGES = ("first_page", "llm", "parse", "dedup", "save", "total")
+
+
+class StageTimer:
+    """Per-stage latency samples, plus per-thread accumulators for stages timed inside the generator"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.inner = defaultdict(float)
+
+    def inner(self, stage):
+        return self._local.inner[stage]
+
+    def wrap(self, fn, stage):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.inner[stage] += time.perf_counter() - start
+        return timed
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def run_session(generator, save_story, params_list, stream, timer, failures):
+    for story_params in params_list:
+        timer.reset()
+        start = time.perf_counter()
+        first_page = None
+        if stream:
+            story_data = None
+            for event, value in generator.generate_story_stream(story_params):
+                if event == "page" and first_page is None:
+                    first_page = time.perf_counter() - start
+                elif event == "done":
+                    story_data = value
+        else:
+            story_data = generator.generate_story(story_params)
+        generated = time.perf_counter() - start
+
+        if story_data is None:
+            failures.append(1)
+            continue
+
+        save_start = time.perf_counter()
+        save_story(story_data['story'], story_data['metadata'])
+        saved = time.perf_counter() - save_start
+
+        parse, dedup = timer.inner("parse"), timer.inner("dedup")
+        timer.record("llm", generated - parse - dedup)
+        if first_page is not None:
+            timer.record("first_page", first_page)
+        if not stream:
+            timer.record("parse", parse)
+        timer.record("dedup", dedup)
+        timer.record("save", saved)
+        timer.record("total", generated + saved)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["gemini", "groq"], default="groq")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--stories", type=int, default=10, help="stories generated per session")
+    parser.add_argument("--stream", action="store_true", help="use generate_story_stream like the UI does")
+    parser.add_argument("--quota", action="store_true", help="keep the provider rate-limit scheduler on")
+    parser.add_argument("--url", help="use an already running mock server instead of starting one")
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    base_url = args.url
+    if not base_url:
+        _, base_url = start_mock_server(**behaviour_from_args(args))
+
+    # Point everything at the mock server and a scratch data directory before the app modules load
+    workdir = tempfile.mkdtemp(prefix="tinytales-load-")
+    os.environ.update({
+        "GROQ_API_KEY": "mock", "GROQ_BASE_URL": base_url,
+        "GOOGLE_API_KEY": "mock", "GEMINI_BASE_URL": base_url,
+        "TINYTALES_DATA_DIR": os.path.join(workdir, "data"),
+        "TINYTALES_LOGS_DIR": os.path.join(workdir, "logs"),
+    })
+
+    import src.quota
+    from src.database import save_story
+    from benchmarks.bench_prompts import make_requests
+    if args.backend == "groq":
+        import src.groq_story as generator_module
+    else:
+        import src.story_generator as generator_module
+
+    if not args.quota:
+        # The mock server has no real quota to protect
+        src.quota.QUOTA_ENABLED = False
+
+    timer = StageTimer()
+    generator_module.is_duplicate = timer.wrap(generator_module.is_duplicate, "dedup")
+    generator = generator_module.StoryGenerator()
+    generator._parse_story_pages = timer.wrap(generator._parse_story_pages, "parse")
+
+    requests = make_requests(args.sessions * args.stories)
+    failures = []
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(generator, save_story, requests[i::args.sessions], args.stream, timer, failures),
+        )
+        for i in range(args.sessions)
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    completed = len(timer.samples["total"])
+    print(f"\n{args.backend} via {base_url}: {args.sessions} sessions x {args.stories} stories"
+          f"{' (streaming)' if args.stream else ''}")
+    print(f"{completed} saved, {len(failures)} failed in {elapsed:.1f}s = {completed / elapsed:.2f} stories/s\n")
+    print(f"{'stage':<11}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage in STAGES:
+        samples = timer.samples.get(stage)
+        if samples:
+            print(f"{stage:<11}{len(samples):>7}" + "".join(
+                f"{percentile(samples, pct) * 1000:>10.1f}" for pct in (50, 95, 99)
+            ))
+    print(f"\nScratch data left in {workdir}")
+
+
+if __name__ == "__main__":
+    main()
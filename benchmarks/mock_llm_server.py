@@ -0,0 +1,330 @@
+# benchmarks/mock_llm_server.py
+"""Local stand-in for the Groq and Gemini HTTP APIs.
+
+Writes random but well-formed "Title:/Page N:" stories with a configurable
+latency distribution, streaming, server errors and rate-limit responses.
+The generators use it unchanged through the base-URL overrides:
+
+    python -m benchmarks.mock_llm_server --port 8765 --latency-median 1.5
+    GROQ_BASE_URL=http://127.0.0.1:8765 GEMINI_BASE_URL=http://127.0.0.1:8765 streamlit run main.py
+
+Groq:   POST /openai/v1/chat/completions  (JSON, or SSE with "stream": true)
+Gemini: POST /v1beta/models/<model>:generateContent
+        POST /v1beta/models/<model>:streamGenerateContent  (streamed JSON array, or SSE with alt=sse)
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GEMINI_PATH = re.compile(r"^/v1(?:beta)?/models/([^/:]+):(generateContent|streamGenerateContent)$")
+PAGE_COUNT = re.compile(r"(\d+)[- ]page|exactly (\d+) pages", re.IGNORECASE)
+
+NAMES = ["Luna", "Milo", "Pip", "Rosie", "Finn", "Hazel", "Otis", "Juniper", "Theo", "Willow", "Bea", "Arlo"]
+CREATURES = ["bunny", "fox", "dragon", "robot", "owl", "turtle", "kitten", "bear", "hedgehog", "penguin"]
+PLACES = ["meadow", "forest", "moon", "garden", "ocean", "castle", "village", "mountain", "library", "river"]
+THINGS = ["red ball", "golden key", "tiny map", "blue kite", "magic seed", "lost star", "silver shell", "paper boat"]
+FEELINGS = ["happy", "curious", "brave", "sleepy", "excited", "worried", "proud", "hopeful"]
+SENTENCES = [
+    "{name} the {creature} lived near the {place}.",
+    "One sunny morning, {name} found a {thing}.",
+    "{name} felt {feeling} and wanted to share it with a friend.",
+    "A friendly {creature} hopped over to help.",
+    "Together they walked all the way to the {place}.",
+    "\"Let's try one more time!\" said {name}.",
+    "The {thing} began to sparkle and glow.",
+    "Everyone cheered and felt {feeling} inside.",
+    "{name} learned that kindness makes every {place} brighter.",
+    "The wind whispered softly through the {place}.",
+    "{name} counted the clouds: one, two, three!",
+    "At bedtime, {name} hugged the {thing} tight.",
+]
+
+
+def make_story(prompt, rng):
+    """A random picture-book story with as many pages as the prompt asks for"""
+    match = PAGE_COUNT.search(prompt)
+    pages = int(next(group for group in match.groups() if group)) if match else 6
+    pages = max(1, min(pages, 20))
+
+    def fill(template):
+        return template.format(
+            name=rng.choice(NAMES), creature=rng.choice(CREATURES), place=rng.choice(PLACES),
+            thing=rng.choice(THINGS), feeling=rng.choice(FEELINGS),
+        )
+
+    parts = [f"Title: {rng.choice(NAMES)} and the {rng.choice(THINGS).title()}"]
+    for page in range(1, pages + 1):
+        lines = [fill(template) for template in rng.sample(SENTENCES, rng.randint(2, 3))]
+        parts.append(f"Page {page}:\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def _prompt_text(value):
+    """Concatenate every string in a request body (chat messages or Gemini contents)"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return "\n".join(_prompt_text(v) for v in value.values())
+    if isinstance(value, list):
+        return "\n".join(_prompt_text(v) for v in value)
+    return ""
+
+
+class MockBehaviour:
+    """Latency, failure and rate-limit settings shared by every request to one server.
+
+    Response time is log-normal around ``latency_median`` seconds with
+    shape ``latency_sigma`` (0 makes it fixed). ``error_rate`` of requests
+    fail with a 500, and requests beyond ``rate_limit_rpm`` in any
+    60-second window get a 429 with Retry-After.
+    """
+
+    def __init__(self, latency_median=0.5, latency_sigma=0.5, error_rate=0.0, rate_limit_rpm=0,
+                 chunk_words=8, seed=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self.chunk_words = chunk_words
+        self._rng = random.Random(seed)
+        self._seeds = itertools.count(self._rng.randrange(1 << 30))
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def request_rng(self):
+        with self._lock:
+            return random.Random(next(self._seeds))
+
+    def latency(self, rng):
+        if self.latency_median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+
+    def failure(self, rng):
+        """Return 429, 500 or None for a new request"""
+        if self.rate_limit_rpm:
+            now = time.time()
+            with self._lock:
+                while self._recent and self._recent[0] <= now - 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rate_limit_rpm:
+                    return 429
+                self._recent.append(now)
+        if rng.random() < self.error_rate:
+            return 500
+        return None
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    behaviour = MockBehaviour()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path, _, query = self.path.partition("?")
+        gemini = GEMINI_PATH.match(path)
+        if gemini:
+            provider, model = "gemini", gemini.group(1)
+            stream = gemini.group(2) == "streamGenerateContent"
+            prompt = _prompt_text(body.get("contents", []))
+        elif path.endswith("/chat/completions"):
+            provider, model = "groq", body.get("model", "mock")
+            stream = bool(body.get("stream"))
+            prompt = _prompt_text(body.get("messages", []))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+
+        rng = self.behaviour.request_rng()
+        status = self.behaviour.failure(rng)
+        if status:
+            self._send_failure(provider, status)
+            return
+
+        story = make_story(prompt, rng)
+        latency = self.behaviour.latency(rng)
+        if not stream:
+            time.sleep(latency)
+            if provider == "groq":
+                self._send_json(200, _groq_completion(story, model))
+            else:
+                self._send_json(200, _gemini_response(story, model, "STOP"))
+            return
+
+        words = re.split(r"(?<=\s)", story)
+        size = max(1, self.behaviour.chunk_words)
+        chunks = ["".join(words[i:i + size]) for i in range(0, len(words), size)]
+        # Time to first token is a fifth of the response time; the rest is spread over the chunks
+        first_delay, gap = latency * 0.2, latency * 0.8 / max(1, len(chunks))
+        if provider == "groq":
+            self._stream_groq(chunks, model, first_delay, gap)
+        else:
+            self._stream_gemini(chunks, model, first_delay, gap, sse="alt=sse" in query)
+
+    def _send_json(self, status, payload, headers=()):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_failure(self, provider, status):
+        if provider == "groq":
+            error = {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"} \
+                if status == 429 else {"message": "Internal server error", "type": "internal_server_error"}
+        else:
+            error = {"code": status, "message": "Resource has been exhausted (e.g. check quota).",
+                     "status": "RESOURCE_EXHAUSTED"} \
+                if status == 429 else {"code": status, "message": "An internal error has occurred.", "status": "INTERNAL"}
+        headers = [("Retry-After", "1")] if status == 429 else []
+        self._send_json(status, {"error": error}, headers)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _stream_groq(self, chunks, model, first_delay, gap):
+        self._start_stream("text/event-stream")
+        time.sleep(first_delay)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(gap)
+            self._write_chunk(f"data: {json.dumps(_groq_chunk(model, {'content': chunk}))}\n\n")
+        # Like Groq, the final chunk carries the usage totals under x_groq
+        final = dict(_groq_chunk(model, {}, 'stop'), x_groq={"id": "req_mock", "usage": _groq_usage("".join(chunks))})
+        self._write_chunk(f"data: {json.dumps(final)}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+    def _stream_gemini(self, chunks, model, first_delay, gap, sse):
+        self._start_stream("text/event-stream" if sse else "application/json")
+        time.sleep(first_delay)
+        if not sse:
+            self._write_chunk("[")
+        sent = ""
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(gap)
+            sent += chunk
+            # usageMetadata counts everything generated so far, as the real API does
+            payload = json.dumps(_gemini_response(chunk, model, "STOP" if i == len(chunks) - 1 else None, len(sent) // 4))
+            self._write_chunk(f"data: {payload}\r\n\r\n" if sse else ("," if i else "") + payload)
+        if not sse:
+            self._write_chunk("]")
+        self._end_stream()
+
+
+def _groq_completion(text, model):
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": _groq_usage(text),
+    }
+
+
+def _groq_usage(text):
+    return {"prompt_tokens": 400, "completion_tokens": len(text) // 4, "total_tokens": 400 + len(text) // 4}
+
+
+def _groq_chunk(model, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _gemini_response(text, model, finish_reason, completion_tokens=None):
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": 400,
+            "candidatesTokenCount": len(text) // 4 if completion_tokens is None else completion_tokens,
+        },
+        "modelVersion": model,
+    }
+
+
+def start_mock_server(host="127.0.0.1", port=0, **behaviour):
+    """Serve the mock API on a daemon thread; returns (server, base_url)"""
+    handler = type("Handler", (MockLLMHandler,), {"behaviour": MockBehaviour(**behaviour)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument("--latency-median", type=float, default=0.5, help="median response time in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal shape; 0 for fixed latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rpm", type=int, default=0, help="answer 429 beyond this many requests a minute")
+    parser.add_argument("--chunk-words", type=int, default=8, help="words per streamed chunk")
+    parser.add_argument("--seed", type=int)
+
+
+def behaviour_from_args(args):
+    return {
+        "latency_median": args.latency_median,
+        "latency_sigma": args.latency_sigma,
+        "error_rate": args.error_rate,
+        "rate_limit_rpm": args.rate_limit_rpm,
+        "chunk_words": args.chunk_words,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.host, args.port, **behaviour_from_args(args))
+    print(f"Mock LLM server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/stress_story_counter.py
+"""Hammer the story ID allocator from many processes and threads.
+
+Checks that every ID handed out is unique and reports calls/sec.
+
+    python -m benchmarks.stress_story_counter --processes 8 --threads 8 --calls 500
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from src.story_counter import StoryIdAllocator
+
+
+def _worker(counter_path, block_size, threads, calls, queue):
+    allocator = StoryIdAllocator(counter_path, block_size=block_size)
+    ids = []
+    ids_lock = threading.Lock()
+
+    def run():
+        local = [allocator.next_id() for _ in range(calls)]
+        with ids_lock:
+            ids.extend(local)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    queue.put(ids)
+
+
+def run_stress(processes, threads, calls, block_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        counter_path = os.path.join(tmp, "story_count.json")
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=_worker, args=(counter_path, block_size, threads, calls, queue))
+            for _ in range(processes)
+        ]
+
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        all_ids = []
+        for _ in procs:
+            all_ids.extend(queue.get())
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+    total = processes * threads * calls
+    unique = len(set(all_ids))
+    print(f"block_size={block_size:>4}  ids={total}  unique={unique}  "
+          f"duplicates={total - unique}  calls/sec={total / elapsed:,.0f}")
+    return total == unique
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[1, 20, 100])
+    args = parser.parse_args()
+
+    ok = True
+    for block_size in args.block_sizes:
+        ok = run_stress(args.processes, args.threads, args.calls, block_size) and ok
+
+    if not ok:
+        raise SystemExit("Duplicate story IDs detected")
+
+
+if __name__ == "__main__":
+    main()
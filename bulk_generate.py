@@ -0,0 +1,45 @@
+"""Generate stories in bulk without the Streamlit UI.
+
+Reads story parameter rows (the fields the story form produces) from a
+JSONL or CSV file and saves every generated story to the library. Progress
+is checkpointed after each batch, so re-running the same command after a
+crash or Ctrl+C carries on where it stopped.
+
+    python bulk_generate.py stories.jsonl --backend groq --concurrency 8
+"""
+import argparse
+
+from config import BATCH_CONCURRENCY, BULK_BATCH_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL or CSV file of story parameter rows")
+    parser.add_argument("--backend", choices=["gemini", "groq", "router"], default="gemini")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <input>.checkpoint.json)")
+    args = parser.parse_args()
+
+    if args.backend == "router":
+        from src.router import build_router
+        generator = build_router()
+    elif args.backend == "groq":
+        from src.groq_story import StoryGenerator
+        generator = StoryGenerator()
+    else:
+        from src.story_generator import StoryGenerator
+        generator = StoryGenerator()
+    from src.bulk import run_bulk
+
+    saved, failed = run_bulk(
+        generator, args.input, args.checkpoint,
+        concurrency=args.concurrency, batch_size=args.batch_size
+    )
+    print(f"Done: {saved} saved, {failed} failed")
+    if failed:
+        print("Re-run the same command to retry the failed rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 # config.py
+import os
 from pathlib import Path
 
 # Application settings
@@ -7,13 +8,11 @@ APP_VERSION = "1.0.0"
 
 # Directories
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "data"
+DATA_DIR = Path(os.getenv("TINYTALES_DATA_DIR", BASE_DIR / "data"))  # overridable for load tests
 EXPORTS_DIR = BASE_DIR / "exports"
-LOGS_DIR = BASE_DIR / "logs"
+LOGS_DIR = Path(os.getenv("TINYTALES_LOGS_DIR", BASE_DIR / "logs"))  # overridable like DATA_DIR
 
-# Create directories if they don't exist
-for directory in [DATA_DIR, EXPORTS_DIR, LOGS_DIR]:
-    directory.mkdir(exist_ok=True)
+# Directories are created on first use by whatever writes to them, so importing config has no side effects
 
 # Story generation settings
 DEFAULT_STORY_LENGTH = 6
@@ -61,4 +60,107 @@ TOP_K = 40
 
 # File settings
 STORIES_FILENAME = "stories.json"
-BACKUP_FILENAME = "stories_backup.json"
\ No newline at end of file
+BACKUP_FILENAME = "stories_backup.json"  # snapshot copy inside a backup directory
+BACKUP_DIRNAME = "backups"               # in DATA_DIR; where backup_stories.py writes by default
+
+# Storage settings
+# "sqlite" keeps one indexed row per story; "json" is the original single-file store
+STORAGE_BACKEND = "sqlite"
+STORIES_DB_FILENAME = "stories.db"
+
+# Story body compression (SQLite backend); metadata stays plain JSON
+STORY_COMPRESSION = True                # store page lists as deflate blobs
+STORY_COMPRESSION_LEVEL = 9
+STORY_DICT_SIZE = 32 * 1024             # preset dictionary size; deflate can't look back further
+STORY_DICT_SAMPLE = 2000                # stories sampled to train a dictionary
+
+# JSON store write-ahead log (STORAGE_BACKEND = "json")
+WAL_FSYNC = True                        # fsync each group of log appends before a save returns
+WAL_SEGMENT_BYTES = 4 * 1024 * 1024     # start a new log segment after this many bytes
+WAL_SNAPSHOT_RECORDS = 1000             # publish a new library generation and drop the segments it covers after this many log records
+
+# Story library settings
+LIBRARY_PAGE_SIZE = 10
+LIBRARY_QUERY_CACHE_ENTRIES = 256  # count/facet/page results kept between reruns, dropped whenever the library changes
+
+# Near-duplicate detection (MinHash + LSH)
+DEDUP_FILENAME = "dedup.db"
+DEDUP_SIMILARITY_THRESHOLD = 0.75
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 32          # 4 rows per band: a 0.75-similar pair becomes a candidate >99.99% of the time (0.6: ~99%)
+DEDUP_RECENT_LIMIT = 1000 # unsaved generations kept for comparison
+
+# LLM response cache (opt-in)
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_FILENAME = "response_cache.db"
+RESPONSE_CACHE_VARIANTS = 3              # distinct stories kept per request
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+# Render pages as they stream in from the model
+STREAM_STORIES = True
+
+# Story display
+STORY_HTML_CACHE_SIZE = 256  # rendered stories kept in memory, keyed by story ID and content hash
+STORY_BOOK_VIEW = False      # default to showing one page at a time instead of the whole story
+
+# Shared HTTP client pool for provider APIs
+HTTP_MAX_CONNECTIONS = 50
+HTTP_MAX_KEEPALIVE = 20
+HTTP_TIMEOUT_SECONDS = 60
+
+# Batch generation
+BATCH_CONCURRENCY = 8     # requests in flight per generate_many call
+
+# Bulk generation CLI (bulk_generate.py)
+BULK_BATCH_SIZE = 25      # rows generated and saved per checkpoint
+
+# Library export (export_stories.py and the Story Library tab)
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)  # processes formatting stories; 1 formats inline
+EXPORT_BATCH_SIZE = 200   # stories read from the store and formatted at a time
+EXPORT_STATE_FILENAME = "export_state.json"  # in EXPORTS_DIR; where incremental exports resume from
+
+# Provider rate limits, shared by every app process on this host
+QUOTA_ENABLED = True
+QUOTA_FILENAME = "quota.db"
+QUOTA_LIMITS = {          # requests and tokens per minute
+    "gemini": {"rpm": 15, "tpm": 1_000_000},
+    "groq": {"rpm": 30, "tpm": 30_000},
+}
+QUOTA_PRIORITY_INTERACTIVE = 10  # a reader waiting in the UI goes ahead of
+QUOTA_PRIORITY_BATCH = 0         # generate_many / bulk_generate.py work
+QUOTA_POLL_SECONDS = 0.5
+QUOTA_STALE_SECONDS = 30  # queued requests without a heartbeat this long are dropped
+QUOTA_MAX_WAIT_SECONDS = 300
+
+# Backend routing between Gemini and Groq
+ROUTER_BACKENDS = ["gemini", "groq"]  # primary first; backends without an API key are skipped
+ROUTER_MODE = "failover"  # "failover", "hedged" or "weighted"
+ROUTER_WEIGHTS = {"gemini": 3, "groq": 1}  # share of first attempts in "weighted" mode
+ROUTER_TIMEOUT_SECONDS = 60  # per attempt, before failing over
+ROUTER_HEDGE_PERCENTILE = 95
+ROUTER_HEDGE_DEFAULT_SECONDS = 8.0  # hedge delay until a backend has ROUTER_MIN_SAMPLES latencies
+ROUTER_MIN_SAMPLES = 20
+ROUTER_LATENCY_WINDOW = 200  # recent latencies kept per backend
+ROUTER_COOLDOWN_SECONDS = 30  # a failed backend is tried last for this long
+
+# Warm pool of pre-generated stories for popular parameter combinations (spends API quota in the background)
+WARM_POOL_ENABLED = False
+WARM_POOL_FILENAME = "warm_pool.db"
+WARM_POOL_SIZE = 3          # ready stories kept per hot combination
+WARM_POOL_HOT_KEYS = 5      # how many combinations are kept warm
+WARM_POOL_MIN_SCORE = 3.0   # decayed request count before a combination counts as hot
+WARM_POOL_HALF_LIFE_SECONDS = 6 * 3600
+WARM_POOL_HOURLY_BUDGET = 30  # background generations per rolling hour
+WARM_POOL_INTERVAL_SECONDS = 60
+WARM_POOL_MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# Per-stage latency and token metrics
+METRICS_ENABLED = True
+METRICS_LOG_FILENAME = "metrics.jsonl"   # one JSON line per generate/save/load call, in LOGS_DIR
+METRICS_LOG_MAX_BYTES = 10 * 1024 * 1024 # rotate the log to metrics.jsonl.1 once it reaches this size
+METRICS_LOG_BACKUPS = 3                  # rotated logs kept (metrics.jsonl.1 .. .3)
+METRICS_PROM_FILENAME = "metrics.prom"   # Prometheus text format, in LOGS_DIR
+METRICS_PROM_INTERVAL_SECONDS = 10       # how often the .prom file is rewritten
+METRICS_PORT = None                      # serve GET /metrics on this port when set
+METRICS_ADMIN_TAB = False                # show a Metrics tab in the app
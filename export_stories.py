@@ -0,0 +1,48 @@
+"""Export the story library to JSONL, a ZIP of text files, or an EPUB.
+
+Stories are streamed from the store, so the library never has to fit in
+memory. Use --incremental to include only stories created since the last
+export with the same format and filters.
+
+    python export_stories.py epub --genre Fantasy --incremental
+"""
+import argparse
+
+from config import EXPORTS_DIR, EXPORT_WORKERS, EXPORT_BATCH_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("format", choices=["jsonl", "zip", "epub"])
+    parser.add_argument("--genre")
+    parser.add_argument("--age-group")
+    parser.add_argument("--gender")
+    parser.add_argument("--created-from", help="ISO date, inclusive")
+    parser.add_argument("--created-to", help="ISO date, exclusive")
+    parser.add_argument("--incremental", action="store_true", help="only stories created since the last export")
+    parser.add_argument("--output-dir", default=EXPORTS_DIR)
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from src.export import export_stories
+
+    filters = {
+        "genre": args.genre,
+        "age_group": args.age_group,
+        "gender": args.gender,
+        "created_from": args.created_from,
+        "created_to": args.created_to,
+    }
+    path, count = export_stories(
+        args.format, filters, args.incremental, args.output_dir,
+        workers=args.workers, batch_size=args.batch_size
+    )
+    if path:
+        print(f"Exported {count} stories to {path}")
+    else:
+        print("No stories to export.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,13 @@ import streamlit as st
 from datetime import datetime
 
 # Import our custom modules
-from src.story_generator import StoryGenerator
-from src.database import save_story, load_stories
-from src.ui_components import render_story_form, display_story
+from src.router import build_router
+from src.database import save_story, count_stories, list_story_summaries, get_story, get_facet_counts, search_stories
+from src.ui_components import render_story_form, render_library_filters, display_story, display_story_page, inject_story_css
+from src.response_cache import get_response_cache
+from src.warm_pool import get_warm_pool, take_warm_story
+from src.metrics import get_metrics, start_metrics_server
+from config import LIBRARY_PAGE_SIZE, STREAM_STORIES, METRICS_PORT, METRICS_ADMIN_TAB
 
 # Page configuration
 st.set_page_config(
@@ -24,37 +28,88 @@ def main():
     if 'story_metadata' not in st.session_state:
         st.session_state.story_metadata = None
 
+    # Response cache counters (only when RESPONSE_CACHE_ENABLED)
+    cache = get_response_cache()
+    if cache:
+        stats = cache.stats()
+        st.sidebar.caption(
+            f"Response cache: {stats['hits']} hits / {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%}), {stats['entries']} stored"
+        )
+
+    start_metrics_endpoint()
+    inject_story_css()
+
     # Create tabs
-    tab1, tab2 = st.tabs(["Generate Story", "Story Library"])
+    tab_names = ["Generate Story", "Story Library"] + (["Metrics"] if METRICS_ADMIN_TAB else [])
+    tabs = st.tabs(tab_names)
 
-    with tab1:
+    with tabs[0]:
         generate_story_tab()
 
-    with tab2:
+    with tabs[1]:
         story_library_tab()
 
+    if METRICS_ADMIN_TAB:
+        with tabs[2]:
+            metrics_tab()
+
+
+@st.cache_resource
+def get_story_generator():
+    """One backend router per process, shared by every session"""
+    return build_router()
+
+
+@st.cache_resource
+def start_warm_pool():
+    """Start the background refill worker once per process (when WARM_POOL_ENABLED)"""
+    pool = get_warm_pool()
+    if pool:
+        pool.start_worker(get_story_generator())
+    return pool
+
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """Serve /metrics once per process (when METRICS_PORT is set)"""
+    if METRICS_PORT:
+        try:
+            return start_metrics_server(METRICS_PORT)
+        except OSError as e:
+            print(f"Error starting metrics endpoint: {str(e)}")
+    return None
+
 
 def generate_story_tab():
     st.header("Create Your Story")
 
     story_params = render_story_form()  
 
-    if story_params:
-        with st.spinner("Creating your magical story..."):
-            generator = StoryGenerator()
-            story_data = generator.generate_story(story_params)
+    start_warm_pool()
 
-            if story_data:
-                st.session_state.generated_story = story_data['story']
-                st.session_state.story_metadata = story_data['metadata']
-                st.success("Story generated successfully!")
+    if story_params:
+        # Popular combinations are often already written; fall back to live generation on a miss
+        story_data = take_warm_story(story_params)
+        if story_data is None:
+            generator = get_story_generator()
+            if STREAM_STORIES:
+                story_data = stream_story(generator, story_params)
             else:
-                st.error("Failed to generate story. Please try again.")
+                with st.spinner("Creating your magical story..."):
+                    story_data = generator.generate_story(story_params)
+
+        if story_data:
+            st.session_state.generated_story = story_data['story']
+            st.session_state.story_metadata = story_data['metadata']
+            st.success("Story generated successfully!")
+        else:
+            st.error("Failed to generate story. Please try again.")
 
     # Display generated story
     if st.session_state.generated_story:
         st.divider()
-        display_story(st.session_state.generated_story, st.session_state.story_metadata)
+        display_story(st.session_state.generated_story, st.session_state.story_metadata, key="generated")
 
         # Save or regenerate
         col1, col2 = st.columns([1, 1])
@@ -73,40 +128,155 @@ def generate_story_tab():
                 st.rerun()
 
 
+def stream_story(generator, story_params):
+    """Render each page as soon as it is generated and return the finished story data"""
+    preview = st.empty()
+    story_data = None
+
+    with preview.container():
+        with st.spinner("Creating your magical story..."):
+            for event, value in generator.generate_story_stream(story_params):
+                if event == "title":
+                    st.markdown(f"## 📖 {value}")
+                elif event == "page":
+                    display_story_page(value)
+                elif event == "done":
+                    story_data = value
+
+    # The finished story is rendered by the normal display below
+    preview.empty()
+    return story_data
+
+
 def story_library_tab():
     st.header("Story Library")
-    stories = load_stories()
-
-    if not stories:
+    if not count_stories():
         st.info("No stories saved yet. Generate your first story!")
         return
 
-    for story_id, story_data in stories.items():
+    filters, sort = render_library_filters(get_facet_counts())
+    export_library(filters)
+    query = st.text_input(
+        "🔍 Search stories",
+        placeholder='Words from the story, e.g. bunny or "red ball"',
+        key="library_search"
+    ).strip()
 
-        # Use button to toggle visibility
-        key = f"show_{story_id}"
+    # Only the current page is fetched, and only as a metadata projection;
+    # a search returns its total along with the page, so it runs once
+    page = st.session_state.get("library_page", 1) - 1
+    if query:
+        summaries, total = search_stories(query, page, LIBRARY_PAGE_SIZE, filters)
+    else:
+        summaries, total = None, count_stories(filters)
 
-        read_clicked = st.button(f"📖 Read: {story_data['metadata']['title']}", key=f"read_{story_id}")
-        hide_clicked = st.button("Hide Story", key=f"hide_{story_id}")
+    if not total:
+        st.info("No stories match your search." if query else "No stories match these filters.")
+        return
+
+    page_count = (total + LIBRARY_PAGE_SIZE - 1) // LIBRARY_PAGE_SIZE
+    if page >= page_count:
+        st.session_state.library_page = page_count
+        page, summaries = page_count - 1, None
+    st.number_input(
+        f"Page (of {page_count})",
+        min_value=1,
+        max_value=page_count,
+        key="library_page"
+    )
+
+    if summaries is None:
+        if query:
+            summaries, _ = search_stories(query, page, LIBRARY_PAGE_SIZE, filters)
+        else:
+            summaries = list_story_summaries(page, LIBRARY_PAGE_SIZE, filters, sort)
 
-        # Toggle visibility using a temporary variable
-        visible_key = f"show_story_{story_id}"
+    # IDs of stories the user has opened; full pages are loaded only for these
+    if 'open_stories' not in st.session_state:
+        st.session_state.open_stories = set()
+    open_stories = st.session_state.open_stories
 
-        # Initialize once
-        if visible_key not in st.session_state:
-            st.session_state[visible_key] = False
+    for summary in summaries:
+        story_id = summary['id']
+        is_open = story_id in open_stories
+
+        label = "Hide Story" if is_open else f"📖 Read: {summary['title']}"
+        if st.button(label, key=f"toggle_{story_id}"):
+            if is_open:
+                open_stories.discard(story_id)
+            else:
+                open_stories.add(story_id)
+            st.rerun()
 
-        # Toggle logic
-        if read_clicked:
-            st.session_state[visible_key] = True
-        if hide_clicked:
-            st.session_state[visible_key] = False
+        st.caption(f"{summary['genre']} | {summary['age_group']} | {(summary['created_at'] or '')[:10]}")
+        if summary.get('snippet'):
+            st.markdown(f"> {summary['snippet']}")
 
         # Render story
-        if st.session_state[visible_key]:
-            st.divider()
-            display_story(story_data['story'], story_data['metadata'])
+        if is_open:
+            story_data = get_story(story_id)
+            if story_data:
+                st.divider()
+                display_story(story_data['story'], story_data['metadata'], key=f"library_{story_id}")
+
+
+def export_library(filters):
+    """Export the stories matching the library filters to EXPORTS_DIR"""
+    with st.expander("Export", expanded=False):
+        col1, col2 = st.columns(2)
+        with col1:
+            fmt = st.selectbox(
+                "Format",
+                ["jsonl", "zip", "epub"],
+                format_func={"jsonl": "JSON Lines", "zip": "ZIP of text files", "epub": "EPUB picture book"}.get,
+                key="export_format"
+            )
+        with col2:
+            incremental = st.checkbox(
+                "Only stories created since the last export",
+                key="export_incremental",
+                help="Remembered per format and filter combination"
+            )
+
+        if st.button("Export stories matching the filters", key="export_button"):
+            try:
+                from src.export import export_stories  # pulls in the process pool; only needed here
+
+                with st.spinner("Exporting stories..."):
+                    path, count = export_stories(fmt, filters, incremental)
+            except Exception as e:
+                st.error(f"Error exporting stories: {str(e)}")
+                return
+            if path:
+                st.success(f"Exported {count:,} stories to {path}")
+            else:
+                st.info("No new stories to export.")
+
+
+def metrics_tab():
+    st.header("Metrics")
+    metrics = get_metrics()
+
+    def seconds_rows(name, label_fields):
+        return [
+            {**{field: labels[field] for field in label_fields}, "count": count,
+             "mean ms": round(mean * 1000, 1), "p50 ms": round(p50 * 1000, 1), "p95 ms": round(p95 * 1000, 1)}
+            for labels, count, mean, p50, p95 in metrics.summary(name)
+        ]
+
+    st.subheader("Operations")
+    st.dataframe(seconds_rows("tinytales_operation_seconds", ("operation", "provider", "outcome")), use_container_width=True)
+
+    st.subheader("Stages")
+    st.dataframe(seconds_rows("tinytales_stage_seconds", ("operation", "provider", "stage")), use_container_width=True)
+
+    st.subheader("Tokens")
+    st.dataframe([
+        {**labels, "tokens": value} for labels, value in metrics.counter_values("tinytales_tokens_total")
+    ], use_container_width=True)
 
+    st.caption("p50/p95 are estimated from histogram buckets, for this process since it started.")
+    st.download_button("Download Prometheus metrics", metrics.render_prometheus(), file_name="metrics.prom")
 
 
 if __name__ == "__main__":
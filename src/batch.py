@@ -0,0 +1,26 @@
+# src/batch.py
+import asyncio
+
+from config import BATCH_CONCURRENCY
+
+
+async def run_bounded(items, worker, concurrency=BATCH_CONCURRENCY):
+    """Run ``worker(item)`` for every item with at most ``concurrency`` in flight.
+
+    Returns one result dict per item, in input order:
+    {"story_data": ..., "error": None} on success, or
+    {"story_data": None, "error": "..."} when that item failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item):
+        async with semaphore:
+            try:
+                story_data = await worker(item)
+            except Exception as e:
+                return {"story_data": None, "error": f"{type(e).__name__}: {e}"}
+            if story_data is None:
+                return {"story_data": None, "error": "No story returned"}
+            return {"story_data": story_data, "error": None}
+
+    return await asyncio.gather(*(run(item) for item in items))
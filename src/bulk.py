@@ -0,0 +1,149 @@
+# src/bulk.py
+import asyncio
+import csv
+import json
+import os
+import time
+from pathlib import Path
+
+from .database import save_stories, get_story
+from config import BATCH_CONCURRENCY, BULK_BATCH_SIZE
+
+BOOLEAN_FIELDS = ("include_moral", "include_dialogue", "rhyming")
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _normalize_params(row):
+    """Coerce a JSONL/CSV row into the dict render_story_form returns"""
+    params = dict(row)
+    for field in BOOLEAN_FIELDS:
+        if field in params:
+            params[field] = _to_bool(params[field])
+    if 'story_length' in params:
+        params['story_length'] = str(params['story_length']).split()[0]
+    description = params.get('description')
+    params['description'] = description if description and str(description).strip() else None
+    return params
+
+
+def read_param_rows(path):
+    """Read story parameter rows from a .jsonl or .csv file"""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.suffix.lower() == '.csv':
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [_normalize_params(row) for row in rows]
+
+
+class BulkCheckpoint:
+    """Progress of a bulk run, rewritten atomically after every batch.
+
+    ``saved`` maps row index -> story ID for rows already in the store.
+    ``pending`` holds rows whose stories were about to be saved when the
+    checkpoint was last written; on resume they are looked up in the store,
+    so a crash between saving and checkpointing neither loses nor
+    duplicates them. ``errors`` keeps the last error per row; failed rows
+    are retried on the next run.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.saved = {}
+        self.pending = {}
+        self.errors = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.saved = {int(k): v for k, v in data.get("saved", {}).items()}
+            self.pending = {int(k): v for k, v in data.get("pending", {}).items()}
+            self.errors = {int(k): v for k, v in data.get("errors", {}).items()}
+
+    def reconcile(self):
+        """Resolve rows left pending by an interrupted run against the store"""
+        for index, story_id in self.pending.items():
+            if get_story(story_id) is not None:
+                self.saved[index] = story_id
+        self.pending = {}
+        self.write()
+
+    def write(self):
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"saved": self.saved, "pending": self.pending, "errors": self.errors}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def _format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+async def _run(generator, rows, checkpoint, concurrency, batch_size, report):
+    todo = [index for index in range(len(rows)) if index not in checkpoint.saved]
+    total = len(todo)
+    done = failed = 0
+    start = time.perf_counter()
+
+    for offset in range(0, total, batch_size):
+        batch = todo[offset:offset + batch_size]
+        results = await generator.generate_many([rows[index] for index in batch], concurrency=concurrency)
+
+        stories = []
+        for index, result in zip(batch, results):
+            if result["error"]:
+                checkpoint.errors[index] = result["error"]
+                failed += 1
+                continue
+            story_data = result["story_data"]
+            checkpoint.pending[index] = story_data['metadata']['id']
+            stories.append((story_data['story'], story_data['metadata']))
+
+        # Record what is about to be saved before saving it, then commit it as done
+        checkpoint.write()
+        saved_ids = set(save_stories(stories))
+        for index, story_id in checkpoint.pending.items():
+            if story_id in saved_ids:
+                checkpoint.saved[index] = story_id
+                checkpoint.errors.pop(index, None)
+                done += 1
+            else:
+                checkpoint.errors[index] = "Saving the story failed"
+                failed += 1
+        checkpoint.pending = {}
+        checkpoint.write()
+
+        elapsed = time.perf_counter() - start
+        processed = done + failed
+        rate = processed / elapsed if elapsed else 0.0
+        eta = (total - processed) / rate if rate else 0.0
+        report(
+            f"{processed}/{total} rows  {rate:.2f} stories/s  "
+            f"errors {failed / processed:.1%}  ETA {_format_eta(eta)}"
+        )
+
+    return done, failed
+
+
+def run_bulk(generator, input_path, checkpoint_path=None, concurrency=BATCH_CONCURRENCY,
+             batch_size=BULK_BATCH_SIZE, report=print):
+    """Generate and save a story for every parameter row in ``input_path``.
+
+    Resumes from ``checkpoint_path`` (default: next to the input file) and
+    returns (saved, failed) counts for this run.
+    """
+    rows = read_param_rows(input_path)
+    checkpoint = BulkCheckpoint(checkpoint_path or f"{input_path}.checkpoint.json")
+    checkpoint.reconcile()
+    if checkpoint.saved:
+        report(f"Resuming: {len(checkpoint.saved)} of {len(rows)} rows already saved")
+    return asyncio.run(_run(generator, rows, checkpoint, concurrency, batch_size, report))
@@ -0,0 +1,179 @@
+# src/clients.py
+import asyncio
+import inspect
+import os
+import threading
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_TIMEOUT_SECONDS
+
+
+@lru_cache(maxsize=None)
+def _load_env():
+    load_dotenv()
+
+
+def get_api_key(name):
+    """Read an API key, loading .env once per process"""
+    _load_env()
+    return os.getenv(name)
+
+
+def get_base_url(provider):
+    """Optional API endpoint override from <PROVIDER>_BASE_URL, e.g. a local mock server"""
+    _load_env()
+    return os.getenv(f"{provider.upper()}_BASE_URL") or None
+
+
+class ClientPool:
+    """Build a client once per process and share it across sessions and threads.
+
+    The client is only rebuilt after a caller reports it broken with
+    ``mark_failed``, so healthy clients keep their pooled keep-alive
+    connections instead of paying connection setup and TLS on every story.
+    The dropped client is closed so its sockets are released.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    def mark_failed(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            _close_client(client)
+
+
+_closing = set()  # close() tasks scheduled on a running loop, kept referenced until done
+
+
+async def _await_close(result):
+    try:
+        await result
+    except Exception as e:
+        print(f"Error closing client: {str(e)}")
+
+
+def _close_client(client):
+    """Close a client's connection pool: ``aclose``/``close``, awaited if it is a coroutine"""
+    close = getattr(client, "aclose", None) or getattr(client, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            try:
+                task = asyncio.get_running_loop().create_task(_await_close(result))
+            except RuntimeError:
+                asyncio.run(_await_close(result))
+            else:
+                _closing.add(task)
+                task.add_done_callback(_closing.discard)
+    except Exception as e:
+        print(f"Error closing client: {str(e)}")
+
+
+def close_async_client(client, loop):
+    """Close an async client built on ``loop``: there if that loop is still running, otherwise here"""
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if loop is not None and loop is not current and loop.is_running():
+        close = getattr(client, "aclose", None) or client.close
+        asyncio.run_coroutine_threadsafe(_await_close(close()), loop)
+    else:
+        _close_client(client)
+
+
+def build_groq_client(api_key, base_url=None):
+    """Groq client over a keep-alive httpx connection pool"""
+    import httpx
+    from groq import Groq
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=HTTP_TIMEOUT_SECONDS,
+    )
+    return Groq(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+def build_async_groq_client(api_key, base_url=None):
+    """AsyncGroq client with its own keep-alive pool; use it as an async context manager"""
+    import httpx
+    from groq import AsyncGroq
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=HTTP_TIMEOUT_SECONDS,
+    )
+    return AsyncGroq(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+def build_gemini_model(api_key, model_name, base_url=None):
+    import google.generativeai as genai
+
+    if base_url:
+        # The REST transport can be pointed at any HTTP endpoint; gRPC cannot
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": base_url})
+    else:
+        genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+
+_groq_pool = ClientPool(lambda: build_groq_client(get_api_key("GROQ_API_KEY"), get_base_url("groq")))
+_gemini_pools = {}
+_gemini_pools_lock = threading.Lock()
+
+
+def get_groq_client():
+    return _groq_pool.get()
+
+
+def get_gemini_model(model_name):
+    with _gemini_pools_lock:
+        pool = _gemini_pools.get(model_name)
+        if pool is None:
+            pool = _gemini_pools[model_name] = ClientPool(
+                lambda: build_gemini_model(get_api_key("GOOGLE_API_KEY"), model_name, get_base_url("gemini"))
+            )
+    return pool.get()
+
+
+def _is_transport_error(error):
+    """True for failures that suggest the client's connections are broken"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # Provider SDK exception types, matched by name so neither SDK has to be imported
+    return type(error).__name__ in {
+        "APIConnectionError", "APITimeoutError",  # groq / httpx
+        "ServiceUnavailable", "DeadlineExceeded", "RetryError",  # google.api_core
+        "ConnectError", "ReadError", "RemoteProtocolError",  # httpx
+    }
+
+
+def report_client_failure(provider, error):
+    """Rebuild a provider's client on next use if ``error`` was a transport failure; returns whether it was"""
+    if not _is_transport_error(error):
+        return False
+    if provider == "groq":
+        _groq_pool.mark_failed()
+    elif provider == "gemini":
+        with _gemini_pools_lock:
+            pools = list(_gemini_pools.values())
+        for pool in pools:
+            pool.mark_failed()
+    return True
@@ -0,0 +1,83 @@
+# src/compression.py
+import json
+import re
+import struct
+import zlib
+from collections import Counter
+
+from config import STORY_DICT_SIZE, STORY_COMPRESSION_LEVEL
+
+HEADER = struct.Struct("<H")  # ID of the dictionary the body was compressed with (0 = none)
+MAX_PHRASE_WORDS = 6
+MAX_CANDIDATES = 50000
+
+
+def train_dictionary(samples, size=STORY_DICT_SIZE):
+    """Build a zlib preset dictionary from sample story bodies (bytes).
+
+    Phrases of one to six words are scored by the number of samples that
+    contain them times their length; the best are packed in with the most
+    valuable last, where deflate can reference them most cheaply.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = re.findall(rb"\S+\s*", sample)
+        counts.update({
+            b"".join(words[i:i + n])
+            for n in range(1, MAX_PHRASE_WORDS + 1)
+            for i in range(len(words) - n + 1)
+        })
+
+    candidates = sorted(
+        (phrase for phrase, count in counts.items() if count > 1 and len(phrase) > 3),
+        key=lambda phrase: counts[phrase] * len(phrase),
+        reverse=True
+    )
+    chosen, packed = [], bytearray()
+    for phrase in candidates[:MAX_CANDIDATES]:
+        if len(packed) + len(phrase) > size or phrase in packed:
+            continue
+        chosen.append(phrase)
+        packed += phrase
+    return b"".join(reversed(chosen))
+
+
+class StoryCodec:
+    """Compresses story page lists to raw deflate with a preset dictionary.
+
+    ``dictionaries`` maps dictionary ID to bytes; new bodies use
+    ``current_id`` (0 for plain deflate). The ID is stored in a two-byte
+    header so bodies written with an older dictionary still decode.
+    """
+
+    def __init__(self, dictionaries=None, current_id=0, level=STORY_COMPRESSION_LEVEL):
+        self.dictionaries = dict(dictionaries or {})
+        self.current_id = current_id
+        self.level = level
+
+    def compress(self, story_pages):
+        data = json.dumps(story_pages, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        zdict = self.dictionaries.get(self.current_id)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=zdict) if zdict else \
+            zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return HEADER.pack(self.current_id) + compressor.compress(data) + compressor.flush()
+
+    def dictionary_id(self, value):
+        """Dictionary ID of a stored body (None for uncompressed JSON text)"""
+        if isinstance(value, str):
+            return None
+        return HEADER.unpack_from(value)[0]
+
+    def decompress(self, value):
+        """Stored body (compressed bytes, or JSON text from before compression) -> page list"""
+        if isinstance(value, str):
+            return json.loads(value)
+        dictionary_id = HEADER.unpack_from(value)[0]
+        if dictionary_id:
+            if dictionary_id not in self.dictionaries:
+                raise KeyError(dictionary_id)
+            decompressor = zlib.decompressobj(-15, zdict=self.dictionaries[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj(-15)
+        data = decompressor.decompress(value[HEADER.size:]) + decompressor.flush()
+        return json.loads(data)
@@ -1,122 +1,220 @@
 # src/database.py
-import json
-from pathlib import Path
+import threading
+from collections import OrderedDict
 
-# Create data directory if it doesn't exist
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-STORIES_FILE = DATA_DIR / "stories.json"
+from config import DATA_DIR, STORAGE_BACKEND, STORIES_FILENAME, STORIES_DB_FILENAME, BACKUP_DIRNAME, LIBRARY_QUERY_CACHE_ENTRIES
+from .storage import JSONStoryStore, SQLiteStoryStore, migrate_json_to_sqlite, json_store_exists
+from .dedup import remember_story, forget_story, story_to_text
+from .metrics import instrument, stage, mark_outcome
 
+STORIES_FILE = DATA_DIR / STORIES_FILENAME
+STORIES_DB = DATA_DIR / STORIES_DB_FILENAME
+BACKUP_DIR = DATA_DIR / BACKUP_DIRNAME
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class QueryCache:
+    """Library query results shared by every session, kept until the store's version moves.
+
+    The library tab runs the same counts, facet counts and page listings on
+    every rerun; between writes they are answered from memory. Any save or
+    delete, by this process or another, moves the version and empties the
+    cache. Results are shared, so treat them as read-only.
+    """
+
+    def __init__(self, max_entries=LIBRARY_QUERY_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self.results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, store, key, query):
+        """``query()``'s result for ``key``, run again only if the store has changed since"""
+        version = store.version()
+        with self._lock:
+            if self.version != version:
+                self.version = version
+                self.results.clear()
+            elif key in self.results:
+                self.results.move_to_end(key)
+                return self.results[key]
+        result = query()
+        with self._lock:
+            # Read before the query, so a write that lands during it only costs a re-run
+            if self.version == version:
+                self.results[key] = result
+                if len(self.results) > self.max_entries:
+                    self.results.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self.version = None
+            self.results.clear()
+
+
+query_cache = QueryCache()
+
+
+def _filters_key(filters):
+    return tuple(sorted(filters.items())) if filters else None
+
+
+def get_store():
+    """Return the process-wide story store for the configured backend"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _create_store(STORAGE_BACKEND)
+    return _store
+
+
+def _create_store(backend):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if backend == "json":
+        return JSONStoryStore(STORIES_FILE)
+    if backend == "sqlite":
+        is_new = not STORIES_DB.exists()
+        store = SQLiteStoryStore(STORIES_DB)
+        # First start on SQLite: bring the existing JSON library across once
+        if is_new and json_store_exists(STORIES_FILE):
+            migrated = migrate_json_to_sqlite(STORIES_FILE, STORIES_DB)
+            print(f"Migrated {migrated} stories from {STORIES_FILE} to {STORIES_DB}")
+        return store
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+@instrument("save_story")
 def save_story(story_pages, metadata):
-    """Save a story to the JSON database"""
+    """Save a story to the story database"""
     try:
-        # Load existing stories
-        stories = load_stories()
-        
-        # Create story data
-        story_data = {
-            "story": story_pages,
-            "metadata": metadata
-        }
-        
-        # Add to stories dictionary
         story_id = metadata['id']
-        stories[story_id] = story_data
-        
-        # Save to file
-        with open(STORIES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(stories, f, indent=2, ensure_ascii=False)
-        
+        with stage("store"):
+            get_store().put(story_id, story_pages, metadata)
+        with stage("dedup"):
+            remember_story(story_id, story_to_text(story_pages, metadata.get('title', '')), saved=True)
         return story_id
         
     except Exception as e:
+        mark_outcome("error")
         print(f"Error saving story: {str(e)}")
         return None
 
+def save_stories(stories):
+    """Save a batch of (story_pages, metadata) pairs in one write; return the saved IDs"""
+    try:
+        get_store().put_many([(metadata['id'], story_pages, metadata) for story_pages, metadata in stories])
+        for story_pages, metadata in stories:
+            remember_story(metadata['id'], story_to_text(story_pages, metadata.get('title', '')), saved=True)
+        return [metadata['id'] for _, metadata in stories]
+
+    except Exception as e:
+        print(f"Error saving stories: {str(e)}")
+        return []
+
+@instrument("load_stories")
 def load_stories():
-    """Load all stories from the JSON database"""
+    """Load all stories from the story database"""
     try:
-        if STORIES_FILE.exists():
-            with open(STORIES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        else:
-            return {}
+        return get_store().all()
     except Exception as e:
+        mark_outcome("error")
         print(f"Error loading stories: {str(e)}")
         return {}
 
-# def get_story(story_id):
-#     """Get a specific story by ID"""
-#     stories = load_stories()
-#     return stories.get(story_id, None)
-
-# def delete_story(story_id):
-#     """Delete a story by ID"""
-#     try:
-#         stories = load_stories()
-#         if story_id in stories:
-#             del stories[story_id]
-#             with open(STORIES_FILE, 'w', encoding='utf-8') as f:
-#                 json.dump(stories, f, indent=2, ensure_ascii=False)
-#             return True
-#         return False
-#     except Exception as e:
-#         print(f"Error deleting story: {str(e)}")
-#         return False
-
-# def get_stories_by_filter(genre=None, age_group=None, gender=None):
-#     """Get stories filtered by criteria"""
-#     all_stories = load_stories()
-#     filtered_stories = {}
-    
-#     for story_id, story_data in all_stories.items():
-#         metadata = story_data['metadata']
-        
-#         # Apply filters
-#         if genre and metadata.get('genre') != genre:
-#             continue
-#         if age_group and metadata.get('age_group') != age_group:
-#             continue
-#         if gender and metadata.get('gender') != gender:
-#             continue
-            
-#         filtered_stories[story_id] = story_data
-    
-#     return filtered_stories
-
-# def export_story_to_text(story_id, output_dir="exports"):
-#     """Export a story to a text file"""
-#     try:
-#         story_data = get_story(story_id)
-#         if not story_data:
-#             return False
-        
-#         # Create export directory
-#         export_path = Path(output_dir)
-#         export_path.mkdir(exist_ok=True)
-        
-#         # Create filename
-#         title = story_data['metadata']['title'].replace(' ', '_').replace('/', '_')
-#         filename = f"{title}_{story_id[:8]}.txt"
-#         filepath = export_path / filename
-        
-#         # Write story to file
-#         with open(filepath, 'w', encoding='utf-8') as f:
-#             metadata = story_data['metadata']
-#             f.write(f"Title: {metadata['title']}\n")
-#             f.write(f"Genre: {metadata['genre']}\n")
-#             f.write(f"Age Group: {metadata['age_group']}\n")
-#             f.write(f"Created: {metadata['created_at']}\n")
-#             if metadata.get('description'):
-#                 f.write(f"Description: {metadata['description']}\n")
-#             f.write("\n" + "="*50 + "\n\n")
-            
-#             for page in story_data['story']:
-#                 f.write(f"Page {page['page_number']}:\n")
-#                 f.write(f"{page['content']}\n\n")
-        
-#         return str(filepath)
-        
-#     except Exception as e:
-#         print(f"Error exporting story: {str(e)}")
-#         return False
\ No newline at end of file
+def backup_stories(backup_dir=BACKUP_DIR):
+    """Back up the library into ``backup_dir``; returns the bytes copied, or None on failure.
+
+    On the JSON backend only what changed since the previous backup into
+    the same directory is copied.
+    """
+    try:
+        return get_store().backup(backup_dir)
+    except Exception as e:
+        print(f"Error backing up stories: {str(e)}")
+        return None
+
+def count_stories(filters=None):
+    """Return the number of stories in the library matching the optional filters"""
+    try:
+        store = get_store()
+        return query_cache.get(store, ("count", _filters_key(filters)), lambda: store.count(filters))
+    except Exception as e:
+        print(f"Error counting stories: {str(e)}")
+        return 0
+
+def list_story_summaries(page=0, page_size=10, filters=None, sort="newest"):
+    """Return title/genre/age group/created_at for one page of stories.
+
+    ``filters`` may contain ``genre``, ``age_group``, ``gender`` and an ISO
+    ``created_from`` (inclusive) / ``created_to`` (exclusive) date range.
+    None means no filter; a facet set to '' matches stories without it.
+    ``sort`` is one of "newest", "oldest" or "title".
+    """
+    try:
+        store = get_store()
+        return query_cache.get(
+            store, ("summaries", page, page_size, _filters_key(filters), sort),
+            lambda: store.list_summaries(page * page_size, page_size, filters, sort)
+        )
+    except Exception as e:
+        print(f"Error listing stories: {str(e)}")
+        return []
+
+def search_stories(query, page=0, page_size=10, filters=None):
+    """Ranked keyword/phrase search over titles, descriptions and page text.
+
+    Returns (summaries, total_matches). Quote words to match them as a
+    phrase, e.g. 'bunny "red ball"'.
+    """
+    try:
+        store = get_store()
+        return query_cache.get(
+            store, ("search", query, page, page_size, _filters_key(filters)),
+            lambda: store.search(query, page * page_size, page_size, filters)
+        )
+    except Exception as e:
+        print(f"Error searching stories: {str(e)}")
+        return [], 0
+
+def get_facet_counts():
+    """Return story counts per genre, age group and gender, e.g. {"genre": {"Fantasy": 1204}}"""
+    try:
+        store = get_store()
+        return query_cache.get(store, ("facets",), store.facet_counts)
+    except Exception as e:
+        print(f"Error counting facets: {str(e)}")
+        return {}
+
+def get_story(story_id):
+    """Get a specific story by ID"""
+    try:
+        return get_store().get(story_id)
+    except Exception as e:
+        print(f"Error loading story: {str(e)}")
+        return None
+
+def delete_story(story_id):
+    """Delete a story by ID"""
+    try:
+        deleted = get_store().delete(story_id)
+        if deleted:
+            forget_story(story_id)
+        return deleted
+    except Exception as e:
+        print(f"Error deleting story: {str(e)}")
+        return False
+
+def get_stories_by_filter(genre=None, age_group=None, gender=None):
+    """Get stories filtered by criteria"""
+    filters = {"genre": genre, "age_group": age_group, "gender": gender}
+    try:
+        store = get_store()
+        summaries = store.list_summaries(0, store.count(filters), filters)
+        return {summary['id']: store.get(summary['id']) for summary in summaries}
+    except Exception as e:
+        print(f"Error filtering stories: {str(e)}")
+        return {}
@@ -0,0 +1,241 @@
+# src/dedup.py
+import hashlib
+import random
+import sqlite3
+import struct
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    DATA_DIR,
+    DEDUP_FILENAME,
+    DEDUP_NUM_PERM,
+    DEDUP_BANDS,
+    DEDUP_RECENT_LIMIT,
+    DEDUP_SIMILARITY_THRESHOLD,
+)
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _word_hash(word):
+    return struct.unpack("<I", hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest())[0]
+
+
+def story_to_text(story_pages, title=""):
+    """Rebuild the 'Title:/Page N:' text a generator returned for a saved story"""
+    parts = [f"Title: {title}"] if title else []
+    for page in story_pages:
+        parts.append(f"Page {page['page_number']}:\n{page['content']}")
+    return "\n\n".join(parts)
+
+
+class NearDuplicateIndex:
+    """Disk-persisted MinHash + LSH index for spotting near-duplicate stories.
+
+    A story is reduced to the set of its lowercased words (the same sets the
+    old exact Jaccard check compared), summarised by ``num_perm`` MinHash
+    values and split into ``bands`` bands. Only stories sharing at least one
+    band bucket are compared, so a lookup costs a handful of indexed reads
+    instead of a pass over every previous story.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS signatures (
+        story_key TEXT PRIMARY KEY,
+        signature BLOB NOT NULL,
+        saved INTEGER NOT NULL,
+        added_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_signatures_recent ON signatures (saved, added_at);
+
+    CREATE TABLE IF NOT EXISTS bands (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        story_key TEXT NOT NULL,
+        PRIMARY KEY (band, bucket, story_key)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_bands_story ON bands (story_key);
+    """
+
+    def __init__(self, path, num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, recent_limit=DEDUP_RECENT_LIMIT):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.recent_limit = recent_limit
+
+        # Fixed seed: signatures on disk must stay comparable across restarts
+        rng = random.Random(1)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+            # user_version records the band layout the buckets were written with
+            if conn.execute("PRAGMA user_version").fetchone()[0] != self.bands:
+                self._rebuild_bands(conn)
+
+    def _rebuild_bands(self, conn):
+        """Re-bucket every stored signature after the band layout changed"""
+        rows = conn.execute("SELECT story_key, signature FROM signatures").fetchall()
+        conn.execute("DELETE FROM bands")
+        conn.executemany(
+            "INSERT OR IGNORE INTO bands (band, bucket, story_key) VALUES (?, ?, ?)",
+            [
+                (band, bucket, story_key)
+                for story_key, signature in rows
+                for band, bucket in self._buckets(struct.unpack(f"<{self.num_perm}I", signature))
+            ]
+        )
+        conn.execute(f"PRAGMA user_version = {int(self.bands)}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def signature(self, text):
+        hashes = {_word_hash(word) for word in text.lower().split()}
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ]
+
+    def _buckets(self, signature):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(struct.pack(f"<{self.rows}I", *chunk), digest_size=8).digest()
+            yield band, struct.unpack("<q", digest)[0]
+
+    def add(self, story_key, text, saved=False):
+        """Index a story; re-adding the same key replaces its signature"""
+        signature = self.signature(text)
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM bands WHERE story_key = ?", (story_key,))
+            conn.execute(
+                """
+                INSERT INTO signatures (story_key, signature, saved, added_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(story_key) DO UPDATE SET
+                    signature=excluded.signature, saved=MAX(saved, excluded.saved), added_at=excluded.added_at
+                """,
+                (story_key, struct.pack(f"<{self.num_perm}I", *signature), int(saved), time.time())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO bands (band, bucket, story_key) VALUES (?, ?, ?)",
+                [(band, bucket, story_key) for band, bucket in self._buckets(signature)]
+            )
+            if not saved:
+                self._prune_recent(conn)
+
+    def _prune_recent(self, conn):
+        # Unsaved generations are only kept as a bounded recent window
+        stale = conn.execute(
+            "SELECT story_key FROM signatures WHERE saved = 0 ORDER BY added_at DESC LIMIT -1 OFFSET ?",
+            (self.recent_limit,)
+        ).fetchall()
+        for (story_key,) in stale:
+            conn.execute("DELETE FROM bands WHERE story_key = ?", (story_key,))
+            conn.execute("DELETE FROM signatures WHERE story_key = ?", (story_key,))
+
+    def remove(self, story_key):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM bands WHERE story_key = ?", (story_key,))
+            conn.execute("DELETE FROM signatures WHERE story_key = ?", (story_key,))
+
+    def query(self, text, threshold=DEDUP_SIMILARITY_THRESHOLD):
+        """Return (story_key, estimated_similarity) of the closest match at or above threshold, or None"""
+        signature = self.signature(text)
+        conn = self._conn()
+
+        candidates = set()
+        for band, bucket in self._buckets(signature):
+            rows = conn.execute(
+                "SELECT story_key FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+            )
+            candidates.update(story_key for (story_key,) in rows)
+
+        best = None
+        for story_key in candidates:
+            row = conn.execute("SELECT signature FROM signatures WHERE story_key = ?", (story_key,)).fetchone()
+            if row is None:
+                continue
+            other = struct.unpack(f"<{self.num_perm}I", row[0])
+            similarity = sum(x == y for x, y in zip(signature, other)) / self.num_perm
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (story_key, similarity)
+        return best
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM signatures LIMIT 1").fetchone() is None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_dedup_index():
+    """Return the process-wide near-duplicate index, seeding it from the library on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = NearDuplicateIndex(DATA_DIR / DEDUP_FILENAME)
+                if index.is_empty():
+                    _backfill_from_library(index)
+                _index = index
+    return _index
+
+
+def _backfill_from_library(index):
+    from .database import load_stories
+
+    for story_id, story_data in load_stories().items():
+        metadata = story_data['metadata']
+        index.add(story_id, story_to_text(story_data['story'], metadata.get('title', '')), saved=True)
+
+
+def is_duplicate(story_text, threshold=DEDUP_SIMILARITY_THRESHOLD):
+    """Check a story against the saved library and recent generations.
+
+    Returns (True, similarity) for a near-duplicate, otherwise (False, None).
+    """
+    try:
+        match = get_dedup_index().query(story_text, threshold)
+    except Exception as e:
+        print(f"Error checking for duplicates: {str(e)}")
+        return False, None
+    if match:
+        return True, match[1]
+    return False, None
+
+
+def remember_story(story_key, story_text, saved=False):
+    """Add a generated or saved story to the near-duplicate index"""
+    try:
+        get_dedup_index().add(story_key, story_text, saved=saved)
+    except Exception as e:
+        print(f"Error indexing story for duplicate checks: {str(e)}")
+
+
+def forget_story(story_key):
+    """Drop a deleted story from the near-duplicate index"""
+    try:
+        get_dedup_index().remove(story_key)
+    except Exception as e:
+        print(f"Error removing story from duplicate index: {str(e)}")
@@ -0,0 +1,309 @@
+# src/export.py
+import html
+import json
+import multiprocessing
+import os
+import re
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+
+from .database import get_store, get_story
+from config import EXPORTS_DIR, EXPORT_WORKERS, EXPORT_BATCH_SIZE, EXPORT_STATE_FILENAME
+
+EXPORT_FORMATS = ("jsonl", "zip", "epub")
+
+EPUB_CSS = """body{font-family:Georgia,serif;margin:0 5%}
+h1{text-align:center;margin:2em 0 1em}
+.page{page-break-before:always;break-before:page;font-size:1.3em;line-height:1.6;margin-top:3em}
+.page h2{font-size:0.8em;color:#6c757d}
+"""
+
+
+def format_story_text(story_data):
+    """A story in the plain-text export format"""
+    metadata = story_data['metadata']
+    lines = [
+        f"Title: {metadata['title']}",
+        f"Genre: {metadata['genre']}",
+        f"Age Group: {metadata['age_group']}",
+        f"Created: {metadata['created_at']}",
+    ]
+    if metadata.get('description'):
+        lines.append(f"Description: {metadata['description']}")
+    lines.append("\n" + "=" * 50 + "\n")
+    for page in story_data['story']:
+        lines.append(f"Page {page['page_number']}:")
+        lines.append(f"{page['content']}\n")
+    return "\n".join(lines) + "\n"
+
+
+def story_filename(story_id, metadata, extension):
+    title = re.sub(r"[^\w\-]+", "_", metadata.get('title') or "Untitled").strip("_")[:60]
+    return f"{title}_{story_id}.{extension}"
+
+
+def _format_jsonl(item):
+    story_id, story_data = item
+    return json.dumps({"id": story_id, **story_data}, ensure_ascii=False) + "\n"
+
+
+def _format_txt(item):
+    story_id, story_data = item
+    return story_filename(story_id, story_data['metadata'], "txt"), format_story_text(story_data)
+
+
+def _format_xhtml(item):
+    """One story as an EPUB content document: title, then each page on its own screen"""
+    story_id, story_data = item
+    metadata = story_data['metadata']
+    title = html.escape(metadata.get('title') or "Untitled Story")
+    pages = "".join(
+        f'<section class="page"><h2>Page {page["page_number"]}</h2>'
+        f'<p>{html.escape(page["content"]).replace(chr(10), "<br/>")}</p></section>'
+        for page in story_data['story']
+    )
+    document = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+        f'<head><title>{title}</title><link rel="stylesheet" href="style.css"/></head>'
+        f'<body><h1>{title}</h1>{pages}</body></html>'
+    )
+    return f"{_xhtml_id(story_id)}.xhtml", metadata.get('title') or "Untitled Story", document
+
+
+def _xhtml_id(story_id):
+    # XML ids must not start with a digit
+    return "s_" + re.sub(r"[^\w\-]", "_", story_id)
+
+
+def _batches(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _JSONLWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, formatted):
+        self.file.write(formatted)
+
+    def close(self):
+        self.file.close()
+
+
+class _ZipWriter:
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+
+    def write(self, formatted):
+        filename, text = formatted
+        self.zip.writestr(filename, text)
+
+    def close(self):
+        self.zip.close()
+
+
+class _EPUBWriter:
+    """EPUB 3 anthology; story documents are streamed in, the package files are written last"""
+
+    def __init__(self, path, title):
+        self.title = title
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self.chapters = []
+        # The mimetype entry must come first and be stored uncompressed
+        self.zip.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self.zip.writestr("META-INF/container.xml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ))
+        self.zip.writestr("OEBPS/style.css", EPUB_CSS)
+
+    def write(self, formatted):
+        filename, title, document = formatted
+        self.zip.writestr(f"OEBPS/{filename}", document)
+        self.chapters.append((filename, title))
+
+    def close(self):
+        title = html.escape(self.title)
+        items = "".join(
+            f'<item id="{filename[:-6]}" href="{filename}" media-type="application/xhtml+xml"/>'
+            for filename, _ in self.chapters
+        )
+        spine = "".join(f'<itemref idref="{filename[:-6]}"/>' for filename, _ in self.chapters)
+        modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.zip.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="book-id">urn:uuid:{uuid.uuid4()}</dc:identifier>'
+            f'<dc:title>{title}</dc:title><dc:language>en</dc:language>'
+            f'<meta property="dcterms:modified">{modified}</meta></metadata>'
+            '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+            f'<item id="css" href="style.css" media-type="text/css"/>{items}</manifest>'
+            f'<spine>{spine}</spine></package>'
+        ))
+        toc = "".join(
+            f'<li><a href="{filename}">{html.escape(chapter_title)}</a></li>' for filename, chapter_title in self.chapters
+        )
+        self.zip.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            f'<head><title>{title}</title></head><body>'
+            f'<nav epub:type="toc"><h1>{title}</h1><ol>{toc}</ol></nav></body></html>'
+        ))
+        self.zip.close()
+
+
+FORMATTERS = {"jsonl": _format_jsonl, "zip": _format_txt, "epub": _format_xhtml}
+
+
+def _open_writer(fmt, path, title):
+    if fmt == "jsonl":
+        return _JSONLWriter(path)
+    if fmt == "zip":
+        return _ZipWriter(path)
+    return _EPUBWriter(path, title)
+
+
+def _state_key(fmt, filters):
+    return json.dumps({"format": fmt, "filters": {k: v for k, v in (filters or {}).items() if v is not None}}, sort_keys=True)
+
+
+def _load_state(path):
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(path, state):
+    temp_path = path.with_name(f"{path.name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def export_stories(fmt, filters=None, incremental=False, output_dir=EXPORTS_DIR,
+                   workers=EXPORT_WORKERS, batch_size=EXPORT_BATCH_SIZE):
+    """Stream matching stories from the store into one export file in ``output_dir``.
+
+    ``fmt`` is "jsonl" (one story per line), "zip" (a .txt file per story)
+    or "epub" (one picture-book EPUB with a chapter per story). Stories are
+    read and formatted ``batch_size`` at a time, formatting on a pool of
+    ``workers`` processes. With ``incremental``, only stories inserted
+    into the store after the previous export of the same format and
+    filters are included; the store's insert sequence decides, so clock
+    skew or back-dated created_at values can't hide a story.
+
+    Returns (path, count); path is None when there was nothing to export.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state_path = output_dir / EXPORT_STATE_FILENAME
+    state = _load_state(state_path)
+    key = _state_key(fmt, filters)
+
+    query = dict(filters or {})
+    previous = state.get(key) if incremental else None
+    after_sequence = previous.get('last_sequence') if previous else None
+    seen_at_mark = set()
+    if previous and after_sequence is None:
+        # State written before insert sequences: go by created_at this once.
+        # created_from is inclusive, so stories sharing the last timestamp are skipped by ID
+        query['created_from'] = max(query.get('created_from') or "", previous['last_created_at'])
+        seen_at_mark = set(previous['ids_at_last_created_at'])
+    mark = {"sequence": after_sequence or 0, "count": 0}
+
+    def stories():
+        for sequence, story_id, story_data in get_store().iter_new_stories(after_sequence, query, batch_size):
+            if story_id not in seen_at_mark:
+                # The state is only saved once every story has been written
+                mark["sequence"] = max(mark["sequence"], sequence)
+                yield story_id, story_data
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = output_dir / f"stories_{timestamp}.{fmt}"
+    suffix = 1
+    while path.exists():
+        suffix += 1
+        path = output_dir / f"stories_{timestamp}_{suffix}.{fmt}"
+    temp_path = output_dir / f".{path.name}.partial"
+    writer = _open_writer(fmt, temp_path, f"TinyTales stories {timestamp}")
+    formatter = FORMATTERS[fmt]
+
+    def write_batch(batch, formatted):
+        for output in formatted:
+            writer.write(output)
+            mark["count"] += 1
+
+    # spawn: a forked worker would inherit the store's open connections, maps and lock state
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) if workers > 1 else None
+    try:
+        # The next batch is read and handed to the workers before the current one is written
+        pending = None
+        for batch in _batches(stories(), batch_size):
+            if executor:
+                formatted = executor.map(formatter, batch, chunksize=max(1, len(batch) // (workers * 4)))
+            else:
+                formatted = map(formatter, batch)
+            if pending:
+                write_batch(*pending)
+            pending = (batch, formatted)
+        if pending:
+            write_batch(*pending)
+        writer.close()
+    except BaseException:
+        writer.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if not mark["count"]:
+        temp_path.unlink(missing_ok=True)
+        return None, 0
+
+    os.replace(temp_path, path)
+    state[key] = {
+        "last_sequence": mark["sequence"],
+        "exported_at": datetime.now().isoformat(),
+        "file": path.name,
+        "count": mark["count"],
+    }
+    _save_state(state_path, state)
+    return path, mark["count"]
+
+
+def export_story_to_text(story_id, output_dir=EXPORTS_DIR):
+    """Export one story to a text file; returns its path, or False on failure"""
+    try:
+        story_data = get_story(story_id)
+        if not story_data:
+            return False
+
+        export_path = Path(output_dir)
+        export_path.mkdir(exist_ok=True)
+        filepath = export_path / story_filename(story_id, story_data['metadata'], "txt")
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(format_story_text(story_data))
+        return str(filepath)
+
+    except Exception as e:
+        print(f"Error exporting story: {str(e)}")
+        return False
@@ -1,161 +1,350 @@
 # src/groq_story.py
-import os
-from datetime import datetime
+import asyncio
+import uuid
 import streamlit as st
-from dotenv import load_dotenv
-from groq import Groq
-from .story_counter import get_next_story_id
-from .prompts import get_gemini_optimized_prompt
+from .story_counter import claim_story
+from .prompts import build_story_prompt, build_user_prompt, GROQ_FORMAT_REMINDER
+from .dedup import is_duplicate, remember_story
+from .response_cache import lookup_response, store_response
+from .story_parser import IncrementalPageParser, parse_story_pages
+from .clients import (
+    get_api_key, get_base_url, get_groq_client, build_async_groq_client, close_async_client, report_client_failure
+)
+from .batch import run_bounded
+from .quota import estimate_tokens, wait_for_quota, wait_for_quota_async
+from .metrics import instrument, stage, timed_chunks, mark_outcome, record_usage
+from config import DEDUP_SIMILARITY_THRESHOLD, BATCH_CONCURRENCY, QUOTA_PRIORITY_INTERACTIVE, QUOTA_PRIORITY_BATCH
+
+GENERATION_SETTINGS = {
+    "temperature": 0.7,
+    "max_tokens": 2000,
+    "top_p": 0.9,
+}
 
 
 class StoryGenerator:
     def __init__(self):
-        load_dotenv()
-        self.api_key = os.getenv("GROQ_API_KEY")
-        self.generated_stories = []
-        self.similarity_threshold = 0.75
+        self.api_key = get_api_key("GROQ_API_KEY")
+        self.similarity_threshold = DEDUP_SIMILARITY_THRESHOLD
+        self.model = "llama3-8b-8192"
+        self._async_client = None
+        self._async_loop = None
 
         if not self.api_key:
             st.warning("Please provide Groq API Key to generate stories")
-            self.client = None
-            return
+        # The client (and the Groq SDK) is built on first use; its keep-alive pool is shared by every session
 
-        try:
-            self.client = Groq(api_key=self.api_key)
-            self.model = "llama3-8b-8192"
-        except Exception as e:
-            st.error(f"Error initializing Groq client: {e}")
-            self.client = None
+    @property
+    def client(self):
+        """The process-wide Groq client, built on first use (None without an API key)"""
+        return get_groq_client() if self.api_key else None
 
+    @instrument("generate_story", "groq")
     def generate_story(self, story_params):
         """Generate a story using Groq + LLaMA3"""
         try:
             if not self.client:
+                mark_outcome("error")
                 return None
 
-            system_prompt = get_gemini_optimized_prompt(story_params['age_group'], story_params)
-            user_prompt = self._build_user_prompt(story_params)
-            full_prompt = f"{system_prompt}\n\nSTORY REQUEST:\n{user_prompt}"
+            with stage("prompt"):
+                full_prompt = build_story_prompt(story_params, GROQ_FORMAT_REMINDER)
+
+            cache_key, story_text = self._lookup_cache(full_prompt)
+            from_cache = story_text is not None
+
+            if story_text is None:
+                with stage("quota"):
+                    reservation = self._wait_for_quota(full_prompt)
+                used_tokens = None
+                try:
+                    with stage("provider"):
+                        chat_completion = self.client.chat.completions.create(
+                            messages=[
+                                {"role": "user", "content": full_prompt}
+                            ],
+                            model=self.model,
+                            **GENERATION_SETTINGS,
+                            stop=None,
+                            stream=False
+                        )
+
+                    story_text = chat_completion.choices[0].message.content.strip()
+                    used_tokens = self._record_usage(chat_completion, full_prompt, story_text)
+                finally:
+                    reservation.settle(used_tokens)
+                store_response(cache_key, story_text)
+
+            return self._build_story_data(story_text, story_params, from_cache)
+
+        except Exception as e:
+            mark_outcome("error")
+            report_client_failure("groq", e)
+            st.error(f"Error generating story: {str(e)}")
+            return None
+
+    @instrument("generate_story_stream", "groq")
+    def generate_story_stream(self, story_params, on_error=None, on_granted=None):
+        """Stream a story, yielding ("title", title), ("page", page) and finally ("done", story_data).
+
+        Errors are passed to ``on_error`` if given instead of being shown with st.error;
+        ``on_granted()`` is called once quota is granted, before the provider call.
+        """
+        try:
+            if not self.client:
+                mark_outcome("error")
+                yield "done", None
+                return
+
+            with stage("prompt"):
+                full_prompt = build_story_prompt(story_params, GROQ_FORMAT_REMINDER)
+
+            cache_key, story_text = self._lookup_cache(full_prompt)
+            from_cache = story_text is not None
+
+            if not from_cache:
+                with stage("quota"):
+                    reservation = self._wait_for_quota(full_prompt)
+                if on_granted:
+                    on_granted()
+            chunks = [story_text] if from_cache else timed_chunks(self._stream_chunks(full_prompt, reservation))
+            parser = IncrementalPageParser(lenient=True)
+            received = []
+
+            for chunk in chunks:
+                received.append(chunk)
+                had_title = parser.title is not None
+                with stage("parse"):
+                    completed = parser.feed(chunk)
+                if not had_title and parser.title is not None:
+                    yield "title", parser.title
+                for page in completed:
+                    yield "page", page
+            with stage("parse"):
+                remaining = parser.close()
+            for page in remaining:
+                yield "page", page
+
+            story_text = "".join(received).strip()
+            if not from_cache:
+                store_response(cache_key, story_text)
+            yield "done", self._build_story_data(story_text, story_params, from_cache, parser.pages)
+
+        except Exception as e:
+            mark_outcome("error")
+            report_client_failure("groq", e)
+            if on_error:
+                on_error(e)
+            else:
+                st.error(f"Error generating story: {str(e)}")
+            yield "done", None
+
+    async def generate_many(self, params_list, concurrency=BATCH_CONCURRENCY):
+        """Generate a story for every parameter dict, running up to ``concurrency`` requests at once.
+
+        Returns results in input order as {"story_data": ..., "error": ...} dicts;
+        a failed item carries its error instead of stopping the batch.
+        """
+        if not self.api_key:
+            raise RuntimeError("GROQ_API_KEY is not set")
+
+        # Async clients are bound to the running event loop, so each batch gets its own pool
+        async with build_async_groq_client(self.api_key, get_base_url("groq")) as client:
+            return await run_bounded(
+                params_list,
+                lambda story_params: self._generate_async(client, story_params),
+                concurrency
+            )
+
+    async def generate_async(self, story_params, session_id="batch", priority=QUOTA_PRIORITY_BATCH,
+                             on_wait=None, on_duplicate=None, claim=True, on_granted=None):
+        """Generate one story without touching the UI; raises on failure instead of calling st.error.
+
+        ``on_wait(position, wait)`` is called while queued for quota and
+        ``on_duplicate(similarity)`` if the story is a near-duplicate. With
+        ``claim`` False the story comes back without an ID or created_at
+        and is not added to the duplicate index; see story_counter.claim_story.
+        ``on_granted()`` is called once quota is granted, just before the
+        provider call.
+        """
+        if not self.api_key:
+            raise RuntimeError("GROQ_API_KEY is not set")
+        return await self._generate_async(
+            self._loop_client(), story_params, session_id, priority, on_wait, on_duplicate, claim, on_granted
+        )
+
+    def _loop_client(self):
+        # Async clients belong to one event loop; keep one for the loop currently in use
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop or self._async_client is None:
+            if self._async_client is not None:
+                close_async_client(self._async_client, self._async_loop)
+            self._async_client = build_async_groq_client(self.api_key, get_base_url("groq"))
+            self._async_loop = loop
+        return self._async_client
+
+    def _async_client_failed(self, client, error):
+        """Report a provider error; a broken loop client is closed and rebuilt on next use"""
+        if report_client_failure("groq", error) and client is self._async_client:
+            self._async_client = None
+            close_async_client(client, self._async_loop)
+
+    @instrument("generate_async", "groq")
+    async def _generate_async(self, client, story_params, session_id="batch", priority=QUOTA_PRIORITY_BATCH,
+                              on_wait=None, on_duplicate=None, claim=True, on_granted=None):
+        with stage("prompt"):
+            full_prompt = build_story_prompt(story_params, GROQ_FORMAT_REMINDER)
+        cache_key, story_text = self._lookup_cache(full_prompt)
+        from_cache = story_text is not None
+
+        if story_text is None:
+            with stage("quota"):
+                reservation = await wait_for_quota_async(
+                    "groq", self._estimate_tokens(full_prompt), session_id, priority, on_wait
+                )
+            if on_granted:
+                on_granted()
+            try:
+                try:
+                    with stage("provider"):
+                        chat_completion = await client.chat.completions.create(
+                            messages=[
+                                {"role": "user", "content": full_prompt}
+                            ],
+                            model=self.model,
+                            **GENERATION_SETTINGS,
+                            stop=None,
+                            stream=False
+                        )
+                except Exception as e:
+                    self._async_client_failed(client, e)
+                    raise
+                story_text = chat_completion.choices[0].message.content.strip()
+                used_tokens = self._record_usage(chat_completion, full_prompt, story_text)
+            except BaseException:
+                # Failed, cancelled or timed out: hand the reservation back (not awaited, see acquire_async)
+                reservation.settle()
+                raise
+            await reservation.settle_async(used_tokens)
+            store_response(cache_key, story_text)
+
+        return self._build_story_data(story_text, story_params, from_cache, notify=False, on_duplicate=on_duplicate,
+                                      claim=claim)
+
+    def _lookup_cache(self, full_prompt):
+        """(cache_key, cached story text or None); a hit marks the current trace as cached"""
+        with stage("cache"):
+            cache_key, story_text = lookup_response(full_prompt, dict(GENERATION_SETTINGS, model=self.model))
+        if story_text is not None:
+            mark_outcome("cached", "cache")
+        return cache_key, story_text
+
+    @staticmethod
+    def _record_usage(completion, full_prompt, story_text):
+        """Report the OpenAI-style usage block (estimated if missing) to the current trace"""
+        usage = getattr(completion, "usage", None)
+        choices = getattr(completion, "choices", None)
+        return record_usage(
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+            full_prompt, story_text,
+            choices[0].finish_reason if choices else None
+        )
+
+    def _estimate_tokens(self, full_prompt):
+        return estimate_tokens(full_prompt, GENERATION_SETTINGS["max_tokens"])
+
+    def _wait_for_quota(self, full_prompt):
+        """Wait for a slot under the shared Groq rate limit, showing the reader their place in line.
+
+        Returns the quota Reservation to settle once the call is over.
+        """
+        session_id = st.session_state.setdefault("quota_session_id", uuid.uuid4().hex)
+        status = st.empty()
+
+        def on_wait(position, wait):
+            status.info(f"⏳ Lots of stories are being written right now. You are number {position} in line (about {wait:.0f}s).")
 
-            chat_completion = self.client.chat.completions.create(
+        try:
+            return wait_for_quota("groq", self._estimate_tokens(full_prompt), session_id, QUOTA_PRIORITY_INTERACTIVE, on_wait)
+        finally:
+            status.empty()
+
+    def _stream_chunks(self, full_prompt, reservation):
+        """Yield text chunks from a streaming Groq call, settling ``reservation`` when it ends, fails or is closed"""
+        used_tokens = None
+        try:
+            stream = self.client.chat.completions.create(
                 messages=[
                     {"role": "user", "content": full_prompt}
                 ],
                 model=self.model,
-                temperature=0.7,
-                max_tokens=2000,
-                top_p=0.9,
+                **GENERATION_SETTINGS,
                 stop=None,
-                stream=False
+                stream=True
             )
+            received = []
+            usage = finish_reason = None
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    received.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                # Groq reports usage on the final chunk under x_groq
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            used_tokens = record_usage(
+                getattr(usage, "prompt_tokens", None),
+                getattr(usage, "completion_tokens", None),
+                full_prompt, "".join(received), finish_reason
+            )
+        finally:
+            reservation.settle(used_tokens)
 
-            story_text = chat_completion.choices[0].message.content.strip()
-
-            # Show raw story text for debugging
+    def _build_story_data(self, story_text, story_params, from_cache, story_pages=None, notify=True,
+                          on_duplicate=None, claim=True):
+        # Show raw story text for debugging
+        if notify:
             st.text_area("🧾 Raw Story Text from Groq", story_text, height=400)
 
-            # Check for duplicates
-            is_dup, score = self.is_duplicate(story_text)
-            if is_dup:
-                st.warning(f"Generated story is similar to a previous one (similarity={score:.2f}). Retrying may help.")
-
-            self.add_story_to_history(story_text)
-
-            # Parse pages (with fallback logic)
-            story_pages = self._parse_story_pages(story_text)
-
-            story_data = {
-                "story": story_pages,
-                "metadata": {
-                    "id": f"story_{get_next_story_id()}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                    "title": self._extract_title(story_text),
-                    "genre": story_params['genre'],
-                    "gender": story_params['gender'],
-                    "age_group": story_params['age_group'],
-                    "story_length": story_params['story_length'],
-                    "description": story_params.get('description', ''),
-                    "created_at": datetime.now().isoformat(),
-                    "total_pages": len(story_pages)
-                }
-            }
+        # Check for duplicates (a cache hit is a deliberate reuse, so it is not checked)
+        with stage("dedup"):
+            is_dup, score = (False, None) if from_cache else self.is_duplicate(story_text)
+        if is_dup and notify:
+            st.warning(f"Generated story is similar to a previous one (similarity={score:.2f}). Retrying may help.")
+        elif is_dup and on_duplicate:
+            on_duplicate(score)
 
-            return story_data
+        # Parse pages (with fallback logic)
+        if story_pages is None:
+            with stage("parse"):
+                story_pages = self._parse_story_pages(story_text)
 
-        except Exception as e:
-            st.error(f"Error generating story: {str(e)}")
-            return None
+        story_data = {
+            "story": story_pages,
+            "metadata": {
+                "id": None,
+                "title": self._extract_title(story_text),
+                "genre": story_params['genre'],
+                "gender": story_params['gender'],
+                "age_group": story_params['age_group'],
+                "story_length": story_params['story_length'],
+                "description": story_params.get('description', ''),
+                "created_at": None,
+                "total_pages": len(story_pages)
+            }
+        }
+        # Left to the caller when this story may never be served (a hedged race, the warm pool)
+        if claim:
+            claim_story(story_data, story_text.strip())
 
-    def _build_user_prompt(self, params):
-        prompt_parts = []
-        prompt_parts.append(f"Create a {params['story_length']}-page children's picture book story with these details:")
-        prompt_parts.append(f"• Genre: {params['genre']}")
-        prompt_parts.append(f"• Main character gender: {params['gender']}")
-        prompt_parts.append(f"• Target age: {params['age_group']}")
-
-        if params.get('description'):
-            prompt_parts.append(f"• Story concept: {params['description']}")
-
-        requirements = []
-        if params.get('include_moral'):
-            requirements.append("include a gentle life lesson")
-        if params.get('include_dialogue'):
-            requirements.append("include character conversations")
-        if params.get('rhyming'):
-            requirements.append("include some rhyming where natural")
-
-        if requirements:
-            prompt_parts.append(f"• Please {', '.join(requirements)}")
-
-        # 👇 Key improvement to encourage proper formatting
-        prompt_parts.append(
-            "\nFormat the story with clear page markers like 'Page 1', 'Page 2', etc. "
-            "Each page should be ~4-5 sentences. Title should appear as 'Title: ...'"
-        )
+        return story_data
 
-        return "\n".join(prompt_parts)
+    def _build_user_prompt(self, params):
+        return build_user_prompt(params, GROQ_FORMAT_REMINDER)
 
     def _parse_story_pages(self, story_text):
-        pages = []
-        lines = story_text.split('\n')
-        current_page = None
-        current_content = []
-
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            if line.lower().startswith('title:'):
-                continue
-            elif line.lower().startswith('page '):
-                if current_page is not None and current_content:
-                    pages.append({
-                        'page_number': current_page,
-                        'content': '\n'.join(current_content)
-                    })
-                current_page = len(pages) + 1
-                current_content = []
-            else:
-                if current_page is not None:
-                    current_content.append(line)
-
-        # Final page
-        if current_page is not None and current_content:
-            pages.append({
-                'page_number': current_page,
-                'content': '\n'.join(current_content)
-            })
-
-        # Fallback: split into N pages if no page markers found
-        if not pages:
-            paragraphs = [p.strip() for p in story_text.split('\n\n') if p.strip()]
-            for i, para in enumerate(paragraphs, start=1):
-                pages.append({
-                    'page_number': i,
-                    'content': para
-                })
-
-        return pages
+        return parse_story_pages(story_text, lenient=True)
 
     def _extract_title(self, story_text):
         lines = story_text.split('\n')
@@ -165,18 +354,8 @@ class StoryGenerator:
         return "Untitled Story"
 
     def is_duplicate(self, new_story_text):
-        def jaccard_similarity(text1, text2):
-            set1 = set(text1.lower().split())
-            set2 = set(text2.lower().split())
-            intersection = set1.intersection(set2)
-            union = set1.union(set2)
-            return len(intersection) / len(union) if union else 0
-
-        for old_story in self.generated_stories:
-            similarity = jaccard_similarity(new_story_text, old_story)
-            if similarity >= self.similarity_threshold:
-                return True, similarity
-        return False, None
-
-    def add_story_to_history(self, story_text):
-        self.generated_stories.append(story_text.strip())
+        """Check against the shared near-duplicate index (saved library + recent generations)"""
+        return is_duplicate(new_story_text, self.similarity_threshold)
+
+    def add_story_to_history(self, story_text, story_id):
+        remember_story(story_id, story_text.strip())
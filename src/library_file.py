@@ -0,0 +1,150 @@
+# src/library_file.py
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from .wal import fsync_directory
+
+MAGIC = b"TTLIB002"
+HEADER = struct.Struct("<8sQQQ")  # magic, story count, index offset, highest insert sequence issued
+MAGIC_V1 = b"TTLIB001"
+HEADER_V1 = struct.Struct("<8sQQ")  # generations written before insert sequences
+ENTRY = struct.Struct("<QHQI")    # ID offset, ID length, data offset, data length
+CURRENT_FILENAME = "CURRENT"      # names the generation readers should map
+KEEP_GENERATIONS = 2              # the previous one stays for readers still mapping it
+
+
+def _generation_name(generation):
+    return f"library.{generation:06d}.ttl"
+
+
+def current_generation(directory):
+    """File name of the current generation in ``directory``, or None"""
+    try:
+        return (Path(directory) / CURRENT_FILENAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_library(directory, items, sequence=0):
+    """Write (story_id, story_data) pairs as a new generation and make it current; returns its path.
+
+    ``sequence`` is the highest insert sequence the store has handed out,
+    kept in the header so it is never reused after the story that had it
+    is deleted.
+
+    The data segment holds each story's ID and compact JSON back to back;
+    the index after it is a sorted array of fixed-size entries pointing
+    into it. The file is complete and fsynced before CURRENT is swapped to
+    name it, so readers see either the old generation or the new one.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    current = current_generation(directory)
+    generation = int(current.split(".")[1]) + 1 if current else 1
+    path = directory / _generation_name(generation)
+    temp_path = path.with_name(f"{path.name}.tmp")
+
+    index = []
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0, 0))
+        for story_id, story_data in items:
+            key = story_id.encode("utf-8")
+            data = json.dumps(story_data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            offset = f.tell()
+            f.write(key)
+            f.write(data)
+            index.append((key, offset, len(data)))
+        index.sort()
+        index_offset = f.tell()
+        f.write(b"".join(ENTRY.pack(offset, len(key), offset + len(key), length) for key, offset, length in index))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(index), index_offset, sequence))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    make_current(directory, path.name)
+
+    for old in sorted(directory.glob("library.*.ttl"))[:-KEEP_GENERATIONS]:
+        try:
+            old.unlink()
+        except OSError:
+            pass  # still mapped by a reader on Windows; removed after a later publish
+    return path
+
+
+def make_current(directory, name):
+    """Atomically point CURRENT at generation file ``name``"""
+    directory = Path(directory)
+    pointer = directory / f"{CURRENT_FILENAME}.tmp"
+    pointer.write_text(name, encoding="utf-8")
+    os.replace(pointer, directory / CURRENT_FILENAME)
+    fsync_directory(directory)
+
+
+class MappedLibrary:
+    """Read-only view of one library generation through a shared memory map.
+
+    Looking up a story is a binary search over the index and a parse of
+    that story's bytes alone. Every process mapping the same generation
+    shares one copy of it in the OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC_V1)] == MAGIC_V1:
+            magic, self.count, self._index_offset = HEADER_V1.unpack_from(self._map)
+            self.sequence = 0
+        else:
+            magic, self.count, self._index_offset, self.sequence = HEADER.unpack_from(self._map)
+        if magic not in (MAGIC, MAGIC_V1) or self._index_offset + self.count * ENTRY.size > len(self._map):
+            raise ValueError(f"{self.path} is not a complete library file")
+
+    @classmethod
+    def open_current(cls, directory):
+        """The current generation in ``directory``, or None if none has been published"""
+        name = current_generation(directory)
+        return cls(Path(directory) / name) if name else None
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._map, self._index_offset + i * ENTRY.size)
+
+    def _find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            id_offset, id_length, data_offset, data_length = self._entry(middle)
+            found = self._map[id_offset:id_offset + id_length]
+            if found == key:
+                return data_offset, data_length
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __contains__(self, story_id):
+        return self._find(story_id.encode("utf-8")) is not None
+
+    def get(self, story_id):
+        """One story's data, parsed from its own bytes only; None if absent"""
+        found = self._find(story_id.encode("utf-8"))
+        if found is None:
+            return None
+        data_offset, data_length = found
+        return json.loads(self._map[data_offset:data_offset + data_length])
+
+    def items(self):
+        """Yield (story_id, story_data) in the order the stories were written"""
+        entries = sorted(self._entry(i) for i in range(self.count))
+        for id_offset, id_length, data_offset, data_length in entries:
+            story_id = self._map[id_offset:id_offset + id_length].decode("utf-8")
+            yield story_id, json.loads(self._map[data_offset:data_offset + data_length])
@@ -0,0 +1,418 @@
+# src/metrics.py
+import asyncio
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from config import (
+    LOGS_DIR,
+    METRICS_ENABLED,
+    METRICS_LOG_FILENAME,
+    METRICS_LOG_MAX_BYTES,
+    METRICS_LOG_BACKUPS,
+    METRICS_PROM_FILENAME,
+    METRICS_PROM_INTERVAL_SECONDS,
+)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 1500, 2000, 4000, 8000)
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Trace:
+    """Everything measured about one generate/save/load call"""
+
+    def __init__(self, operation, provider=None):
+        self.operation = operation
+        self.provider = provider or "none"
+        self.stages = {}
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.tokens_estimated = False
+        self.finish_reason = None
+        self.outcome = "ok"
+        self.started_at = time.time()
+        self.seconds = None
+
+    def to_dict(self):
+        return {
+            "time": datetime.fromtimestamp(self.started_at).isoformat(),
+            "operation": self.operation,
+            "provider": self.provider,
+            "outcome": self.outcome,
+            "finish_reason": self.finish_reason,
+            "seconds": round(self.seconds, 6),
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "tokens_estimated": self.tokens_estimated,
+        }
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside its bucket (like histogram_quantile)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, below = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                inside = total - below
+                return lower + (bound - lower) * ((rank - below) / inside if inside else 1)
+            lower, below = bound, total
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """In-process histograms and counters, exported as Prometheus text and a JSON-lines log"""
+
+    def __init__(self, log_path=None, prom_path=None, prom_interval=METRICS_PROM_INTERVAL_SECONDS,
+                 log_max_bytes=METRICS_LOG_MAX_BYTES, log_backups=METRICS_LOG_BACKUPS):
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        for path in (log_path, prom_path):
+            if path:
+                Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.prom_interval = prom_interval
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._prom_written_at = 0.0
+
+    def _observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+    def _inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def record(self, trace):
+        operation, provider = trace.operation, trace.provider
+        with self._lock:
+            self._observe(
+                "tinytales_operation_seconds",
+                {"operation": operation, "provider": provider, "outcome": trace.outcome},
+                trace.seconds, SECONDS_BUCKETS
+            )
+            self._inc("tinytales_operations_total", {
+                "operation": operation, "provider": provider, "outcome": trace.outcome,
+                "finish_reason": trace.finish_reason or "none",
+            })
+            for stage_name, seconds in trace.stages.items():
+                self._observe(
+                    "tinytales_stage_seconds",
+                    {"operation": operation, "provider": provider, "stage": stage_name},
+                    seconds, SECONDS_BUCKETS
+                )
+            source = "estimated" if trace.tokens_estimated else "reported"
+            for kind, tokens in (("prompt", trace.prompt_tokens), ("completion", trace.completion_tokens)):
+                if tokens is not None:
+                    self._observe("tinytales_tokens", {"provider": provider, "kind": kind}, tokens, TOKEN_BUCKETS)
+                    self._inc("tinytales_tokens_total", {"provider": provider, "kind": kind, "source": source}, tokens)
+
+            write_prom = self.prom_path and time.time() - self._prom_written_at >= self.prom_interval
+            if write_prom:
+                self._prom_written_at = time.time()
+
+        try:
+            if self.log_path:
+                line = json.dumps(trace.to_dict()) + "\n"
+                with self._lock:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(line)
+                        full = self.log_max_bytes and f.tell() >= self.log_max_bytes
+                    if full:
+                        self._rotate_log()
+            if write_prom:
+                self.write_prometheus()
+        except Exception as e:
+            print(f"Error writing metrics: {str(e)}")
+
+    def _rotate_log(self):
+        """metrics.jsonl -> .1 -> .2 ...; the oldest beyond ``log_backups`` is dropped"""
+        log_path = Path(self.log_path)
+        if log_path.stat().st_size < self.log_max_bytes:
+            return  # another process rotated it first
+        if self.log_backups < 1:
+            log_path.unlink(missing_ok=True)
+            return
+        for i in range(self.log_backups - 1, 0, -1):
+            older = log_path.with_name(f"{log_path.name}.{i}")
+            if older.exists():
+                os.replace(older, log_path.with_name(f"{log_path.name}.{i + 1}"))
+        os.replace(log_path, log_path.with_name(f"{log_path.name}.1"))
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+        with self._lock:
+            histograms = sorted(
+                (key, hist.buckets, list(hist.cumulative()), hist.count, hist.sum)
+                for key, hist in self.histograms.items()
+            )
+            counters = sorted(self.counters.items())
+
+        lines, declared = [], set()
+        for (name, labels), _, cumulative, count, total in histograms:
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            for bound, running in cumulative:
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {running}")
+            lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self):
+        """Atomically rewrite the Prometheus text file (for node_exporter's textfile collector)"""
+        temp_path = self.prom_path.with_name(f"{self.prom_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temp_path.write_text(self.render_prometheus(), encoding="utf-8")
+        os.replace(temp_path, self.prom_path)
+
+    def summary(self, name):
+        """[(labels dict, count, mean, p50, p95)] for every series of histogram ``name``"""
+        with self._lock:
+            series = [
+                (dict(labels), hist.count, hist.sum / hist.count, hist.quantile(0.5), hist.quantile(0.95))
+                for (metric, labels), hist in sorted(self.histograms.items())
+                if metric == name and hist.count
+            ]
+        return series
+
+    def counter_values(self, name):
+        with self._lock:
+            return [(dict(labels), value) for (metric, labels), value in sorted(self.counters.items()) if metric == name]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry(LOGS_DIR / METRICS_LOG_FILENAME, LOGS_DIR / METRICS_PROM_FILENAME)
+                # The .prom file is rewritten on an interval; make sure the last numbers land on exit
+                atexit.register(_registry.write_prometheus)
+    return _registry
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def _measured(operation, provider=None):
+    """Time one operation and record its Trace, without making it the current trace"""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    trace = Trace(operation, provider)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except GeneratorExit:
+        # A stream closed by its consumer (e.g. after "done") has not failed
+        raise
+    except BaseException:
+        if trace.outcome == "ok":
+            trace.outcome = "error"
+        raise
+    finally:
+        trace.seconds = time.perf_counter() - start
+        get_metrics().record(trace)
+
+
+@contextmanager
+def traced(operation, provider=None):
+    """Measure one operation; ``stage`` blocks and usage reported inside it are attributed to it"""
+    with _measured(operation, provider) as trace:
+        if trace is None:
+            yield None
+            return
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+
+
+def _step(trace, advance, *args):
+    """Advance an instrumented generator with its trace current only while it runs"""
+    token = _current.set(trace)
+    try:
+        return advance(*args)
+    finally:
+        _current.reset(token)
+
+
+def _traced_generator(generator, trace):
+    # Like ``yield from``, but the trace is not left current while the consumer
+    # runs between items, so its own stages are not charged to the stream
+    try:
+        value = _step(trace, next, generator)
+        while True:
+            try:
+                sent = yield value
+            except GeneratorExit:
+                _step(trace, generator.close)
+                raise
+            except BaseException as e:
+                value = _step(trace, generator.throw, e)
+            else:
+                value = _step(trace, generator.send, sent)
+    except StopIteration as stop:
+        return stop.value
+
+
+def instrument(operation, provider=None):
+    """Decorator: run a function, coroutine or generator inside ``traced(operation, provider)``"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _measured(operation, provider) as trace:
+                    if trace is None:
+                        return (yield from fn(*args, **kwargs))
+                    return (yield from _traced_generator(fn(*args, **kwargs), trace))
+        elif asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with traced(operation, provider):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with traced(operation, provider):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def stage(name):
+    """Add the time spent in the block to stage ``name`` of the current trace"""
+    trace = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.stages[name] = trace.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def timed_chunks(chunks, name="provider"):
+    """Yield from a streaming response, counting only the time spent waiting on it as stage ``name``"""
+    iterator = iter(chunks)
+    while True:
+        with stage(name):
+            chunk = next(iterator, StopIteration)
+        if chunk is StopIteration:
+            return
+        yield chunk
+
+
+def mark_outcome(outcome, finish_reason=None):
+    trace = _current.get()
+    if trace is not None:
+        trace.outcome = outcome
+        if finish_reason is not None:
+            trace.finish_reason = finish_reason
+
+
+def record_usage(prompt_tokens, completion_tokens, prompt="", completion="", finish_reason=None):
+    """Token counts for the current trace, estimated at ~4 characters per token where the provider gave none.
+
+    Returns the total, so callers can settle their quota reservation with it.
+    """
+    estimated = prompt_tokens is None or completion_tokens is None
+    prompt_tokens = len(prompt) // 4 if prompt_tokens is None else prompt_tokens
+    completion_tokens = len(completion) // 4 if completion_tokens is None else completion_tokens
+    trace = _current.get()
+    if trace is not None:
+        if estimated:
+            trace.tokens_estimated = True
+        trace.prompt_tokens = prompt_tokens
+        trace.completion_tokens = completion_tokens
+        if finish_reason is not None:
+            trace.finish_reason = str(finish_reason)
+    return prompt_tokens + completion_tokens
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve GET /metrics on a daemon thread; returns the server"""
+    # Imported here so the app doesn't load the HTTP server stack unless METRICS_PORT is set
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
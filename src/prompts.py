@@ -1,10 +1,10 @@
-# src/enhanced_prompts.py
+# src/prompts.py
+import sys
+from functools import lru_cache
 
+# Static prompt text, built once at import and shared by every request
 
-def get_gemini_optimized_prompt(age_group, story_params):
-    """Return Gemini-optimized prompts with better structure and clarity"""
-    
-    base_instructions = """
+BASE_INSTRUCTIONS = """
     You are an expert children's book author creating engaging picture book stories.
     
     CRITICAL REQUIREMENTS:
@@ -33,9 +33,9 @@ def get_gemini_optimized_prompt(age_group, story_params):
     Continue this exact format for all pages.
     Each page should be 2-3 lines maximum, perfect for pairing with illustrations.
     """
-    
-    age_specific = {
-        "3-5 years": """
+
+AGE_SPECIFIC = {
+    "3-5 years": """
         TARGET AUDIENCE: Ages 3-5 years
         
         LANGUAGE GUIDELINES:
@@ -57,8 +57,8 @@ def get_gemini_optimized_prompt(age_group, story_params):
         She looked under the big tree.
         Where could it be?"
         """,
-        
-        "5-7 years": """
+    
+    "5-7 years": """
         TARGET AUDIENCE: Ages 5-7 years
         
         LANGUAGE GUIDELINES:
@@ -81,8 +81,8 @@ def get_gemini_optimized_prompt(age_group, story_params):
         'I wonder who lives there?' she whispered.
         She knocked three times and waited."
         """,
-        
-        "7-9 years": """
+    
+    "7-9 years": """
         TARGET AUDIENCE: Ages 7-9 years
         
         LANGUAGE GUIDELINES:
@@ -106,40 +106,130 @@ def get_gemini_optimized_prompt(age_group, story_params):
         The faded ink showed a path through the Whispering Woods.
         'Every great adventure starts with a single step,' Grandma had always said."
         """
-    }
+}
+
+GENRE_ENHANCEMENTS = {
+    "Adventure": "Include exciting exploration, discovery of new places, overcoming obstacles with courage and cleverness. Settings can be forests, mountains, caves, or magical lands.",
     
-    genre_enhancements = {
-        "Adventure": "Include exciting exploration, discovery of new places, overcoming obstacles with courage and cleverness. Settings can be forests, mountains, caves, or magical lands.",
-        
-        "Fantasy": "Add magical elements like talking animals, fairy helpers, enchanted objects, or friendly wizards. Magic should always be used for good and helping others.",
-        
-        "Educational": "Naturally weave in learning about numbers, letters, science facts, or interesting information. Make learning feel like discovery and fun exploration.",
-        
-        "Friendship": "Focus on making new friends, solving friendship problems, learning to share and cooperate, celebrating differences, and showing kindness.",
-        
-        "Animal Stories": "Feature animals as main characters with human-like qualities but keep some realistic animal behaviors. Include themes about nature and caring for animals.",
-        
-        "Mystery": "Create gentle mysteries appropriate for children - lost items, surprising discoveries, or figuring out simple puzzles. Keep it intriguing but never scary.",
-        
-        "Science Fiction": "Include friendly robots, space adventures, future inventions, or time travel. Keep technology helpful and amazing rather than scary."
-    }
+    "Fantasy": "Add magical elements like talking animals, fairy helpers, enchanted objects, or friendly wizards. Magic should always be used for good and helping others.",
+    
+    "Educational": "Naturally weave in learning about numbers, letters, science facts, or interesting information. Make learning feel like discovery and fun exploration.",
     
+    "Friendship": "Focus on making new friends, solving friendship problems, learning to share and cooperate, celebrating differences, and showing kindness.",
+    
+    "Animal Stories": "Feature animals as main characters with human-like qualities but keep some realistic animal behaviors. Include themes about nature and caring for animals.",
+    
+    "Mystery": "Create gentle mysteries appropriate for children - lost items, surprising discoveries, or figuring out simple puzzles. Keep it intriguing but never scary.",
+    
+    "Science Fiction": "Include friendly robots, space adventures, future inventions, or time travel. Keep technology helpful and amazing rather than scary."
+}
+
+STORY_REQUEST_HEADER = "\n\nSTORY REQUEST:\n"
+
+# Closing line of the user prompt for each backend
+GEMINI_FORMAT_REMINDER = "\nRemember to follow the exact page format specified above!"
+GROQ_FORMAT_REMINDER = (
+    "\nFormat the story with clear page markers like 'Page 1', 'Page 2', etc. "
+    "Each page should be ~4-5 sentences. Title should appear as 'Title: ...'"
+)
+
+
+def _prompt_key(params):
+    """Normalise the story parameters that select a prompt template"""
+    return (
+        params['age_group'],
+        params.get('genre'),
+        params.get('gender'),
+        str(params.get('story_length', '6')),
+        bool(params.get('include_moral')),
+        bool(params.get('include_dialogue')),
+        bool(params.get('rhyming')),
+    )
+
+
+@lru_cache(maxsize=None)
+def _compile_system_prompt(age_group, genre, story_length, include_moral, rhyming):
     # Build the complete prompt
-    complete_prompt = f"{base_instructions}\n\n{age_specific.get(age_group, age_specific['5-7 years'])}\n\n"
+    complete_prompt = f"{BASE_INSTRUCTIONS}\n\n{AGE_SPECIFIC.get(age_group, AGE_SPECIFIC['5-7 years'])}\n\n"
     
     # Add genre-specific guidance
-    if story_params.get('genre') in genre_enhancements:
-        complete_prompt += f"GENRE FOCUS: {genre_enhancements[story_params['genre']]}\n\n"
+    if genre in GENRE_ENHANCEMENTS:
+        complete_prompt += f"GENRE FOCUS: {GENRE_ENHANCEMENTS[genre]}\n\n"
     
     # Add story length requirement
-    story_length = story_params.get('story_length', '6')
     complete_prompt += f"STORY LENGTH: Create exactly {story_length} pages following the format above.\n\n"
     
     # Add additional options
-    if story_params.get('include_moral'):
+    if include_moral:
         complete_prompt += "Include a gentle life lesson that emerges naturally from the story.\n"
     
-    if story_params.get('rhyming'):
+    if rhyming:
         complete_prompt += "Try to include some rhyming where it feels natural, but prioritize story flow over forced rhymes.\n"
     
-    return complete_prompt
\ No newline at end of file
+    return sys.intern(complete_prompt)
+
+
+@lru_cache(maxsize=None)
+def _compile_user_prompt(age_group, genre, gender, story_length, include_moral, include_dialogue, rhyming, format_reminder):
+    """Return the (head, tail) of the user prompt; the description goes between them"""
+    prompt_parts = []
+    prompt_parts.append(f"Create a {story_length}-page children's picture book story with these details:")
+    prompt_parts.append(f"• Genre: {genre}")
+    prompt_parts.append(f"• Main character gender: {gender}")
+    prompt_parts.append(f"• Target age: {age_group}")
+    
+    # Add specific requirements based on parameters
+    requirements = []
+    if include_moral:
+        requirements.append("include a gentle life lesson")
+    if include_dialogue:
+        requirements.append("include character conversations")
+    if rhyming:
+        requirements.append("include some rhyming where natural")
+    
+    tail_parts = []
+    if requirements:
+        tail_parts.append(f"• Please {', '.join(requirements)}")
+    tail_parts.append(format_reminder)
+    
+    return sys.intern("\n".join(prompt_parts)), sys.intern("\n".join(tail_parts))
+
+
+@lru_cache(maxsize=None)
+def _compile_story_prompt(age_group, genre, gender, story_length, include_moral, include_dialogue, rhyming, format_reminder):
+    system_prompt = _compile_system_prompt(age_group, genre, story_length, include_moral, rhyming)
+    head, tail = _compile_user_prompt(
+        age_group, genre, gender, story_length, include_moral, include_dialogue, rhyming, format_reminder
+    )
+    return sys.intern(f"{system_prompt}{STORY_REQUEST_HEADER}{head}\n"), tail
+
+
+def get_gemini_optimized_prompt(age_group, story_params):
+    """Return Gemini-optimized prompts with better structure and clarity"""
+    return _compile_system_prompt(
+        age_group,
+        story_params.get('genre'),
+        str(story_params.get('story_length', '6')),
+        bool(story_params.get('include_moral')),
+        bool(story_params.get('rhyming')),
+    )
+
+
+def build_user_prompt(params, format_reminder=GEMINI_FORMAT_REMINDER):
+    """Build the user prompt from the cached template plus the free-text description"""
+    head, tail = _compile_user_prompt(*_prompt_key(params), format_reminder)
+    if params.get('description'):
+        return f"{head}\n• Story concept: {params['description']}\n{tail}"
+    return f"{head}\n{tail}"
+
+
+def build_story_prompt(params, format_reminder=GEMINI_FORMAT_REMINDER):
+    """Return the full system + user prompt for a story request.
+
+    Everything except the description is compiled once per parameter
+    combination and reused, so a request costs one lookup and one splice.
+    """
+    prefix, tail = _compile_story_prompt(*_prompt_key(params), format_reminder)
+    if params.get('description'):
+        return f"{prefix}• Story concept: {params['description']}\n{tail}"
+    return prefix + tail
@@ -0,0 +1,339 @@
+# src/quota.py
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    DATA_DIR,
+    QUOTA_ENABLED,
+    QUOTA_FILENAME,
+    QUOTA_LIMITS,
+    QUOTA_POLL_SECONDS,
+    QUOTA_STALE_SECONDS,
+    QUOTA_MAX_WAIT_SECONDS,
+)
+
+# How long a session's last grant is remembered for round-robin ordering
+SERVED_HISTORY_SECONDS = 600
+
+
+class QuotaTimeout(Exception):
+    """Raised when a request waited longer than its allowed time for provider capacity"""
+
+
+class Reservation:
+    """The tokens one granted request took from its provider's bucket, trued up by ``settle``"""
+
+    def __init__(self, scheduler=None, provider=None, tokens=0):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.tokens = tokens
+        self._settled = False
+
+    def settle(self, used_tokens=None):
+        """Give back what the request didn't use, or charge what it used beyond the reservation.
+
+        ``used_tokens`` None means the request failed, was cancelled or
+        timed out, and the whole reservation is returned. Only the first
+        call counts; a no-op when quotas are off.
+        """
+        if self._settled or self.scheduler is None:
+            return
+        self._settled = True
+        try:
+            self.scheduler.refund(self.provider, self.tokens - (used_tokens or 0))
+        except Exception as e:
+            print(f"Error settling quota reservation: {str(e)}")
+
+    async def settle_async(self, used_tokens=None):
+        await asyncio.to_thread(self.settle, used_tokens)
+
+
+class QuotaScheduler:
+    """Token-bucket rate limiter shared by every app process on the host.
+
+    Each provider has two buckets, requests per minute and tokens per
+    minute, refilled continuously and stored in SQLite so that separate
+    Streamlit/CLI processes draw from the same budget. Callers that cannot
+    be served immediately join a queue ordered by priority, then by turn
+    within their session (a session's second waiting request ranks behind
+    every other session's first), then by which session was served least
+    recently, then by arrival. Only the head of the
+    queue may take capacity, so a burst from one session cannot starve
+    the others. Waiters refresh a heartbeat while polling; tickets from
+    crashed processes go stale and are dropped.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        provider TEXT PRIMARY KEY,
+        requests REAL NOT NULL,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS waiters (
+        ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+        provider TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        tokens INTEGER NOT NULL,
+        heartbeat REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_waiters_provider ON waiters (provider, priority);
+
+    CREATE TABLE IF NOT EXISTS served (
+        provider TEXT NOT NULL,
+        session_id TEXT NOT NULL,
+        last_served REAL NOT NULL,
+        PRIMARY KEY (provider, session_id)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path, limits=QUOTA_LIMITS, poll_seconds=QUOTA_POLL_SECONDS,
+                 stale_seconds=QUOTA_STALE_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.limits = limits
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _refill(self, conn, provider, now):
+        limit = self.limits[provider]
+        row = conn.execute(
+            "SELECT requests, tokens, updated_at FROM buckets WHERE provider = ?", (provider,)
+        ).fetchone()
+        if row is None:
+            requests, tokens = float(limit["rpm"]), float(limit["tpm"])
+        else:
+            requests, tokens, updated_at = row
+            elapsed = max(0.0, now - updated_at)
+            requests = min(limit["rpm"], requests + elapsed * limit["rpm"] / 60)
+            tokens = min(limit["tpm"], tokens + elapsed * limit["tpm"] / 60)
+        return requests, tokens
+
+    def _save_bucket(self, conn, provider, requests, tokens, now):
+        conn.execute(
+            """
+            INSERT INTO buckets (provider, requests, tokens, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(provider) DO UPDATE SET
+                requests=excluded.requests, tokens=excluded.tokens, updated_at=excluded.updated_at
+            """,
+            (provider, requests, tokens, now)
+        )
+
+    def _charge(self, provider, tokens):
+        # A request larger than a whole minute's budget could never be served
+        return min(int(tokens), self.limits[provider]["tpm"])
+
+    def enqueue(self, provider, tokens, session_id, priority=0):
+        """Join the provider's queue; returns a ticket for try_acquire/cancel"""
+        tokens = self._charge(provider, tokens)
+        cursor = self._conn().execute(
+            "INSERT INTO waiters (provider, session_id, priority, tokens, heartbeat) VALUES (?, ?, ?, ?, ?)",
+            (provider, session_id, priority, tokens, time.time())
+        )
+        return cursor.lastrowid
+
+    def cancel(self, ticket):
+        self._conn().execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+
+    def refund(self, provider, tokens):
+        """Put ``tokens`` back in the provider's token bucket (negative takes more), capped at a full bucket"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            requests, available = self._refill(conn, provider, now)
+            self._save_bucket(conn, provider, requests, min(self.limits[provider]["tpm"], available + tokens), now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def try_acquire(self, ticket):
+        """Take capacity for ``ticket`` if it is at the head of its queue.
+
+        Returns (granted, queue_position, estimated_wait_seconds); position
+        is 1-based and both are 0 once granted. Raises KeyError if the
+        ticket is no longer queued (another process swept it as stale).
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE waiters SET heartbeat = ? WHERE ticket = ?", (now, ticket))
+            conn.execute("DELETE FROM waiters WHERE heartbeat < ?", (now - self.stale_seconds,))
+            row = conn.execute(
+                "SELECT provider, session_id FROM waiters WHERE ticket = ?", (ticket,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(ticket)
+            provider, session_id = row
+
+            queue = conn.execute(
+                """
+                SELECT w.ticket, w.tokens FROM (
+                    SELECT ticket, tokens, priority, session_id,
+                           ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY priority DESC, ticket) AS turn
+                    FROM waiters WHERE provider = ?
+                ) AS w
+                LEFT JOIN served AS s ON s.provider = ? AND s.session_id = w.session_id
+                ORDER BY w.priority DESC, w.turn, COALESCE(s.last_served, 0), w.ticket
+                """,
+                (provider, provider)
+            ).fetchall()
+            position = next(i for i, (waiter, _) in enumerate(queue) if waiter == ticket)
+            needed = queue[position][1]
+
+            requests, tokens = self._refill(conn, provider, now)
+            if position == 0 and requests >= 1 and tokens >= needed:
+                self._save_bucket(conn, provider, requests - 1, tokens - needed, now)
+                conn.execute("DELETE FROM waiters WHERE ticket = ?", (ticket,))
+                # Ties between sessions on the same turn go to whoever was served least recently
+                conn.execute(
+                    """
+                    INSERT INTO served (provider, session_id, last_served) VALUES (?, ?, ?)
+                    ON CONFLICT(provider, session_id) DO UPDATE SET last_served=excluded.last_served
+                    """,
+                    (provider, session_id, now)
+                )
+                conn.execute("DELETE FROM served WHERE last_served < ?", (now - SERVED_HISTORY_SECONDS,))
+                conn.execute("COMMIT")
+                return True, 0, 0.0
+
+            # Everyone up to and including us has to be served before we are
+            limit = self.limits[provider]
+            requests_ahead = position + 1
+            tokens_ahead = sum(waiter_tokens for _, waiter_tokens in queue[:position + 1])
+            wait = max(
+                (requests_ahead - requests) * 60 / limit["rpm"],
+                (tokens_ahead - tokens) * 60 / limit["tpm"],
+                0.0,
+            )
+            self._save_bucket(conn, provider, requests, tokens, now)
+            conn.execute("COMMIT")
+            return False, position + 1, wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _poll(self, ticket, request):
+        """One acquire attempt: (ticket, queue_position, estimated_wait); position is 0 once granted.
+
+        ``request`` is the (provider, tokens, session_id, priority) the
+        ticket was enqueued with. A ticket swept as stale, because its
+        process stalled for longer than ``stale_seconds``, is queued again
+        at the back under a new ticket.
+        """
+        try:
+            granted, position, wait = self.try_acquire(ticket)
+        except KeyError:
+            ticket = self.enqueue(*request)
+            granted, position, wait = self.try_acquire(ticket)
+        return ticket, position, wait
+
+    def _delay(self, provider, position, wait, deadline, max_wait):
+        """How long to sleep before the next poll; raises QuotaTimeout past the deadline"""
+        if time.time() + min(wait, self.poll_seconds) > deadline:
+            raise QuotaTimeout(
+                f"{provider} is over its rate limit; still number {position} in the queue after {max_wait}s"
+            )
+        return min(max(wait, 0.05), self.poll_seconds)
+
+    def acquire(self, provider, tokens, session_id, priority=0, on_wait=None, max_wait=QUOTA_MAX_WAIT_SECONDS):
+        """Block until the provider has capacity for one request of ``tokens`` tokens.
+
+        ``on_wait(position, estimated_wait_seconds)`` is called on every poll
+        while queued. Returns a Reservation to settle once the request is
+        over. Raises QuotaTimeout after ``max_wait`` seconds.
+        """
+        if provider not in self.limits:
+            return Reservation()
+        request = (provider, tokens, session_id, priority)
+        ticket = self.enqueue(*request)
+        deadline = time.time() + max_wait
+        try:
+            while True:
+                ticket, position, wait = self._poll(ticket, request)
+                if not position:
+                    return Reservation(self, provider, self._charge(provider, tokens))
+                delay = self._delay(provider, position, wait, deadline, max_wait)
+                if on_wait:
+                    on_wait(position, wait)
+                time.sleep(delay)
+        except BaseException:
+            self.cancel(ticket)
+            raise
+
+    async def acquire_async(self, provider, tokens, session_id, priority=0, on_wait=None,
+                            max_wait=QUOTA_MAX_WAIT_SECONDS):
+        """acquire() for coroutines: SQLite work runs on a worker thread and waits use asyncio.sleep"""
+        if provider not in self.limits:
+            return Reservation()
+        request = (provider, tokens, session_id, priority)
+        ticket = await asyncio.to_thread(self.enqueue, *request)
+        deadline = time.time() + max_wait
+        try:
+            while True:
+                ticket, position, wait = await asyncio.to_thread(self._poll, ticket, request)
+                if not position:
+                    return Reservation(self, provider, self._charge(provider, tokens))
+                delay = self._delay(provider, position, wait, deadline, max_wait)
+                if on_wait:
+                    on_wait(position, wait)
+                await asyncio.sleep(delay)
+        except BaseException:
+            # Not awaited: a second cancellation must not leave the ticket queued
+            self.cancel(ticket)
+            raise
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_quota_scheduler():
+    """Return the shared quota scheduler, or None when QUOTA_ENABLED is off"""
+    global _scheduler
+    if not QUOTA_ENABLED:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = QuotaScheduler(DATA_DIR / QUOTA_FILENAME)
+    return _scheduler
+
+
+def estimate_tokens(prompt, max_output_tokens):
+    """Worst-case token cost of a request: ~4 characters per prompt token plus the full output budget"""
+    return len(prompt) // 4 + max_output_tokens
+
+
+def wait_for_quota(provider, tokens, session_id, priority=0, on_wait=None):
+    """Block until ``provider`` has capacity; returns a Reservation (a no-op one when quotas are disabled)"""
+    scheduler = get_quota_scheduler()
+    if scheduler is None:
+        return Reservation()
+    return scheduler.acquire(provider, tokens, session_id, priority, on_wait)
+
+
+async def wait_for_quota_async(provider, tokens, session_id, priority=0, on_wait=None):
+    scheduler = get_quota_scheduler()
+    if scheduler is None:
+        return Reservation()
+    return await scheduler.acquire_async(provider, tokens, session_id, priority, on_wait)
@@ -0,0 +1,176 @@
+# src/response_cache.py
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    DATA_DIR,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_FILENAME,
+    RESPONSE_CACHE_VARIANTS,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_ENTRIES,
+)
+
+
+class ResponseCache:
+    """On-disk cache of raw LLM story text, keyed on prompt + model settings.
+
+    Each key holds a pool of up to ``variants`` different responses. Until
+    the pool is full every lookup is a miss, so the caller generates (and
+    adds) a new variant; once full, lookups return a random variant. Entries
+    expire after ``ttl_seconds`` and the least recently used ones are evicted
+    once the cache holds more than ``max_entries`` responses.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT NOT NULL,
+        variant INTEGER NOT NULL,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (key, variant)
+    );
+    CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+    CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses (created_at);
+
+    CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        hits INTEGER NOT NULL,
+        misses INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_stats (id, hits, misses) VALUES (1, 0, 0);
+    """
+
+    def __init__(self, path, variants=RESPONSE_CACHE_VARIANTS, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.variants = variants
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(prompt, **settings):
+        """Hash the whitespace-normalised prompt together with the model settings"""
+        normalized = " ".join(prompt.split())
+        payload = json.dumps({"prompt": normalized, "settings": settings}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return a cached response, or None when the caller should generate a new variant"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            rows = conn.execute(
+                "SELECT variant, response FROM responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchall()
+            if len(rows) < self.variants:
+                conn.execute("UPDATE cache_stats SET misses = misses + 1 WHERE id = 1")
+                return None
+
+            variant, response = random.choice(rows)
+            conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ? AND variant = ?", (now, key, variant)
+            )
+            conn.execute("UPDATE cache_stats SET hits = hits + 1 WHERE id = 1")
+            return response
+
+    def put(self, key, response):
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,))
+            variant = conn.execute(
+                "SELECT COALESCE(MAX(variant), -1) + 1 FROM responses WHERE key = ?", (key,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO responses (key, variant, response, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, variant, response, now, now)
+            )
+            # Keep at most `variants` per key, dropping the oldest first
+            conn.execute(
+                """
+                DELETE FROM responses WHERE key = ? AND variant NOT IN (
+                    SELECT variant FROM responses WHERE key = ? ORDER BY created_at DESC LIMIT ?
+                )
+                """,
+                (key, key, self.variants)
+            )
+            conn.execute(
+                """
+                DELETE FROM responses WHERE rowid IN (
+                    SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        conn = self._conn()
+        hits, misses = conn.execute("SELECT hits, misses FROM cache_stats WHERE id = 1").fetchone()
+        entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the shared response cache, or None when RESPONSE_CACHE_ENABLED is off"""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(DATA_DIR / RESPONSE_CACHE_FILENAME)
+    return _cache
+
+
+def lookup_response(prompt, settings):
+    """Return (cache_key, cached_text); both are None when caching is off or unavailable"""
+    try:
+        cache = get_response_cache()
+        if cache is None:
+            return None, None
+        key = cache.make_key(prompt, **settings)
+        return key, cache.get(key)
+    except Exception as e:
+        print(f"Error reading response cache: {str(e)}")
+        return None, None
+
+
+def store_response(cache_key, response):
+    """Add a freshly generated response to its key's variant pool"""
+    if cache_key is None:
+        return
+    try:
+        get_response_cache().put(cache_key, response)
+    except Exception as e:
+        print(f"Error writing response cache: {str(e)}")
@@ -0,0 +1,400 @@
+# src/router.py
+import asyncio
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import deque
+
+import streamlit as st
+
+from .batch import run_bounded
+from .clients import get_api_key
+from .quota import QuotaTimeout
+from .story_counter import claim_story
+from config import (
+    ROUTER_BACKENDS,
+    ROUTER_MODE,
+    ROUTER_WEIGHTS,
+    ROUTER_TIMEOUT_SECONDS,
+    ROUTER_HEDGE_PERCENTILE,
+    ROUTER_HEDGE_DEFAULT_SECONDS,
+    ROUTER_MIN_SAMPLES,
+    ROUTER_LATENCY_WINDOW,
+    ROUTER_COOLDOWN_SECONDS,
+    BATCH_CONCURRENCY,
+    QUOTA_PRIORITY_BATCH,
+    QUOTA_PRIORITY_INTERACTIVE,
+)
+
+BACKEND_KEYS = {"gemini": "GOOGLE_API_KEY", "groq": "GROQ_API_KEY"}
+
+
+class LatencyStats:
+    """Rolling window of successful generation latencies per backend"""
+
+    def __init__(self, window=ROUTER_LATENCY_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, backend, seconds):
+        with self._lock:
+            self._samples.setdefault(backend, deque(maxlen=self.window)).append(seconds)
+
+    def count(self, backend):
+        with self._lock:
+            return len(self._samples.get(backend, ()))
+
+    def percentile(self, backend, pct):
+        with self._lock:
+            samples = sorted(self._samples.get(backend, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, round(pct / 100 * (len(samples) - 1)))]
+
+    def summary(self):
+        with self._lock:
+            backends = list(self._samples)
+        return {
+            backend: {
+                "count": self.count(backend),
+                "p50": self.percentile(backend, 50),
+                "p95": self.percentile(backend, 95),
+            }
+            for backend in backends
+        }
+
+
+class StoryRouter:
+    """Send story requests to the Gemini and Groq generators behind one interface.
+
+    ``backends`` maps backend name to generator, primary first. Modes:
+
+    - "failover": try backends in order, moving on after an error or
+      ``timeout`` seconds.
+    - "hedged": start the primary, and if it has not answered by its
+      observed p95 latency, start the next backend too; the first story
+      back wins and the other request is cancelled.
+    - "weighted": pick the first backend at random by ``weights`` to spread
+      load, then fail over like "failover".
+
+    A backend that failed recently is tried last until its cooldown passes.
+    Every story comes back in the generators' shared schema with
+    ``metadata["backend"]`` naming the provider that wrote it. Backends
+    return stories unclaimed; only the one handed back gets an ID and
+    joins the duplicate index.
+    """
+
+    def __init__(self, backends, mode=ROUTER_MODE, weights=ROUTER_WEIGHTS, timeout=ROUTER_TIMEOUT_SECONDS):
+        if mode not in ("failover", "hedged", "weighted"):
+            raise ValueError(f"Unknown router mode: {mode}")
+        self.backends = backends
+        self.mode = mode
+        self.weights = weights
+        self.timeout = timeout
+        self.stats = LatencyStats()
+        self._failed_at = {}
+        self._lock = threading.Lock()  # _failed_at is written from the router loop and session threads
+
+    def _order(self):
+        names = list(self.backends)
+        if self.mode == "weighted" and len(names) > 1:
+            first = random.choices(names, weights=[self.weights.get(name, 1) for name in names])[0]
+            names = [first] + [name for name in names if name != first]
+
+        now = time.time()
+        with self._lock:
+            failed_at = dict(self._failed_at)
+        healthy = [name for name in names if now - failed_at.get(name, 0) > ROUTER_COOLDOWN_SECONDS]
+        return healthy + [name for name in names if name not in healthy]
+
+    def _mark_failed(self, name, error):
+        with self._lock:
+            self._failed_at[name] = time.time()
+        print(f"Backend {name} failed: {type(error).__name__}: {error}")
+
+    def hedge_delay(self, backend):
+        """Seconds to wait on ``backend`` before hedging: its observed p95, or a default until enough samples"""
+        if self.stats.count(backend) < ROUTER_MIN_SAMPLES:
+            return ROUTER_HEDGE_DEFAULT_SECONDS
+        return self.stats.percentile(backend, ROUTER_HEDGE_PERCENTILE)
+
+    async def _attempt(self, name, story_params, session_id, priority, on_wait=None, on_duplicate=None):
+        start = time.perf_counter()
+        granted = asyncio.get_running_loop().create_future()
+
+        def on_granted():
+            if not granted.done():
+                granted.set_result(None)
+
+        task = asyncio.ensure_future(self.backends[name].generate_async(
+            story_params, session_id, priority, on_wait, on_duplicate, claim=False, on_granted=on_granted
+        ))
+        try:
+            # The timeout starts once quota is granted; time queued for quota is bounded by the scheduler
+            await asyncio.wait([task, granted], return_when=asyncio.FIRST_COMPLETED)
+            story_data = await asyncio.wait_for(task, self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except QuotaTimeout:
+            # Waiting for our own rate limit says nothing about the backend's health
+            raise
+        except Exception as e:
+            self._mark_failed(name, e)
+            raise
+        finally:
+            if not task.done():
+                task.cancel()
+        self.stats.record(name, time.perf_counter() - start)
+        story_data['metadata']['backend'] = name
+        return story_data
+
+    async def route(self, story_params, session_id="batch", priority=QUOTA_PRIORITY_BATCH,
+                    on_wait=None, on_duplicate=None, claim=True):
+        """Generate one story according to the routing mode; raises if every backend fails.
+
+        ``on_wait`` and ``on_duplicate`` are passed on to the backends'
+        generate_async. With ``claim`` False the story is returned
+        unclaimed, for the caller to pass to claim_story when it is served.
+        """
+        order = self._order()
+        callbacks = (on_wait, on_duplicate)
+        if self.mode == "hedged" and len(order) > 1:
+            story_data = await self._hedged(order, story_params, session_id, priority, callbacks)
+        else:
+            story_data = await self._failover(order, story_params, session_id, priority, callbacks)
+        return claim_story(story_data) if claim else story_data
+
+    async def _failover(self, order, story_params, session_id, priority, callbacks):
+        last_error = None
+        for name in order:
+            try:
+                return await self._attempt(name, story_params, session_id, priority, *callbacks)
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    async def _hedged(self, order, story_params, session_id, priority, callbacks):
+        remaining = list(order)
+        tasks = {}
+
+        def launch():
+            name = remaining.pop(0)
+            tasks[asyncio.ensure_future(self._attempt(name, story_params, session_id, priority, *callbacks))] = name
+            # Hedge again after this backend's p95, or just wait once nothing is left to launch
+            return self.hedge_delay(name) if remaining else None
+
+        hedge_after = launch()
+        last_error = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_after = launch()
+                    continue
+                for task in done:
+                    tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                # A failure hands over at once rather than waiting out the hedge delay
+                if not tasks and remaining:
+                    hedge_after = launch()
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def generate_many(self, params_list, concurrency=BATCH_CONCURRENCY, claim=True):
+        """Routed equivalent of the generators' generate_many"""
+        return await run_bounded(params_list, lambda story_params: self.route(story_params, claim=claim), concurrency)
+
+    def generate_batch(self, params_list, concurrency=BATCH_CONCURRENCY, claim=True):
+        """Blocking generate_many for background threads that have no event loop of their own"""
+        return _run(self.generate_many(params_list, concurrency, claim))
+
+    def generate_story(self, story_params):
+        """Generate a story for the current session; shows an error and returns None if every backend fails.
+
+        The request runs on the router's loop; its quota queue position and
+        near-duplicate warning come back through a queue and are drawn here,
+        on the session's own thread.
+        """
+        events = queue.SimpleQueue()
+        status = st.empty()
+        future = _submit(self.route(
+            story_params, _session_id(), QUOTA_PRIORITY_INTERACTIVE,
+            on_wait=lambda position, wait: events.put(("wait", (position, wait))),
+            on_duplicate=lambda score: events.put(("duplicate", score)),
+        ))
+        try:
+            while True:
+                done = future.done()
+                try:
+                    event, value = events.get(timeout=0 if done else 0.1)
+                except queue.Empty:
+                    if done:
+                        break
+                    continue
+                if event == "wait":
+                    position, wait = value
+                    status.info(f"⏳ Lots of stories are being written right now. You are number {position} in line (about {wait:.0f}s).")
+                else:
+                    st.warning(f"Generated story is similar to a previous one (similarity={value:.2f}). Retrying may help.")
+            return future.result()
+        except Exception as e:
+            st.error(f"Error generating story: {str(e)}")
+            return None
+        finally:
+            status.empty()
+
+    def generate_story_stream(self, story_params):
+        """Stream from the first healthy backend, failing over if it breaks before its first page.
+
+        A backend that sends nothing within ``timeout`` seconds is skipped
+        too. Backend errors are collected rather than shown, and only the
+        last one is reported, if no backend produces a story. Hedging races
+        whole responses, so in hedged mode the winning story's pages are
+        replayed once it is complete.
+        """
+        if self.mode == "hedged" and len(self.backends) > 1:
+            story_data = self.generate_story(story_params)
+            if story_data:
+                yield "title", story_data['metadata']['title']
+                for page in story_data['story']:
+                    yield "page", page
+            yield "done", story_data
+            return
+
+        errors = []
+        for name in self._order():
+            start = time.perf_counter()
+            emitted = False
+            failures = len(errors)
+            try:
+                for event, value in self._stream_from(name, story_params, errors.append):
+                    if event != "done":
+                        emitted = True
+                        yield event, value
+                    elif value is not None:
+                        self.stats.record(name, time.perf_counter() - start)
+                        value['metadata']['backend'] = name
+                        yield "done", value
+                        return
+            except TimeoutError as e:
+                errors.append(e)
+            if len(errors) == failures:
+                errors.append(RuntimeError(f"{name} returned no story"))
+            if not isinstance(errors[-1], QuotaTimeout):
+                self._mark_failed(name, errors[-1])
+            if emitted:
+                # Pages from this backend are already on screen; don't mix in another story
+                break
+        if errors:
+            st.error(f"Error generating story: {str(errors[-1])}")
+        yield "done", None
+
+    def _stream_from(self, name, story_params, on_error):
+        """Yield a backend's generate_story_stream events, read on a worker thread.
+
+        Once quota is granted, raises TimeoutError if the backend goes
+        ``timeout`` seconds without an event, before the first page or
+        mid-stream. A worker left behind stops at its next event.
+        """
+        events = queue.SimpleQueue()
+        stop = threading.Event()
+
+        def produce():
+            stream = self.backends[name].generate_story_stream(
+                story_params, on_error=on_error, on_granted=lambda: events.put(("granted", None))
+            )
+            try:
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    events.put(event)
+            except Exception as e:
+                on_error(e)
+                events.put(("done", None))
+            finally:
+                stream.close()
+
+        worker = threading.Thread(target=produce, name=f"story-stream-{name}", daemon=True)
+        _attach_session(worker)
+        worker.start()
+        try:
+            # No deadline while queued for quota: the scheduler bounds that wait itself
+            started = False
+            while True:
+                try:
+                    event = events.get(timeout=self.timeout if started else None)
+                except queue.Empty:
+                    raise TimeoutError(f"{name} sent nothing for {self.timeout}s") from None
+                started = True
+                if event[0] == "granted":
+                    continue
+                yield event
+                if event[0] == "done":
+                    return
+        finally:
+            stop.set()
+
+
+def _session_id():
+    return st.session_state.setdefault("quota_session_id", uuid.uuid4().hex)
+
+
+def _attach_session(thread):
+    """Let ``thread`` use the current Streamlit session (st.session_state, status messages)"""
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+    add_script_run_ctx(thread, get_script_run_ctx())
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _submit(coro):
+    """Schedule a coroutine on the router's long-lived event loop; returns a concurrent.futures.Future.
+
+    The provider SDKs' async clients are tied to the loop they were first
+    used on, so every UI request shares one background loop rather than
+    starting a fresh one with asyncio.run.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="story-router", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _loop)
+
+
+def _run(coro):
+    """Run a coroutine on the router's loop and wait for its result"""
+    return _submit(coro).result()
+
+
+def _create_generator(name):
+    if name == "groq":
+        from .groq_story import StoryGenerator
+    elif name == "gemini":
+        from .story_generator import StoryGenerator
+    else:
+        raise ValueError(f"Unknown backend: {name}")
+    return StoryGenerator()
+
+
+def build_router():
+    """Router over every backend in ROUTER_BACKENDS that has an API key configured"""
+    backends = {
+        name: _create_generator(name) for name in ROUTER_BACKENDS if get_api_key(BACKEND_KEYS[name])
+    }
+    if not backends:
+        # Build the primary anyway so it shows its missing-key warning
+        backends[ROUTER_BACKENDS[0]] = _create_generator(ROUTER_BACKENDS[0])
+    return StoryRouter(backends)
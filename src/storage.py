@@ -0,0 +1,900 @@
+# src/storage.py
+import copy
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .wal import WriteAheadLog
+from .library_file import MappedLibrary, current_generation, make_current, publish_library
+from .compression import StoryCodec, train_dictionary
+from config import BACKUP_FILENAME, WAL_SNAPSHOT_RECORDS, STORY_COMPRESSION, STORY_DICT_SAMPLE
+
+
+SUMMARY_FIELDS = ("title", "genre", "age_group", "created_at")
+FACET_FIELDS = ("genre", "age_group", "gender")
+SORT_ORDERS = {
+    "newest": "created_at DESC",
+    "oldest": "created_at ASC",
+    "title": "title COLLATE NOCASE ASC",
+}
+
+
+def _summary(story_id, metadata):
+    """Lightweight metadata projection used for library listings"""
+    summary = {field: metadata.get(field) for field in SUMMARY_FIELDS}
+    summary["id"] = story_id
+    return summary
+
+
+def _matches(metadata, filters):
+    """Check a story's metadata against a filters dict (linear-scan fallback).
+
+    None means "no filter"; '' matches stories with the field missing or blank.
+    """
+    for field in FACET_FIELDS:
+        if filters.get(field) is not None and (metadata.get(field) or '') != filters[field]:
+            return False
+    created_at = metadata.get('created_at') or ''
+    if filters.get('created_from') is not None and created_at < filters['created_from']:
+        return False
+    if filters.get('created_to') is not None and created_at >= filters['created_to']:
+        return False
+    return True
+
+
+def _public(story_data):
+    """A stored story as callers see it, without the store's insert sequence"""
+    return {"story": story_data['story'], "metadata": story_data['metadata']}
+
+
+def _story_text(story_pages):
+    return "\n".join(page.get('content', '') for page in story_pages)
+
+
+def _parse_search(query):
+    """Split a search box string into terms and "quoted phrases" (lowercased)"""
+    return [
+        (phrase or term).replace('"', '').lower()
+        for phrase, term in re.findall(r'"([^"]+)"|(\S+)', query)
+        if (phrase or term).replace('"', '').strip()
+    ]
+
+
+def json_log_dir(path):
+    """Directory holding the write-ahead log segments of a JSON store"""
+    path = Path(path)
+    return path.with_name(f"{path.name}.wal")
+
+
+def json_library_dir(path):
+    """Directory holding the mapped library generations of a JSON store"""
+    path = Path(path)
+    return path.with_name(f"{path.name}.lib")
+
+
+def json_store_exists(path):
+    """Whether a JSON store (in any of its file layouts) has been written at ``path``"""
+    return Path(path).exists() or json_log_dir(path).exists() or json_library_dir(path).exists()
+
+
+def _sort_key(sort):
+    if sort == "title":
+        return lambda item: (item[1]['metadata'].get('title') or '').lower()
+    return lambda item: item[1]['metadata'].get('created_at') or ''
+
+
+class JSONStoryStore:
+    """Original JSON backend, made crash-safe with a write-ahead log and read through a memory map.
+
+    The library lives in a read-only, offset-indexed generation file
+    (``MappedLibrary``) that every process maps and shares through the page
+    cache, so reading one story parses only that story. Saves and deletes
+    are appended to a log of JSON-lines segments (fsynced in small groups
+    by ``WriteAheadLog``) and kept in a small in-memory overlay. Once
+    WAL_SNAPSHOT_RECORDS have built up, a new generation is published,
+    atomically swapped in, and the covered segments are dropped. Opening a
+    store replays only the log tail; afterwards each read just replays
+    whatever was appended since.
+
+    Every story carries an insert sequence, kept when it is overwritten;
+    the highest one issued is tracked through the log and stored in each
+    generation's header, so a deleted story's number is never handed out
+    again. A ``stories.json`` from before this format is read as the
+    starting point until the first generation is published. One process
+    should write at a time, as with the original file.
+    """
+
+    def __init__(self, path, snapshot_records=WAL_SNAPSHOT_RECORDS):
+        self.path = Path(path)
+        self.library_dir = json_library_dir(self.path)
+        self.log = WriteAheadLog(json_log_dir(self.path))
+        self.snapshot_records = snapshot_records
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._generation = None
+        self._library = None
+        self._legacy = {}
+        self._overlay = {}
+        self._positions = {}
+        self._unsnapshotted = 0
+        self._sequence = 0
+
+    def _read_legacy(self):
+        if not self.path.exists():
+            return {}
+        # A parse error is real damage; raise rather than load an empty library
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _apply(self, record):
+        if record['op'] == "put":
+            sequence = record.get('sequence') or 0
+            self._overlay[record['id']] = {"story": record['story'], "metadata": record['metadata'], "sequence": sequence}
+            self._sequence = max(self._sequence, sequence)
+        elif record['op'] == "delete":
+            self._overlay[record['id']] = None
+
+    def _refresh(self):
+        """Bring the store up to date with the current generation and the unread log tail"""
+        with self._lock:
+            while True:
+                generation = current_generation(self.library_dir)
+                segments = set(self.log.segments())
+                # A new generation, or segments gone from under us, means another writer compacted: start over
+                if not self._loaded or generation != self._generation or not segments.issuperset(self._positions):
+                    try:
+                        self._library = MappedLibrary(self.library_dir / generation) if generation else None
+                    except FileNotFoundError:
+                        continue  # already superseded and cleaned up
+                    self._legacy = {} if self._library else self._read_legacy()
+                    self._generation = generation
+                    self._overlay = {}
+                    self._positions = {}
+                    self._unsnapshotted = 0
+                    self._sequence = self._library.sequence if self._library else 0
+                    self._loaded = True
+                try:
+                    positions, replayed = self.log.replay(self._positions, self._apply)
+                except FileNotFoundError:
+                    # A compaction dropped a segment while we read it
+                    self._loaded = False
+                    continue
+                if current_generation(self.library_dir) != generation:
+                    # Published while we replayed: records in segments dropped before we listed them are missing
+                    self._loaded = False
+                    continue
+                self._positions = positions
+                self._unsnapshotted += replayed
+                return
+
+    def _lookup(self, story_id):
+        """A story as stored (with its insert sequence, if it has one), or None"""
+        self._refresh()
+        if story_id in self._overlay:
+            return copy.deepcopy(self._overlay[story_id])
+        if story_id in self._legacy:
+            return copy.deepcopy(self._legacy[story_id])
+        return self._library.get(story_id) if self._library else None
+
+    def _assign_sequences(self, records):
+        """Number put records: a story keeps its sequence when overwritten, new stories get the next ones"""
+        assigned = {}
+        for record in records:
+            if record['op'] != "put":
+                continue
+            if record['id'] not in assigned:
+                existing = self._lookup(record['id'])
+                sequence = existing.get('sequence') if existing else None
+                if not sequence:
+                    self._sequence += 1
+                    sequence = self._sequence
+                assigned[record['id']] = sequence
+            record['sequence'] = assigned[record['id']]
+
+    def _items(self):
+        """Yield (story_id, story_data) for every story, parsing mapped stories one at a time"""
+        with self._lock:
+            self._refresh()
+            library, legacy, overlay = self._library, self._legacy, dict(self._overlay)
+        base = library.items() if library else legacy.items()
+        for story_id, story_data in base:
+            if story_id not in overlay:
+                yield story_id, story_data
+        for story_id, story_data in overlay.items():
+            if story_data is not None:
+                yield story_id, story_data
+
+    def _read_all(self):
+        return {story_id: _public(story_data) for story_id, story_data in self._items()}
+
+    def version(self):
+        """Changes whenever any process saves, deletes or publishes a generation"""
+        generation = current_generation(self.library_dir)
+        segments = []
+        for name in self.log.segments():
+            try:
+                segments.append((name, (self.log.directory / name).stat().st_size))
+            except FileNotFoundError:
+                pass  # compacted away since the listing; CURRENT has already moved on
+        segments = tuple(segments)
+        legacy = None
+        if generation is None and self.path.exists():
+            stat = self.path.stat()
+            legacy = (stat.st_mtime_ns, stat.st_size)
+        return generation, legacy, segments
+
+    def _append(self, records):
+        with self._lock:
+            self._refresh()
+            self._assign_sequences(records)
+            ticket = self.log.write(records)
+            self._refresh()
+        # Wait for the fsync outside the store lock so concurrent saves can share it
+        self.log.sync(ticket)
+        if self._unsnapshotted >= self.snapshot_records:
+            with self._lock:
+                if self._unsnapshotted >= self.snapshot_records:
+                    self.compact()
+
+    def put(self, story_id, story_pages, metadata):
+        self.put_many([(story_id, story_pages, metadata)])
+
+    def put_many(self, items):
+        # One log append and one fsync for the whole batch
+        records = [
+            {"op": "put", "id": story_id, "story": story_pages, "metadata": metadata}
+            for story_id, story_pages, metadata in items
+        ]
+        if records:
+            self._append(records)
+
+    def get(self, story_id):
+        story_data = self._lookup(story_id)
+        return _public(story_data) if story_data else None
+
+    def delete(self, story_id):
+        with self._lock:
+            if self._lookup(story_id) is None:
+                return False
+            self._append([{"op": "delete", "id": story_id}])
+            return True
+
+    def all(self):
+        return self._read_all()
+
+    def compact(self):
+        """Publish the library as a new generation and drop the log segments it covers"""
+        with self._lock:
+            self._refresh()
+            covered = self.log.rotate()
+            publish_library(self.library_dir, self._items(), self._sequence)
+            self.log.remove(covered)
+            self._loaded = False
+
+    def backup(self, backup_dir):
+        """Incremental backup into ``backup_dir``; returns the number of bytes copied.
+
+        The current generation is copied only when a new one has been
+        published since the last backup; otherwise only the log bytes
+        appended since then are copied. ``restore_json_backup`` turns the
+        directory back into a store.
+        """
+        backup_dir = Path(backup_dir)
+        log_dir = backup_dir / json_log_dir(self.path).name
+        log_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = backup_dir / "manifest.json"
+        manifest = {"snapshot": None, "segments": {}}
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+        copied = 0
+        with self._lock:
+            self.log.sync(self.log.write([]))
+            generation = current_generation(self.library_dir)
+            # Before the first generation the snapshot is the legacy stories.json
+            source, snapshot = (self.library_dir / generation, generation) if generation else (self.path, BACKUP_FILENAME)
+            segments = {name: (self.log.directory / name).stat().st_size for name in self.log.segments()}
+            if source.exists() and snapshot != manifest["snapshot"]:
+                temp_path = backup_dir / f"{snapshot}.tmp"
+                shutil.copyfile(source, temp_path)
+                os.replace(temp_path, backup_dir / snapshot)
+                copied += source.stat().st_size
+                if manifest["snapshot"]:
+                    (backup_dir / manifest["snapshot"]).unlink(missing_ok=True)
+                manifest["snapshot"] = snapshot
+
+            # Segments compacted into the snapshot are no longer needed in the backup either
+            for name in list(manifest["segments"]):
+                if name not in segments:
+                    (log_dir / name).unlink(missing_ok=True)
+                    del manifest["segments"][name]
+            for name, size in segments.items():
+                have = manifest["segments"].get(name, 0)
+                if size > have:
+                    with open(self.log.directory / name, 'rb') as src, open(log_dir / name, 'ab') as dst:
+                        dst.truncate(have)
+                        src.seek(have)
+                        shutil.copyfileobj(src, dst)
+                    copied += size - have
+                    manifest["segments"][name] = size
+
+        temp_path = manifest_path.with_name("manifest.json.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, manifest_path)
+        return copied
+
+    def iter_stories(self, filters=None, batch_size=500):
+        """Yield (story_id, story_data) for matching stories, parsing one story at a time"""
+        for story_id, story_data in self._items():
+            if _matches(story_data['metadata'], filters or {}):
+                yield story_id, _public(story_data)
+
+    def iter_new_stories(self, after_sequence=None, filters=None, batch_size=500):
+        """Yield (sequence, story_id, story_data) for matching stories inserted after ``after_sequence``.
+
+        Stories from before insert sequences have sequence 0. With
+        ``after_sequence`` None every matching story is yielded.
+        """
+        for story_id, story_data in self._items():
+            sequence = story_data.get('sequence') or 0
+            if after_sequence is not None and sequence <= after_sequence:
+                continue
+            if _matches(story_data['metadata'], filters or {}):
+                yield sequence, story_id, _public(story_data)
+
+    def _filtered(self, filters):
+        return [
+            (story_id, story_data) for story_id, story_data in self._items()
+            if _matches(story_data['metadata'], filters or {})
+        ]
+
+    def count(self, filters=None):
+        return len(self._filtered(filters))
+
+    def list_summaries(self, offset, limit, filters=None, sort="newest"):
+        stories = sorted(self._filtered(filters), key=_sort_key(sort), reverse=(sort == "newest"))
+        return [
+            _summary(story_id, story_data['metadata'])
+            for story_id, story_data in stories[offset:offset + limit]
+        ]
+
+    def search(self, query, offset, limit, filters=None):
+        terms = _parse_search(query)
+        if not terms:
+            return [], 0
+
+        scored = []
+        for story_id, story_data in self._filtered(filters):
+            metadata = story_data['metadata']
+            text = " ".join([
+                metadata.get('title') or '',
+                metadata.get('description') or '',
+                _story_text(story_data['story'])
+            ]).lower()
+            hits = [text.count(term) for term in terms]
+            if all(hits):
+                scored.append((sum(hits), story_id, metadata))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        results = [_summary(story_id, metadata) for _, story_id, metadata in scored[offset:offset + limit]]
+        return results, len(scored)
+
+    def facet_counts(self):
+        counts = {field: {} for field in FACET_FIELDS}
+        for _, story_data in self._items():
+            for field in FACET_FIELDS:
+                value = story_data['metadata'].get(field) or ''
+                counts[field][value] = counts[field].get(value, 0) + 1
+        return counts
+
+
+class SQLiteStoryStore:
+    """Embedded SQLite backend keyed on metadata.id.
+
+    Every story is one row, so inserting, reading or deleting a story only
+    touches that row and the primary-key index instead of the whole library.
+    Secondary indexes on the filterable metadata columns, and a
+    trigger-maintained ``facet_counts`` table holding one counter per
+    (genre, age_group, gender) combination, are updated by SQLite as part of
+    each write, so filtering and facet counts never rebuild anything.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS stories (
+        id TEXT PRIMARY KEY,
+        title TEXT,
+        genre TEXT,
+        gender TEXT,
+        age_group TEXT,
+        created_at TEXT,
+        metadata TEXT NOT NULL,
+        story TEXT NOT NULL,  -- deflate BLOB (see compression.py), or JSON text from older versions
+        seq INTEGER           -- insert sequence, set by the stories_sequence trigger
+    );
+
+    -- Highest insert sequence issued; unlike rowid it never goes back when the newest story is deleted
+    CREATE TABLE IF NOT EXISTS story_sequence (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        value INTEGER NOT NULL
+    );
+
+    -- Preset dictionaries for story bodies; the newest one is used for new writes
+    CREATE TABLE IF NOT EXISTS story_dictionaries (
+        id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- created_at follows the leading column so filtered pages come back in
+    -- date order, and the trailing columns let counts stay index-only
+    CREATE INDEX IF NOT EXISTS idx_stories_created_at ON stories (created_at);
+    CREATE INDEX IF NOT EXISTS idx_stories_genre ON stories (genre, created_at, age_group, gender);
+    CREATE INDEX IF NOT EXISTS idx_stories_age_group ON stories (age_group, created_at, gender);
+    CREATE INDEX IF NOT EXISTS idx_stories_gender ON stories (gender, created_at);
+    CREATE INDEX IF NOT EXISTS idx_stories_title ON stories (title COLLATE NOCASE);
+
+    CREATE TABLE IF NOT EXISTS facet_counts (
+        genre TEXT NOT NULL,
+        age_group TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (genre, age_group, gender)
+    ) WITHOUT ROWID;
+
+    -- Full-text index over title, description and page text, row-aligned
+    -- with stories.rowid and maintained by put/delete
+    CREATE VIRTUAL TABLE IF NOT EXISTS stories_fts USING fts5(
+        title, description, content, tokenize = 'porter unicode61'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS stories_facets_insert AFTER INSERT ON stories BEGIN
+        INSERT INTO facet_counts
+        VALUES (COALESCE(NEW.genre, ''), COALESCE(NEW.age_group, ''), COALESCE(NEW.gender, ''), 1)
+        ON CONFLICT(genre, age_group, gender) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stories_facets_delete AFTER DELETE ON stories BEGIN
+        UPDATE facet_counts SET count = count - 1
+        WHERE genre = COALESCE(OLD.genre, '') AND age_group = COALESCE(OLD.age_group, '')
+            AND gender = COALESCE(OLD.gender, '');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS stories_facets_update
+    AFTER UPDATE OF genre, age_group, gender ON stories BEGIN
+        UPDATE facet_counts SET count = count - 1
+        WHERE genre = COALESCE(OLD.genre, '') AND age_group = COALESCE(OLD.age_group, '')
+            AND gender = COALESCE(OLD.gender, '');
+        INSERT INTO facet_counts
+        VALUES (COALESCE(NEW.genre, ''), COALESCE(NEW.age_group, ''), COALESCE(NEW.gender, ''), 1)
+        ON CONFLICT(genre, age_group, gender) DO UPDATE SET count = count + 1;
+    END;
+    """
+
+    def __init__(self, path, compress=STORY_COMPRESSION):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compress = compress
+        self._local = threading.local()
+        self._codec = StoryCodec()
+        self._codec_lock = threading.Lock()
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.executescript(self.SCHEMA)
+            self._load_codec(conn)
+            self._backfill_facets(conn)
+            self._backfill_search(conn)
+            self._backfill_sequence(conn)
+
+    @staticmethod
+    def _backfill_facets(conn):
+        # Databases created before facet_counts existed need a one-off fill
+        has_facets = conn.execute("SELECT 1 FROM facet_counts LIMIT 1").fetchone()
+        has_stories = conn.execute("SELECT 1 FROM stories LIMIT 1").fetchone()
+        if has_facets or not has_stories:
+            return
+        conn.execute(
+            """
+            INSERT INTO facet_counts
+            SELECT COALESCE(genre, ''), COALESCE(age_group, ''), COALESCE(gender, ''), COUNT(*)
+            FROM stories GROUP BY 1, 2, 3
+            """
+        )
+
+    @staticmethod
+    def _backfill_sequence(conn):
+        # Databases created before insert sequences get the column, numbered in rowid order
+        if "seq" not in {row[1] for row in conn.execute("PRAGMA table_info(stories)")}:
+            conn.execute("ALTER TABLE stories ADD COLUMN seq INTEGER")
+        conn.execute("UPDATE stories SET seq = rowid WHERE seq IS NULL")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stories_seq ON stories (seq)")
+        conn.execute(
+            "INSERT OR IGNORE INTO story_sequence (id, value) SELECT 1, COALESCE(MAX(seq), 0) FROM stories"
+        )
+        # Upserts that update an existing row don't fire AFTER INSERT, so a story keeps its number
+        conn.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS stories_sequence AFTER INSERT ON stories BEGIN
+                UPDATE story_sequence SET value = value + 1 WHERE id = 1;
+                UPDATE stories SET seq = (SELECT value FROM story_sequence WHERE id = 1) WHERE rowid = NEW.rowid;
+            END
+            """
+        )
+
+    def _backfill_search(self, conn):
+        # Databases created before stories_fts existed get indexed once
+        has_index = conn.execute("SELECT 1 FROM stories_fts LIMIT 1").fetchone()
+        if has_index:
+            return
+        rows = conn.execute("SELECT rowid, metadata, story FROM stories").fetchall()
+        for rowid, metadata, story in rows:
+            self._index_text(conn, rowid, self._decode(story), json.loads(metadata))
+
+    @staticmethod
+    def _index_text(conn, rowid, story_pages, metadata):
+        conn.execute("DELETE FROM stories_fts WHERE rowid = ?", (rowid,))
+        conn.execute(
+            "INSERT INTO stories_fts (rowid, title, description, content) VALUES (?, ?, ?, ?)",
+            (rowid, metadata.get('title') or '', metadata.get('description') or '', _story_text(story_pages))
+        )
+
+    def _conn(self):
+        # Streamlit serves each session on its own thread, so keep one
+        # connection per thread rather than sharing a single handle.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        """Changes whenever any connection, in this process or another, commits a write"""
+        with self._version_lock:
+            # data_version only moves for commits by *other* connections, so this one never writes
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_codec(self, conn=None):
+        """Re-read the dictionaries table, so ones added by another process are picked up"""
+        rows = (conn or self._conn()).execute("SELECT id, data FROM story_dictionaries").fetchall()
+        with self._codec_lock:
+            self._codec = StoryCodec(dict(rows), max((row[0] for row in rows), default=0))
+        return self._codec
+
+    def _encode(self, conn, story_pages):
+        if not self.compress:
+            return json.dumps(story_pages, ensure_ascii=False)
+        codec = self._codec
+        # Cheap check inside the write transaction: switch to a newly trained dictionary
+        newest = conn.execute("SELECT MAX(id) FROM story_dictionaries").fetchone()[0] or 0
+        if newest != codec.current_id:
+            codec = self._load_codec(conn)
+        return codec.compress(story_pages)
+
+    def _decode(self, story):
+        """A stored story body as its page list (decompressed per story, on read)"""
+        try:
+            return self._codec.decompress(story)
+        except KeyError:
+            return self._load_codec().decompress(story)
+
+    def _row(self, conn, story_id, story_pages, metadata):
+        return (
+            story_id,
+            metadata.get('title'),
+            metadata.get('genre'),
+            metadata.get('gender'),
+            metadata.get('age_group'),
+            metadata.get('created_at'),
+            json.dumps(metadata, ensure_ascii=False),
+            self._encode(conn, story_pages),
+        )
+
+    def put(self, story_id, story_pages, metadata):
+        self.put_many([(story_id, story_pages, metadata)])
+
+    def put_many(self, items):
+        conn = self._conn()
+        with conn:
+            for story_id, story_pages, metadata in items:
+                conn.execute(
+                    """
+                    INSERT INTO stories (id, title, genre, gender, age_group, created_at, metadata, story)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        title=excluded.title, genre=excluded.genre, gender=excluded.gender,
+                        age_group=excluded.age_group, created_at=excluded.created_at,
+                        metadata=excluded.metadata, story=excluded.story
+                    """,
+                    self._row(conn, story_id, story_pages, metadata)
+                )
+                rowid = conn.execute("SELECT rowid FROM stories WHERE id = ?", (story_id,)).fetchone()[0]
+                self._index_text(conn, rowid, story_pages, metadata)
+
+    def get(self, story_id):
+        row = self._conn().execute(
+            "SELECT metadata, story FROM stories WHERE id = ?", (story_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"story": self._decode(row[1]), "metadata": json.loads(row[0])}
+
+    def delete(self, story_id):
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT rowid FROM stories WHERE id = ?", (story_id,)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM stories_fts WHERE rowid = ?", row)
+            conn.execute("DELETE FROM stories WHERE rowid = ?", row)
+        return True
+
+    def all(self):
+        rows = self._conn().execute("SELECT id, metadata, story FROM stories ORDER BY rowid")
+        return {
+            story_id: {"story": self._decode(story), "metadata": json.loads(metadata)}
+            for story_id, metadata, story in rows
+        }
+
+    def iter_stories(self, filters=None, batch_size=500):
+        """Yield (story_id, story_data) for matching stories, reading ``batch_size`` rows at a time.
+
+        Pages through the table by rowid, so memory stays flat however large
+        the library is and no read transaction is held between batches.
+        """
+        where, params = self._where(filters)
+        where = f"{where} AND rowid > ?" if where else "WHERE rowid > ?"
+        last_rowid = 0
+        while True:
+            rows = self._conn().execute(
+                f"SELECT rowid, id, metadata, story FROM stories {where} ORDER BY rowid LIMIT ?",
+                params + [last_rowid, batch_size]
+            ).fetchall()
+            for last_rowid, story_id, metadata, story in rows:
+                yield story_id, {"story": self._decode(story), "metadata": json.loads(metadata)}
+            if len(rows) < batch_size:
+                return
+
+    def iter_new_stories(self, after_sequence=None, filters=None, batch_size=500):
+        """Yield (sequence, story_id, story_data) for matching stories inserted after ``after_sequence``.
+
+        Pages through the seq index ``batch_size`` rows at a time; with
+        ``after_sequence`` None every matching story is yielded.
+        """
+        where, params = self._where(filters)
+        where = f"{where} AND seq > ?" if where else "WHERE seq > ?"
+        last_sequence = -1 if after_sequence is None else after_sequence
+        while True:
+            rows = self._conn().execute(
+                f"SELECT seq, id, metadata, story FROM stories {where} ORDER BY seq LIMIT ?",
+                params + [last_sequence, batch_size]
+            ).fetchall()
+            for last_sequence, story_id, metadata, story in rows:
+                yield last_sequence, story_id, {"story": self._decode(story), "metadata": json.loads(metadata)}
+            if len(rows) < batch_size:
+                return
+
+    @staticmethod
+    def _where(filters, columns=FACET_FIELDS):
+        clauses, params = [], []
+        filters = filters or {}
+        for field, column in zip(FACET_FIELDS, columns):
+            if filters.get(field) == '':
+                # "Unknown" in the library filters; facet_counts stores these as ''
+                clauses.append(f"({column} = '' OR {column} IS NULL)")
+            elif filters.get(field) is not None:
+                clauses.append(f"{column} = ?")
+                params.append(filters[field])
+        if filters.get('created_from') is not None:
+            clauses.append("created_at >= ?")
+            params.append(filters['created_from'])
+        if filters.get('created_to') is not None:
+            clauses.append("created_at < ?")
+            params.append(filters['created_to'])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def count(self, filters=None):
+        filters = filters or {}
+        if filters.get('created_from') is not None or filters.get('created_to') is not None:
+            where, params = self._where(filters)
+            return self._conn().execute(f"SELECT COUNT(*) FROM stories {where}", params).fetchone()[0]
+
+        # Without a date range the answer is a sum over at most a few hundred counters
+        where, params = self._where(filters)
+        return self._conn().execute(
+            f"SELECT COALESCE(SUM(count), 0) FROM facet_counts {where}", params
+        ).fetchone()[0]
+
+    def list_summaries(self, offset, limit, filters=None, sort="newest"):
+        filters = filters or {}
+        has_range = filters.get('created_from') is not None or filters.get('created_to') is not None
+        if sort == "title" and not has_range:
+            # Unary + keeps the planner walking the title index in order
+            # instead of sorting every row matched by a facet index
+            where, params = self._where(filters, columns=[f"+{field}" for field in FACET_FIELDS])
+        else:
+            where, params = self._where(filters)
+        order = SORT_ORDERS.get(sort, SORT_ORDERS["newest"])
+        rows = self._conn().execute(
+            f"""
+            SELECT id, title, genre, age_group, created_at FROM stories
+            {where} ORDER BY {order} LIMIT ? OFFSET ?
+            """,
+            params + [limit, offset]
+        )
+        return [
+            {"id": story_id, "title": title, "genre": genre, "age_group": age_group, "created_at": created_at}
+            for story_id, title, genre, age_group, created_at in rows
+        ]
+
+    def search(self, query, offset, limit, filters=None):
+        terms = _parse_search(query)
+        if not terms:
+            return [], 0
+
+        # Every term/phrase is quoted so user input can't trip FTS5 syntax;
+        # adjacent strings are ANDed and a quoted string matches as a phrase
+        match = " ".join(f'"{term}"' for term in terms)
+        where, params = self._where(filters)
+        where = where.replace("WHERE", "AND", 1)
+        conn = self._conn()
+
+        total = conn.execute(
+            f"""
+            SELECT COUNT(*) FROM stories_fts JOIN stories ON stories.rowid = stories_fts.rowid
+            WHERE stories_fts MATCH ? {where}
+            """,
+            [match] + params
+        ).fetchone()[0]
+
+        # bm25 weights: title, description, page text
+        rows = conn.execute(
+            f"""
+            SELECT id, stories.title, genre, age_group, created_at,
+                   snippet(stories_fts, 2, '**', '**', '…', 12)
+            FROM stories_fts JOIN stories ON stories.rowid = stories_fts.rowid
+            WHERE stories_fts MATCH ? {where}
+            ORDER BY bm25(stories_fts, 10.0, 4.0, 1.0) LIMIT ? OFFSET ?
+            """,
+            [match] + params + [limit, offset]
+        )
+        results = [
+            {"id": story_id, "title": title, "genre": genre, "age_group": age_group,
+             "created_at": created_at, "snippet": snippet}
+            for story_id, title, genre, age_group, created_at, snippet in rows
+        ]
+        return results, total
+
+    def facet_counts(self):
+        counts = {field: {} for field in FACET_FIELDS}
+        rows = self._conn().execute("SELECT genre, age_group, gender, count FROM facet_counts WHERE count > 0")
+        for *values, count in rows:
+            for field, value in zip(FACET_FIELDS, values):
+                counts[field][value] = counts[field].get(value, 0) + count
+        return counts
+
+    def train_dictionary(self, sample_size=STORY_DICT_SAMPLE):
+        """Train a preset dictionary on a random sample of stored bodies; returns its ID (None if too few stories)"""
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT story FROM stories ORDER BY RANDOM() LIMIT ?", (sample_size,)
+        ).fetchall()
+        samples = [
+            json.dumps(self._decode(story), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            for story, in rows
+        ]
+        dictionary = train_dictionary(samples)
+        if not dictionary:
+            return None
+        with conn:
+            dictionary_id = conn.execute("INSERT INTO story_dictionaries (data) VALUES (?)", (dictionary,)).lastrowid
+        self._load_codec(conn)
+        return dictionary_id
+
+    def recompress(self, batch_size=500, pause=0.0):
+        """Rewrite bodies not using the newest dictionary, ``batch_size`` rows per transaction.
+
+        Safe to run while the app is serving: each batch is a short write,
+        a row changed in the meantime is left alone, and ``pause`` seconds
+        between batches leave room for other writers. Returns the number of
+        rows rewritten.
+        """
+        conn = self._conn()
+        codec = self._load_codec(conn)
+        rewritten = last_rowid = 0
+        while True:
+            rows = conn.execute(
+                "SELECT rowid, story FROM stories WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, batch_size)
+            ).fetchall()
+            updates = [
+                (codec.compress(codec.decompress(story)), rowid, story)
+                for rowid, story in rows
+                if codec.dictionary_id(story) != codec.current_id
+            ]
+            if updates:
+                with conn:
+                    rewritten += conn.executemany(
+                        "UPDATE stories SET story = ? WHERE rowid = ? AND story = ?", updates
+                    ).rowcount
+            if len(rows) < batch_size:
+                return rewritten
+            last_rowid = rows[-1][0]
+            if pause:
+                time.sleep(pause)
+
+    def backup(self, backup_dir):
+        """Online copy of the database into ``backup_dir``; returns the number of bytes written.
+
+        SQLite's own WAL already makes saves crash-safe, so this is a full
+        consistent copy taken with the backup API while readers and writers
+        carry on.
+        """
+        backup_dir = Path(backup_dir)
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        target = backup_dir / self.path.name
+        temp_path = target.with_name(f"{target.name}.tmp")
+        destination = sqlite3.connect(temp_path)
+        try:
+            self._conn().backup(destination)
+        finally:
+            destination.close()
+        os.replace(temp_path, target)
+        return target.stat().st_size
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    """Copy every story from a stories.json file into a SQLite store.
+
+    Returns the number of stories migrated. Existing rows with the same ID
+    are overwritten, so running the migration twice is harmless.
+    """
+    json_path = Path(json_path)
+    if not json_store_exists(json_path):
+        return 0
+
+    # Through the store, so saves still in the write-ahead log come across too
+    stories = JSONStoryStore(json_path).all()
+
+    store = SQLiteStoryStore(db_path)
+    store.put_many(
+        (story_id, story_data['story'], story_data['metadata'])
+        for story_id, story_data in stories.items()
+    )
+    return len(stories)
+
+
+def restore_json_backup(backup_dir, json_path):
+    """Rebuild a JSON store at ``json_path`` from a ``JSONStoryStore.backup`` directory.
+
+    Returns the number of stories restored.
+    """
+    backup_dir = Path(backup_dir)
+    json_path = Path(json_path)
+    log_dir = json_log_dir(json_path)
+    library_dir = json_library_dir(json_path)
+    with open(backup_dir / "manifest.json", 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)["snapshot"]
+    if library_dir.exists():
+        shutil.rmtree(library_dir)
+    if snapshot == BACKUP_FILENAME:
+        shutil.copyfile(backup_dir / BACKUP_FILENAME, json_path)
+    elif snapshot:
+        library_dir.mkdir(parents=True)
+        shutil.copyfile(backup_dir / snapshot, library_dir / snapshot)
+        make_current(library_dir, snapshot)
+    if log_dir.exists():
+        shutil.rmtree(log_dir)
+    shutil.copytree(backup_dir / log_dir.name, log_dir)
+    return len(JSONStoryStore(json_path).all())
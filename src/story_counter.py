@@ -2,24 +2,116 @@
 
 import json
 import os
+import threading
+from datetime import datetime
 
-COUNTER_FILE = os.path.join("data", "story_count.json")
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-def get_next_story_id():
-    """Load and increment story counter, save, and return new story ID"""
-    count = 0
+from .dedup import remember_story, story_to_text
+from .metrics import stage
+from config import DATA_DIR
+
+COUNTER_FILE = os.path.join(DATA_DIR, "story_count.json")
+ID_BLOCK_SIZE = 20
+
+
+class _FileLock:
+    """Exclusive inter-process lock held on a sidecar .lock file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        os.close(self._fd)
+        self._fd = None
+
+
+class StoryIdAllocator:
+    """Hand out unique, increasing story IDs across threads and processes.
+
+    The counter file records the highest ID ever leased. A process takes the
+    file lock once per block of ``block_size`` IDs, advances the counter past
+    the whole block and durably writes it before using any of them, then
+    serves the block from memory. A crash can leave a gap but never reuses
+    an ID.
+    """
 
-    # Make sure data folder exists
-    os.makedirs(os.path.dirname(COUNTER_FILE), exist_ok=True)
+    def __init__(self, path=COUNTER_FILE, block_size=ID_BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
 
-    if os.path.exists(COUNTER_FILE):
-        with open(COUNTER_FILE, "r") as f:
-            data = json.load(f)
-            count = data.get("count", 0)
+    def _lease_block(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        with _FileLock(self.path + ".lock"):
+            count = 0
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    count = json.load(f).get("count", 0)
+
+            # Write-then-rename so a crash never leaves a truncated counter
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"count": count + self.block_size}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+        self._next = count + 1
+        self._end = count + self.block_size + 1
+        self._pid = os.getpid()
+
+    def next_id(self):
+        with self._lock:
+            # A forked child must not keep serving its parent's block
+            if self._next >= self._end or self._pid != os.getpid():
+                self._lease_block()
+            story_id = self._next
+            self._next += 1
+            return story_id
+
+
+_allocator = StoryIdAllocator()
+
+
+def get_next_story_id():
+    """Return a new unique story ID"""
+    return _allocator.next_id()
 
-    count += 1
 
-    with open(COUNTER_FILE, "w") as f:
-        json.dump({"count": count}, f)
+def claim_story(story_data, story_text=None):
+    """Give a story that is being handed out its ID and created_at, and add it to the near-duplicate index.
 
-    return count
+    Runs once per story a reader actually gets, so a losing hedged request
+    or a warm-pool story nobody took never uses up an ID or shows up in
+    duplicate checks. ``story_text`` defaults to the text rebuilt from the pages.
+    """
+    metadata = story_data['metadata']
+    with stage("id"):
+        metadata['id'] = f"story_{get_next_story_id()}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    metadata['created_at'] = datetime.now().isoformat()
+    with stage("dedup"):
+        remember_story(metadata['id'], story_text or story_to_text(story_data['story'], metadata.get('title', '')))
+    return story_data
@@ -1,177 +1,370 @@
 # src/story_generator.py
-import google.generativeai as genai
+import asyncio
 import streamlit as st
+import uuid
 from datetime import datetime
-import os
-from .story_counter import get_next_story_id
-from .prompts import get_gemini_optimized_prompt
-from dotenv import load_dotenv
+from .story_counter import claim_story
+from .prompts import build_story_prompt, build_user_prompt, GEMINI_FORMAT_REMINDER
+from .dedup import is_duplicate
+from .response_cache import lookup_response, store_response
+from .story_parser import IncrementalPageParser, parse_story_pages
+from .clients import get_api_key, get_base_url, get_gemini_model, report_client_failure
+from .batch import run_bounded
+from .quota import estimate_tokens, wait_for_quota, wait_for_quota_async
+from .metrics import instrument, stage, timed_chunks, mark_outcome, record_usage
+from config import DEDUP_SIMILARITY_THRESHOLD, BATCH_CONCURRENCY, QUOTA_PRIORITY_INTERACTIVE, QUOTA_PRIORITY_BATCH
+
+MODEL_NAME = 'gemini-2.0-flash'
+
+# Generation parameters optimized for Gemini 2.0 Flash
+GENERATION_SETTINGS = {
+    "temperature": 0.8,         # Slightly lower for more consistent formatting
+    "max_output_tokens": 2000,  # Increased for longer stories
+    "top_p": 0.9,
+    "top_k": 32,
+}
+
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH", 
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
 
 
 class StoryGenerator:
     def __init__(self):
-        load_dotenv()  
-
-        self.api_key = os.getenv("GOOGLE_API_KEY")
+        self.api_key = get_api_key("GOOGLE_API_KEY")
+        self.similarity_threshold = DEDUP_SIMILARITY_THRESHOLD
 
         if not self.api_key:
             st.warning("Please provide Google AI API Key to generate stories")
-            self.model = None  # Avoid attribute error later
-            return
-        
-        try:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.0-flash')
-        except Exception as e:
-            st.error(f"Error configuring Gemini: {e}")
-            self.model = None
+        # The model (and the Gemini SDK) is built on first use and then shared by every session
+    
+    @property
+    def model(self):
+        """The process-wide Gemini model, built on first use (None without an API key)"""
+        return get_gemini_model(MODEL_NAME) if self.api_key else None
     
+    @instrument("generate_story", "gemini")
     def generate_story(self, story_params):
         """Generate a story based on the provided parameters"""
         try:
-            # Get Gemini-optimized prompt
-            system_prompt = get_gemini_optimized_prompt(story_params['age_group'], story_params)
+            # Gemini-optimized system prompt + user prompt, from the compiled template table
+            with stage("prompt"):
+                prompt = build_story_prompt(story_params, GEMINI_FORMAT_REMINDER)
             
-            # Build user prompt
-            user_prompt = self._build_user_prompt(story_params)
+            # The cache is keyed without the seed, so identical requests can share variants
+            cache_key, story_text = self._lookup_cache(prompt)
+            from_cache = story_text is not None
             
-            # Combine prompts for Gemini
-            # full_prompt = f"{system_prompt}\n\nSTORY REQUEST:\n{user_prompt}"
-            full_prompt = f"{system_prompt}\n\nSTORY REQUEST:\n{user_prompt}\n\nSeed: {datetime.now().timestamp()}"
+            if story_text is None:
+                with stage("quota"):
+                    reservation = self._wait_for_quota(prompt)
+                used_tokens = None
+                try:
+                    # Call Gemini API with safety settings
+                    with stage("provider"):
+                        response = self.model.generate_content(
+                            self._seeded(prompt),
+                            generation_config=self._generation_config(),
+                            safety_settings=SAFETY_SETTINGS
+                        )
+                    
+                    # Check if response was blocked
+                    if response.candidates[0].finish_reason.name == 'SAFETY':
+                        mark_outcome("blocked", "SAFETY")
+                        used_tokens = self._record_usage(response, prompt, "")
+                        st.error("Story generation was blocked for safety reasons. Please try different parameters.")
+                        return None
+                        
+                    story_text = response.text
+                    used_tokens = self._record_usage(response, prompt, story_text)
+                finally:
+                    reservation.settle(used_tokens)
+                store_response(cache_key, story_text)
             
-            # Configure generation parameters optimized for Gemini 2.0 Flash
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.8,         # Slightly lower for more consistent formatting
-                max_output_tokens=2000,  # Increased for longer stories
-                top_p=0.9,
-                top_k=32,
-                candidate_count=1,
-                stop_sequences=None
-            )
+            return self._build_story_data(story_text, story_params, from_cache)
             
-            # Call Gemini API with safety settings
-            safety_settings = [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH", 
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
+        except Exception as e:
+            mark_outcome("error")
+            report_client_failure("gemini", e)
+            st.error(f"Error generating story: {str(e)}")
+            # Log more details for debugging
+            if hasattr(e, 'response'):
+                st.error(f"API Response: {e.response}")
+            return None
+    
+    @instrument("generate_story_stream", "gemini")
+    def generate_story_stream(self, story_params, on_error=None, on_granted=None):
+        """Stream a story, yielding each page as soon as its "Page N" block closes.
+        
+        Yields ("title", title) once the title line arrives, ("page", page)
+        for every completed page, and finally ("done", story_data), where
+        story_data is the same dict generate_story returns (None on failure).
+        Errors are passed to ``on_error`` if given instead of being shown with st.error;
+        ``on_granted()`` is called once quota is granted, before the provider call.
+        """
+        try:
+            with stage("prompt"):
+                prompt = build_story_prompt(story_params, GEMINI_FORMAT_REMINDER)
+            cache_key, story_text = self._lookup_cache(prompt)
+            from_cache = story_text is not None
             
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=generation_config,
-                safety_settings=safety_settings
-            )
+            if not from_cache:
+                with stage("quota"):
+                    reservation = self._wait_for_quota(prompt)
+                if on_granted:
+                    on_granted()
+            chunks = [story_text] if from_cache else timed_chunks(self._stream_chunks(prompt, reservation))
+            parser = IncrementalPageParser()
+            received = []
             
-            # Check if response was blocked
-            if response.candidates[0].finish_reason.name == 'SAFETY':
-                st.error("Story generation was blocked for safety reasons. Please try different parameters.")
-                return None
-                
-            story_text = response.text
+            for chunk in chunks:
+                if chunk is None:
+                    mark_outcome("blocked", "SAFETY")
+                    message = "Story generation was blocked for safety reasons. Please try different parameters."
+                    if on_error:
+                        on_error(RuntimeError(message))
+                    else:
+                        st.error(message)
+                    yield "done", None
+                    return
+                received.append(chunk)
+                had_title = parser.title is not None
+                with stage("parse"):
+                    completed = parser.feed(chunk)
+                if not had_title and parser.title is not None:
+                    yield "title", parser.title
+                for page in completed:
+                    yield "page", page
+            with stage("parse"):
+                remaining = parser.close()
+            for page in remaining:
+                yield "page", page
             
-            # Parse the story into pages
-            story_pages = self._parse_story_pages(story_text)
+            story_text = "".join(received)
+            if not from_cache:
+                store_response(cache_key, story_text)
+            yield "done", self._build_story_data(story_text, story_params, from_cache, parser.pages)
             
-            # Create story data
-            story_data = {
+        except Exception as e:
+            mark_outcome("error")
+            report_client_failure("gemini", e)
+            if on_error:
+                on_error(e)
+            else:
+                st.error(f"Error generating story: {str(e)}")
+                if hasattr(e, 'response'):
+                    st.error(f"API Response: {e.response}")
+            yield "done", None
+    
+    async def generate_many(self, params_list, concurrency=BATCH_CONCURRENCY):
+        """Generate a story for every parameter dict, running up to ``concurrency`` requests at once.
+        
+        Returns results in input order as {"story_data": ..., "error": ...} dicts;
+        a failed item carries its error instead of stopping the batch.
+        """
+        return await run_bounded(params_list, self.generate_async, concurrency)
+    
+    @instrument("generate_async", "gemini")
+    async def generate_async(self, story_params, session_id="batch", priority=QUOTA_PRIORITY_BATCH,
+                             on_wait=None, on_duplicate=None, claim=True, on_granted=None):
+        """Generate one story without touching the UI; raises on failure instead of calling st.error.
+        
+        ``on_wait(position, wait)`` is called while queued for quota and
+        ``on_duplicate(similarity)`` if the story is a near-duplicate. With
+        ``claim`` False the story comes back without an ID or created_at
+        and is not added to the duplicate index; see story_counter.claim_story.
+        ``on_granted()`` is called once quota is granted, just before the
+        provider call.
+        """
+        if not self.api_key:
+            raise RuntimeError("GOOGLE_API_KEY is not set")
+        
+        with stage("prompt"):
+            prompt = build_story_prompt(story_params, GEMINI_FORMAT_REMINDER)
+        cache_key, story_text = self._lookup_cache(prompt)
+        from_cache = story_text is not None
+        
+        if story_text is None:
+            with stage("quota"):
+                reservation = await wait_for_quota_async(
+                    "gemini", self._estimate_tokens(prompt), session_id, priority, on_wait
+                )
+            if on_granted:
+                on_granted()
+            try:
+                try:
+                    with stage("provider"):
+                        response = await self._generate_content_async(self._seeded(prompt))
+                except Exception as e:
+                    report_client_failure("gemini", e)
+                    raise
+                if response.candidates[0].finish_reason.name == 'SAFETY':
+                    mark_outcome("blocked", "SAFETY")
+                    reservation.settle(self._record_usage(response, prompt, ""))
+                    raise RuntimeError("Story generation was blocked for safety reasons")
+                story_text = response.text
+                used_tokens = self._record_usage(response, prompt, story_text)
+            except BaseException:
+                # Failed, cancelled or timed out: hand the reservation back (not awaited, see acquire_async)
+                reservation.settle()
+                raise
+            await reservation.settle_async(used_tokens)
+            store_response(cache_key, story_text)
+        
+        return self._build_story_data(story_text, story_params, from_cache, notify=False, on_duplicate=on_duplicate,
+                                      claim=claim)
+    
+    async def _generate_content_async(self, prompt):
+        """generate_content_async, or generate_content on a worker thread under the REST transport.
+        
+        With GEMINI_BASE_URL set the model talks REST, where the SDK's
+        "async" call returns a finished response instead of an awaitable.
+        """
+        kwargs = dict(generation_config=self._generation_config(), safety_settings=SAFETY_SETTINGS)
+        if get_base_url("gemini"):
+            return await asyncio.to_thread(self.model.generate_content, prompt, **kwargs)
+        return await self.model.generate_content_async(prompt, **kwargs)
+    
+    def _lookup_cache(self, prompt):
+        """(cache_key, cached story text or None); a hit marks the current trace as cached"""
+        with stage("cache"):
+            cache_key, story_text = lookup_response(prompt, dict(GENERATION_SETTINGS, model=MODEL_NAME))
+        if story_text is not None:
+            mark_outcome("cached", "cache")
+        return cache_key, story_text
+    
+    @staticmethod
+    def _record_usage(response, prompt, story_text, finish_reason=None):
+        """Report Gemini's usage_metadata token counts (estimated if missing) to the current trace"""
+        usage = getattr(response, "usage_metadata", None)
+        if finish_reason is None and getattr(response, "candidates", None):
+            finish_reason = response.candidates[0].finish_reason.name
+        return record_usage(
+            getattr(usage, "prompt_token_count", None) or None,
+            getattr(usage, "candidates_token_count", None) or None,
+            prompt, story_text, finish_reason
+        )
+    
+    def _estimate_tokens(self, prompt):
+        return estimate_tokens(prompt, GENERATION_SETTINGS["max_output_tokens"])
+    
+    def _wait_for_quota(self, prompt):
+        """Wait for a slot under the shared Gemini rate limit, showing the reader their place in line.
+        
+        Returns the quota Reservation to settle once the call is over.
+        """
+        session_id = st.session_state.setdefault("quota_session_id", uuid.uuid4().hex)
+        status = st.empty()
+        
+        def on_wait(position, wait):
+            status.info(f"⏳ Lots of stories are being written right now. You are number {position} in line (about {wait:.0f}s).")
+        
+        try:
+            return wait_for_quota("gemini", self._estimate_tokens(prompt), session_id, QUOTA_PRIORITY_INTERACTIVE, on_wait)
+        finally:
+            status.empty()
+    
+    def _stream_chunks(self, prompt, reservation):
+        """Yield text chunks from a streaming Gemini call; yields None if the stream is safety-blocked.
+        
+        ``reservation`` is settled when the stream ends, fails or is closed.
+        """
+        used_tokens = None
+        try:
+            response = self.model.generate_content(
+                self._seeded(prompt),
+                generation_config=self._generation_config(),
+                safety_settings=SAFETY_SETTINGS,
+                stream=True
+            )
+            received = []
+            chunk = None
+            for chunk in response:
+                if chunk.candidates and chunk.candidates[0].finish_reason.name == 'SAFETY':
+                    yield None
+                    return
+                if chunk.parts:
+                    received.append(chunk.text)
+                    yield chunk.text
+            # The last chunk carries the usage totals and finish reason for the whole response
+            used_tokens = self._record_usage(chunk, prompt, "".join(received))
+        finally:
+            reservation.settle(used_tokens)
+    
+    @staticmethod
+    def _seeded(prompt):
+        return f"{prompt}\n\nSeed: {datetime.now().timestamp()}"
+    
+    @staticmethod
+    def _generation_config():
+        import google.generativeai as genai  # loaded with the model on first use, not at app start
+
+        return genai.types.GenerationConfig(
+            **GENERATION_SETTINGS,
+            candidate_count=1,
+            stop_sequences=None
+        )
+    
+    def _build_story_data(self, story_text, story_params, from_cache, story_pages=None, notify=True,
+                          on_duplicate=None, claim=True):
+        """Run the duplicate check and assemble the story dict; ``claim`` also gives it its ID"""
+        # Check for near-duplicates of saved or recently generated stories
+        # (a cache hit is a deliberate reuse, so it is not checked)
+        with stage("dedup"):
+            is_dup, score = (False, None) if from_cache else is_duplicate(story_text, self.similarity_threshold)
+        if is_dup and notify:
+            st.warning(f"Generated story is similar to a previous one (similarity={score:.2f}). Retrying may help.")
+        elif is_dup and on_duplicate:
+            on_duplicate(score)
+        
+        # Parse the story into pages
+        if story_pages is None:
+            with stage("parse"):
+                story_pages = self._parse_story_pages(story_text)
+        
+        # Create story data
+        story_data = {
             "story": story_pages,
             "metadata": {
-                "id": f"story_{get_next_story_id()}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "id": None,
                 "title": self._extract_title(story_text),
                 "genre": story_params['genre'],
                 "gender": story_params['gender'],
                 "age_group": story_params['age_group'],
                 "story_length": story_params['story_length'],
                 "description": story_params.get('description', ''),
-                "created_at": datetime.now().isoformat(),
+                "created_at": None,
                 "total_pages": len(story_pages)
             }
         }
-            
-            return story_data
-            
-        except Exception as e:
-            st.error(f"Error generating story: {str(e)}")
-            # Log more details for debugging
-            if hasattr(e, 'response'):
-                st.error(f"API Response: {e.response}")
-            return None
+        # Left to the caller when this story may never be served (a hedged race, the warm pool)
+        if claim:
+            claim_story(story_data, story_text)
+        
+        return story_data
     
     def _build_user_prompt(self, params):
         """Build the user prompt based on story parameters"""
-        prompt_parts = []
-        
-        prompt_parts.append(f"Create a {params['story_length']}-page children's picture book story with these details:")
-        prompt_parts.append(f"• Genre: {params['genre']}")
-        prompt_parts.append(f"• Main character gender: {params['gender']}")
-        prompt_parts.append(f"• Target age: {params['age_group']}")
-        
-        if params.get('description'):
-            prompt_parts.append(f"• Story concept: {params['description']}")
-        
-        # Add specific requirements based on parameters
-        requirements = []
-        if params.get('include_moral'):
-            requirements.append("include a gentle life lesson")
-        if params.get('include_dialogue'):
-            requirements.append("include character conversations")
-        if params.get('rhyming'):
-            requirements.append("include some rhyming where natural")
-            
-        if requirements:
-            prompt_parts.append(f"• Please {', '.join(requirements)}")
-        
-        prompt_parts.append("\nRemember to follow the exact page format specified above!")
-        
-        return "\n".join(prompt_parts)
+        return build_user_prompt(params, GEMINI_FORMAT_REMINDER)
     
     def _parse_story_pages(self, story_text):
         """Parse the generated story into individual pages"""
-        pages = []
-        lines = story_text.split('\n')
-        current_page = None
-        current_content = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith('Title:'):
-                continue
-            elif line.startswith('Page '):
-                if current_page is not None and current_content:
-                    pages.append({
-                        'page_number': current_page,
-                        'content': '\n'.join(current_content)
-                    })
-                current_page = len(pages) + 1
-                current_content = []
-            else:
-                if current_page is not None:
-                    current_content.append(line)
-        
-        # Add the last page
-        if current_page is not None and current_content:
-            pages.append({
-                'page_number': current_page,
-                'content': '\n'.join(current_content)
-            })
-        
-        return pages
+        return parse_story_pages(story_text)
     
     def _extract_title(self, story_text):
         """Extract title from the generated story"""
@@ -0,0 +1,96 @@
+# src/story_parser.py
+
+
+class IncrementalPageParser:
+    """Parse 'Title:/Page N:' story text into pages as it streams in.
+
+    ``feed`` accepts arbitrary chunks and returns the pages that were closed
+    by them (a page closes when the next "Page N" line starts); ``close``
+    flushes the last page. Feeding a whole story and closing gives exactly
+    the pages the generators' original one-shot parsers produced.
+
+    ``lenient`` selects the Groq variant: case-insensitive markers and, when
+    no page markers are found at all, a fallback that splits the text into
+    one page per paragraph.
+    """
+
+    def __init__(self, lenient=False):
+        self.lenient = lenient
+        self.title = None
+        self.pages = []
+        self._buffer = ""
+        self._chunks = []
+        self._current_page = None
+        self._current_content = []
+
+    def _is_marker(self, line, marker):
+        if self.lenient:
+            return line.lower().startswith(marker.lower())
+        return line.startswith(marker)
+
+    def _close_page(self):
+        if self._current_page is not None and self._current_content:
+            page = {
+                'page_number': self._current_page,
+                'content': '\n'.join(self._current_content)
+            }
+            self.pages.append(page)
+            return [page]
+        return []
+
+    def _process_line(self, line):
+        line = line.strip()
+        if not line:
+            return []
+
+        if self._is_marker(line, 'Title:'):
+            if self.title is None:
+                self.title = line[len('Title:'):].strip()
+            return []
+        if self._is_marker(line, 'Page '):
+            closed = self._close_page()
+            self._current_page = len(self.pages) + 1
+            self._current_content = []
+            return closed
+        if self._current_page is not None:
+            self._current_content.append(line)
+        return []
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return any pages it completed"""
+        if self.lenient:
+            self._chunks.append(chunk)
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+
+        completed = []
+        for line in lines:
+            completed.extend(self._process_line(line))
+        return completed
+
+    def close(self):
+        """Flush the final page (and the lenient paragraph fallback); return the new pages"""
+        completed = self._process_line(self._buffer)
+        self._buffer = ""
+        completed.extend(self._close_page())
+        self._current_page = None
+        self._current_content = []
+
+        # Fallback: split into N pages if no page markers found
+        if self.lenient and not self.pages:
+            story_text = ''.join(self._chunks)
+            paragraphs = [p.strip() for p in story_text.split('\n\n') if p.strip()]
+            for i, para in enumerate(paragraphs, start=1):
+                page = {'page_number': i, 'content': para}
+                self.pages.append(page)
+                completed.append(page)
+
+        return completed
+
+
+def parse_story_pages(story_text, lenient=False):
+    """Parse a complete story into pages in one go"""
+    parser = IncrementalPageParser(lenient=lenient)
+    parser.feed(story_text)
+    parser.close()
+    return parser.pages
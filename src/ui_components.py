@@ -1,4 +1,27 @@
 import streamlit as st
+import hashlib
+import html
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from config import STORY_HTML_CACHE_SIZE, STORY_BOOK_VIEW
+
+# Shared by every rendered page, so the per-page HTML only carries class names
+STORY_CSS = """<style>
+.tt-details{margin:0 0 1rem;color:#495057}
+.tt-details summary{cursor:pointer;font-weight:600}
+.tt-details dl{display:grid;grid-template-columns:max-content 1fr;gap:4px 12px;margin:8px 0 0}
+.tt-details dt{font-weight:600}
+.tt-page{background-color:#f8f9fa;border:2px solid #dee2e6;border-radius:10px;padding:20px;margin:10px 0 24px;box-shadow:0 2px 4px rgba(0,0,0,0.1)}
+.tt-page h4{color:#495057;margin-bottom:15px}
+.tt-text{font-size:18px;line-height:1.6;color:#343a40;font-family:'Georgia',serif}
+</style>"""
+
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+
 
 def render_story_form():
     """Render the story generation form and return parameters"""
@@ -71,61 +94,153 @@ def render_story_form():
     return None
 
 
-def display_story(story_pages, metadata):
-    """Display a generated story in picture book format"""
-    
-    # Story header
-    st.markdown(f"## 📖 {metadata['title']}")
-    
-    # Story metadata
-    with st.expander("Story Details"):
+def render_library_filters(facet_counts):
+    """Render the library filter controls and return (filters, sort)"""
+
+    def facet_select(label, facet):
+        counts = facet_counts.get(facet, {})
+        options = ["All"] + sorted(counts)
+        return st.selectbox(
+            label,
+            options,
+            format_func=lambda value: value if value == "All" else f"{value or 'Unknown'} ({counts[value]:,})",
+            key=f"library_{facet}"
+        )
+
+    with st.expander("Filter & Sort", expanded=False):
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.write(f"**Genre:** {metadata['genre']}")
-            st.write(f"**Age Group:** {metadata['age_group']}")
+            genre = facet_select("Genre", "genre")
         with col2:
-            st.write(f"**Main Character:** {metadata['gender']}")
-            st.write(f"**Total Pages:** {metadata['total_pages']}")
+            age_group = facet_select("Age Group", "age_group")
         with col3:
-            st.write(f"**Created:** {metadata['created_at'][:10]}")
-            if metadata.get('description'):
-                st.write(f"**Description:** {metadata['description']}")
-    
-    st.divider()
-    
-    # Display story pages
-    for i, page in enumerate(story_pages):
-        # Create a container for each page that looks like a book page
-        with st.container():
-            # Page styling
-            st.markdown(
-                f"""
-                <div style="
-                    background-color: #f8f9fa;
-                    border: 2px solid #dee2e6;
-                    border-radius: 10px;
-                    padding: 20px;
-                    margin: 10px 0;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                ">
-                    <h4 style="color: #495057; margin-bottom: 15px;">📄 Page {page['page_number']}</h4>
-                    <div style="
-                        font-size: 18px;
-                        line-height: 1.6;
-                        color: #343a40;
-                        font-family: 'Georgia', serif;
-                        white-space: pre-line;
-                    ">
-                        {page['content']}
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
+            gender = facet_select("Main Character", "gender")
+
+        col4, col5 = st.columns(2)
+        with col4:
+            date_range = st.date_input("Created between", value=(), key="library_dates")
+        with col5:
+            sort = st.selectbox(
+                "Sort by",
+                ["newest", "oldest", "title"],
+                format_func={"newest": "Newest first", "oldest": "Oldest first", "title": "Title (A-Z)"}.get,
+                key="library_sort"
             )
-            
-            # Add space between pages
-            if i < len(story_pages) - 1:
-                st.markdown("<br>", unsafe_allow_html=True)
+
+    filters = {
+        "genre": None if genre == "All" else genre,
+        "age_group": None if age_group == "All" else age_group,
+        "gender": None if gender == "All" else gender,
+    }
+    if len(date_range) == 2:
+        # created_to is exclusive, so include the whole end day
+        filters["created_from"] = date_range[0].isoformat()
+        filters["created_to"] = (date_range[1] + timedelta(days=1)).isoformat()
+
+    return filters, sort
+
+
+def inject_story_css():
+    """Add the story stylesheet to the page; call once per run before displaying stories"""
+    st.markdown(STORY_CSS, unsafe_allow_html=True)
+
+
+def _escape(text):
+    # Newlines become <br> so a blank line can't end the HTML block in Markdown
+    return html.escape(str(text)).replace('\n', '<br>')
+
+
+def render_page_html(page):
+    """One picture-book page as compact HTML (styled by STORY_CSS)"""
+    return (
+        f'<div class="tt-page"><h4>📄 Page {page["page_number"]}</h4>'
+        f'<div class="tt-text">{_escape(page["content"])}</div></div>'
+    )
+
+
+def render_story_html(story_pages, metadata):
+    """The whole story - title, details and every page - as one HTML document.
+
+    Memoized by story ID and a hash of its content, so an unchanged story
+    is rendered once however many reruns display it.
+    """
+    content = json.dumps([story_pages, metadata], sort_keys=True, default=str).encode("utf-8")
+    key = (metadata.get('id'), hashlib.blake2b(content, digest_size=16).hexdigest())
+    with _html_cache_lock:
+        if key in _html_cache:
+            _html_cache.move_to_end(key)
+            return _html_cache[key]
+
+    rendered = _story_html(story_pages, metadata)
+    with _html_cache_lock:
+        _html_cache[key] = rendered
+        while len(_html_cache) > STORY_HTML_CACHE_SIZE:
+            _html_cache.popitem(last=False)
+    return rendered
+
+
+def _story_html(story_pages, metadata):
+    details = [
+        ("Genre", metadata['genre']),
+        ("Age Group", metadata['age_group']),
+        ("Main Character", metadata['gender']),
+        ("Total Pages", metadata.get('total_pages', len(story_pages))),
+        ("Created", (metadata.get('created_at') or '')[:10]),
+    ]
+    if metadata.get('description'):
+        details.append(("Description", metadata['description']))
+    rows = "".join(f"<dt>{label}</dt><dd>{_escape(value)}</dd>" for label, value in details)
+    return (
+        f'<div class="tt-story"><h2>📖 {_escape(metadata["title"])}</h2>'
+        f'<details class="tt-details"><summary>Story Details</summary><dl>{rows}</dl></details>'
+        + "".join(render_page_html(page) for page in story_pages)
+        + '</div>'
+    )
+
+
+def display_story(story_pages, metadata, key=None):
+    """Display a generated story in picture book format.
+
+    The story goes to the browser as one pre-rendered HTML element, or, in
+    the picture-book view, only the current page is sent. ``key`` keeps
+    the view's widgets apart when the same story is shown twice on a page.
+    """
+    key = key or metadata['id']
+    book_view = st.toggle("One page at a time", value=STORY_BOOK_VIEW, key=f"book_view_{key}")
+    if book_view:
+        display_story_book(story_pages, metadata, key)
+    else:
+        st.markdown(render_story_html(story_pages, metadata), unsafe_allow_html=True)
+
+
+def display_story_book(story_pages, metadata, key):
+    """Picture-book view: the current page and Previous/Next buttons"""
+    if not story_pages:
+        st.info("This story has no pages.")
+        return
+
+    state_key = f"book_page_{key}"
+    index = min(st.session_state.get(state_key, 0), len(story_pages) - 1)
+
+    st.markdown(f"## 📖 {metadata['title']}")
+    col1, col2, col3 = st.columns([1, 3, 1])
+    with col1:
+        if st.button("◀ Previous", key=f"book_prev_{key}", disabled=index == 0, use_container_width=True):
+            index -= 1
+    with col3:
+        if st.button("Next ▶", key=f"book_next_{key}", disabled=index == len(story_pages) - 1, use_container_width=True):
+            index += 1
+    index = max(0, min(index, len(story_pages) - 1))
+    with col2:
+        st.caption(f"Page {index + 1} of {len(story_pages)}")
+    st.session_state[state_key] = index
+
+    st.markdown(render_page_html(story_pages[index]), unsafe_allow_html=True)
+
+
+def display_story_page(page):
+    """Display a single story page as a picture book page"""
+    st.markdown(render_page_html(page), unsafe_allow_html=True)
 
 
 def display_story_card(story_data, story_id):
@@ -0,0 +1,148 @@
+# src/wal.py
+import json
+import os
+import threading
+from pathlib import Path
+
+from config import WAL_FSYNC, WAL_SEGMENT_BYTES
+
+
+def fsync_directory(directory):
+    """Make a rename or unlink in ``directory`` durable (a no-op where directories can't be opened)"""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log split into numbered segment files.
+
+    ``write`` appends records and returns a ticket; ``sync`` blocks until
+    that ticket is on disk. Writers that arrive while an fsync is running
+    share the next one (group commit), so a burst of saves costs a few
+    fsyncs rather than one each. A crash can only leave a partial last
+    line, which readers ignore and the next writer truncates away.
+    """
+
+    def __init__(self, directory, fsync=WAL_FSYNC, segment_bytes=WAL_SEGMENT_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._sync_cond = threading.Condition()
+
+    @staticmethod
+    def _segment_name(number):
+        return f"{number:08d}.log"
+
+    def segments(self):
+        """Segment file names, oldest first"""
+        return sorted(p.name for p in self.directory.glob("*.log"))
+
+    def _open(self):
+        segments = self.segments()
+        path = self.directory / (segments[-1] if segments else self._segment_name(1))
+        f = open(path, "a+b")
+        # Drop a torn final line left by a crash so the next record starts on a fresh line
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size:
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+            if not tail.endswith(b"\n"):
+                cut = tail.rfind(b"\n")
+                f.truncate(size - len(tail) + cut + 1 if cut >= 0 else max(0, size - len(tail)))
+        return f
+
+    def write(self, records):
+        """Append records (dicts) and return a ticket for ``sync``"""
+        data = b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in records)
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(data)
+            self._file.flush()
+            self._written += 1
+            ticket = self._written
+            if self._file.tell() >= self.segment_bytes:
+                self._rotate_locked()
+        return ticket
+
+    def sync(self, ticket):
+        """Wait until everything up to ``ticket`` has been fsynced"""
+        if not self.fsync:
+            return
+        with self._sync_cond:
+            while self._synced < ticket:
+                if self._syncing:
+                    self._sync_cond.wait()
+                    continue
+                self._syncing = True
+                with self._lock:
+                    target = self._written
+                    fd = os.dup(self._file.fileno()) if self._file else None
+                self._sync_cond.release()
+                try:
+                    if fd is not None:
+                        os.fsync(fd)
+                        os.close(fd)
+                finally:
+                    self._sync_cond.acquire()
+                    self._syncing = False
+                    self._synced = max(self._synced, target)
+                    self._sync_cond.notify_all()
+
+    def _rotate_locked(self):
+        if self._file is not None:
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+        segments = self.segments()
+        number = int(segments[-1].split(".")[0]) + 1 if segments else 1
+        self._file = open(self.directory / self._segment_name(number), "a+b")
+        fsync_directory(self.directory)
+
+    def rotate(self):
+        """Start a new segment; returns the names of the (now closed) older segments"""
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._rotate_locked()
+            return self.segments()[:-1]
+
+    def remove(self, names):
+        for name in names:
+            (self.directory / name).unlink(missing_ok=True)
+        fsync_directory(self.directory)
+
+    def replay(self, positions, apply):
+        """Apply every record past ``positions`` ({segment: byte offset}); returns (new positions, records applied)"""
+        positions = dict(positions)
+        applied = 0
+        for name in self.segments():
+            offset = positions.get(name, 0)
+            with open(self.directory / name, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1  # a partial last line is left for the next replay
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"Skipping unreadable log record in {name}")
+                    continue
+                apply(record)
+                applied += 1
+            positions[name] = offset + end
+        return positions, applied
@@ -0,0 +1,264 @@
+# src/warm_pool.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .dedup import forget_story
+from .story_counter import claim_story
+from config import (
+    DATA_DIR,
+    WARM_POOL_ENABLED,
+    WARM_POOL_FILENAME,
+    WARM_POOL_SIZE,
+    WARM_POOL_HOT_KEYS,
+    WARM_POOL_MIN_SCORE,
+    WARM_POOL_HALF_LIFE_SECONDS,
+    WARM_POOL_HOURLY_BUDGET,
+    WARM_POOL_INTERVAL_SECONDS,
+    WARM_POOL_MAX_AGE_SECONDS,
+)
+
+# Everything that shapes the prompt; a pooled story must match all of them
+POOL_FIELDS = ("genre", "gender", "age_group", "story_length", "include_moral", "include_dialogue", "rhyming")
+
+
+def pool_key(story_params):
+    """Key for a request's parameter tuple, or None if it is not poolable (custom description)"""
+    if story_params.get('description'):
+        return None
+    values = {field: story_params.get(field) for field in POOL_FIELDS}
+    values['story_length'] = str(values['story_length'])
+    for field in ("include_moral", "include_dialogue", "rhyming"):
+        values[field] = bool(values[field])
+    return json.dumps(values, sort_keys=True)
+
+
+class WarmPool:
+    """Ready-made, never-served stories for the most requested parameter tuples.
+
+    Every poolable request bumps an exponentially decaying demand score for
+    its tuple (halving every ``half_life`` seconds). ``refill`` tops up the
+    ``hot_keys`` highest-scoring tuples to ``size`` stories each, spending
+    at most ``hourly_budget`` generations per rolling hour. ``take`` hands
+    a story out exactly once. State lives in SQLite, so all app processes
+    share one pool and a lease makes sure only one of them refills it.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS demand (
+        key TEXT PRIMARY KEY,
+        params TEXT NOT NULL,
+        score REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS stories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL,
+        story_data TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_stories_key ON stories (key, id);
+
+    CREATE TABLE IF NOT EXISTS spend (
+        generated_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS refill_lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path, size=WARM_POOL_SIZE, hot_keys=WARM_POOL_HOT_KEYS, min_score=WARM_POOL_MIN_SCORE,
+                 half_life=WARM_POOL_HALF_LIFE_SECONDS, hourly_budget=WARM_POOL_HOURLY_BUDGET,
+                 max_age=WARM_POOL_MAX_AGE_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.hot_keys = hot_keys
+        self.min_score = min_score
+        self.half_life = half_life
+        self.hourly_budget = hourly_budget
+        self.max_age = max_age
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _decayed(self, score, updated_at, now):
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def record_request(self, key, story_params):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT score, updated_at FROM demand WHERE key = ?", (key,)).fetchone()
+            score = 1.0 + (self._decayed(*row, now) if row else 0.0)
+            params = {field: story_params.get(field) for field in POOL_FIELDS}
+            conn.execute(
+                "INSERT OR REPLACE INTO demand (key, params, score, updated_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(params), score, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, key):
+        """Remove and return the oldest fresh story for ``key``, or None"""
+        conn = self._conn()
+        row = conn.execute(
+            """
+            DELETE FROM stories WHERE id = (
+                SELECT id FROM stories WHERE key = ? AND created_at > ? ORDER BY id LIMIT 1
+            )
+            RETURNING story_data
+            """,
+            (key, time.time() - self.max_age)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, key, story_data):
+        self._conn().execute(
+            "INSERT INTO stories (key, story_data, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(story_data, ensure_ascii=False), time.time())
+        )
+
+    def hottest(self):
+        """[(key, params, score)] for the tuples worth keeping warm, hottest first"""
+        now = time.time()
+        scored = [
+            (key, json.loads(params), self._decayed(score, updated_at, now))
+            for key, params, score, updated_at in self._conn().execute(
+                "SELECT key, params, score, updated_at FROM demand"
+            )
+        ]
+        scored = [entry for entry in scored if entry[2] >= self.min_score]
+        scored.sort(key=lambda entry: entry[2], reverse=True)
+        return scored[:self.hot_keys]
+
+    def _acquire_lease(self, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM refill_lease WHERE id = 1").fetchone()
+            if row and row[0] != self.owner and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO refill_lease (id, owner, expires_at) VALUES (1, ?, ?)",
+                (self.owner, now + ttl)
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM stories WHERE created_at <= ?", (now - self.max_age,))
+        conn.execute("DELETE FROM spend WHERE generated_at <= ?", (now - 3600,))
+
+    def refill(self, generator, lease_ttl=WARM_POOL_INTERVAL_SECONDS * 3):
+        """Top up the hottest tuples using ``generator.generate_batch``; returns stories added"""
+        if not self._acquire_lease(lease_ttl):
+            return 0
+
+        conn = self._conn()
+        now = time.time()
+        self._prune(conn, now)
+        budget = self.hourly_budget - conn.execute("SELECT COUNT(*) FROM spend").fetchone()[0]
+
+        wanted = []
+        for key, params, _ in self.hottest():
+            have = conn.execute(
+                "SELECT COUNT(*) FROM stories WHERE key = ? AND created_at > ?", (key, now - self.max_age)
+            ).fetchone()[0]
+            wanted.extend([(key, dict(params, description=None))] * max(0, self.size - have))
+        wanted = wanted[:max(0, budget)]
+        if not wanted:
+            return 0
+
+        conn.executemany("INSERT INTO spend (generated_at) VALUES (?)", [(now,)] * len(wanted))
+        # Pooled stories get their ID and join the duplicate index only when served
+        results = generator.generate_batch([params for _, params in wanted], claim=False)
+
+        added = 0
+        for (key, _), result in zip(wanted, results):
+            if result["error"]:
+                print(f"Error pre-generating story: {result['error']}")
+                continue
+            self.add(key, result["story_data"])
+            added += 1
+        return added
+
+    def start_worker(self, generator, interval=WARM_POOL_INTERVAL_SECONDS):
+        """Refill the pool every ``interval`` seconds on a daemon thread"""
+        def run():
+            while True:
+                try:
+                    self.refill(generator)
+                except Exception as e:
+                    print(f"Error refilling warm pool: {str(e)}")
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="warm-pool", daemon=True).start()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_warm_pool():
+    """Return the shared warm pool, or None when WARM_POOL_ENABLED is off"""
+    global _pool
+    if not WARM_POOL_ENABLED:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WarmPool(DATA_DIR / WARM_POOL_FILENAME)
+    return _pool
+
+
+def take_warm_story(story_params):
+    """Count the request towards its tuple's demand and serve a pooled story if one is ready.
+
+    The story gets a fresh ID and created_at as it is handed out, so IDs
+    follow serving order like any other story; returns None on a miss.
+    """
+    key = pool_key(story_params)
+    if key is None:
+        return None
+    try:
+        pool = get_warm_pool()
+        if pool is None:
+            return None
+        pool.record_request(key, story_params)
+        story_data = pool.take(key)
+    except Exception as e:
+        print(f"Error reading warm pool: {str(e)}")
+        return None
+
+    if story_data:
+        if story_data['metadata'].get('id'):
+            # Pooled before IDs were left to serving time; the dedup index knows it by the old ID
+            forget_story(story_data['metadata']['id'])
+        claim_story(story_data)
+    return story_data
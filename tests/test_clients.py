@@ -0,0 +1,120 @@
+# tests/test_clients.py
+import asyncio
+
+from src.clients import ClientPool
+
+
+class SyncClient:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncClient:
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_mark_failed_closes_and_rebuilds():
+    pool = ClientPool(SyncClient)
+    first = pool.get()
+    pool.mark_failed()
+    assert first.closed
+    assert pool.get() is not first
+
+
+def test_mark_failed_awaits_async_close():
+    pool = ClientPool(AsyncClient)
+    client = pool.get()
+    pool.mark_failed()
+    assert client.closed
+
+
+def test_mark_failed_inside_event_loop():
+    pool = ClientPool(AsyncClient)
+    client = pool.get()
+
+    async def fail():
+        pool.mark_failed()
+        await asyncio.sleep(0)
+
+    asyncio.run(fail())
+    assert client.closed
+
+
+class Completions:
+    async def create(self, **kwargs):
+        raise ConnectionError("connection reset")
+
+
+class FakeAsyncGroq(AsyncClient):
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": Completions()})()
+
+
+class RecordingReservation:
+    def __init__(self):
+        self.settled = []
+
+    def settle(self, used_tokens=None):
+        self.settled.append(used_tokens)
+
+    async def settle_async(self, used_tokens=None):
+        self.settle(used_tokens)
+
+
+def _groq_generator(monkeypatch):
+    import src.groq_story
+
+    monkeypatch.setattr(src.groq_story, "get_api_key", lambda name: "key")
+    monkeypatch.setattr(src.groq_story, "build_async_groq_client", lambda api_key, base_url=None: FakeAsyncGroq())
+    return src.groq_story.StoryGenerator()
+
+
+def test_loop_client_closes_the_previous_loops_client(monkeypatch):
+    generator = _groq_generator(monkeypatch)
+
+    async def client():
+        return generator._loop_client()
+
+    first = asyncio.run(client())
+
+    async def next_loop():
+        second = generator._loop_client()
+        await asyncio.sleep(0)
+        return second
+
+    assert asyncio.run(next_loop()) is not first
+    assert first.closed
+
+
+def test_async_transport_error_rebuilds_client(monkeypatch):
+    import src.groq_story
+
+    generator = _groq_generator(monkeypatch)
+    monkeypatch.setattr(generator, "_lookup_cache", lambda full_prompt: (None, None))
+
+    reservation = RecordingReservation()
+
+    async def no_wait(*args):
+        return reservation
+
+    monkeypatch.setattr(src.groq_story, "wait_for_quota_async", no_wait)
+    params = {"age_group": "3-5 years", "genre": "Adventure", "gender": "Girl", "story_length": "6"}
+
+    async def generate():
+        client = generator._loop_client()
+        try:
+            await generator.generate_async(params)
+        except ConnectionError:
+            pass
+        await asyncio.sleep(0)
+        return client
+
+    client = asyncio.run(generate())
+    assert client.closed
+    assert generator._async_client is None
+    assert reservation.settled == [None]
@@ -0,0 +1,32 @@
+# tests/test_dedup.py
+import random
+
+from src.dedup import NearDuplicateIndex
+
+
+def _pair(rng, shared=60, own=10):
+    """Two word lists with Jaccard similarity shared / (shared + 2 * own) (0.75 by default)"""
+    words = [f"w{rng.getrandbits(48)}" for _ in range(shared + 2 * own)]
+    return " ".join(words[:shared + own]), " ".join(words[:shared] + words[shared + own:])
+
+
+def test_pairs_at_threshold_become_candidates(tmp_path):
+    rng = random.Random(7)
+    index = NearDuplicateIndex(tmp_path / "dedup.db")
+    pairs = [_pair(rng) for _ in range(200)]
+    for i, (first, _) in enumerate(pairs):
+        index.add(str(i), first, saved=True)
+
+    found = sum(
+        (index.query(second, threshold=0.0) or (None,))[0] == str(i)
+        for i, (_, second) in enumerate(pairs)
+    )
+    assert found >= 198
+
+
+def test_band_layout_change_rebuckets(tmp_path):
+    first, second = _pair(random.Random(3), shared=90, own=5)
+    NearDuplicateIndex(tmp_path / "dedup.db", bands=16).add("a", first, saved=True)
+
+    index = NearDuplicateIndex(tmp_path / "dedup.db", bands=32)
+    assert index.query(second)[0] == "a"
@@ -0,0 +1,88 @@
+# tests/test_export.py
+import json
+import sqlite3
+
+import pytest
+
+from src import export
+from src.storage import JSONStoryStore, SQLiteStoryStore
+
+PAGES = [{"page_number": 1, "content": "A bunny found a red ball."}]
+
+
+def _story(story_id, created_at="2024-01-01T00:00:00"):
+    return story_id, PAGES, {"id": story_id, "title": f"Story {story_id}", "genre": "Adventure",
+                             "created_at": created_at}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    if request.param == "json":
+        store = JSONStoryStore(tmp_path / "stories.json")
+    else:
+        store = SQLiteStoryStore(tmp_path / "stories.db")
+    monkeypatch.setattr(export, "get_store", lambda: store)
+    return store
+
+
+def _sequences(store, after=None):
+    return {story_id: sequence for sequence, story_id, _ in store.iter_new_stories(after)}
+
+
+def test_deleted_newest_sequence_is_not_reused(store):
+    store.put_many([_story("1"), _story("2")])
+    deleted = _sequences(store)["2"]
+    store.delete("2")
+    if isinstance(store, JSONStoryStore):
+        store.compact()
+    store.put(*_story("3"))
+    assert _sequences(store)["3"] > deleted
+
+
+def test_overwrite_keeps_sequence(store):
+    store.put_many([_story("1"), _story("2")])
+    before = _sequences(store)
+    store.put(*_story("1", "2025-01-01T00:00:00"))
+    assert _sequences(store) == before
+
+
+def test_incremental_export_after_delete(store, tmp_path):
+    store.put_many([_story("1"), _story("2")])
+    path, count = export.export_stories("jsonl", incremental=True, output_dir=tmp_path / "out", workers=1)
+    assert count == 2
+
+    # Back-dated and inserted after the newest exported story was deleted
+    store.delete("2")
+    store.put(*_story("3", "2020-01-01T00:00:00"))
+    path, count = export.export_stories("jsonl", incremental=True, output_dir=tmp_path / "out", workers=1)
+    assert count == 1
+    assert [json.loads(line)["id"] for line in path.read_text(encoding="utf-8").splitlines()] == ["3"]
+
+    assert export.export_stories("jsonl", incremental=True, output_dir=tmp_path / "out", workers=1) == (None, 0)
+
+
+def test_export_with_process_pool(store, tmp_path):
+    store.put_many([_story(str(i)) for i in range(6)])
+    path, count = export.export_stories("jsonl", output_dir=tmp_path, workers=2, batch_size=2)
+    assert count == 6
+
+
+def test_sqlite_backfills_sequence(tmp_path):
+    store = SQLiteStoryStore(tmp_path / "stories.db")
+    store.put_many([_story("1"), _story("2")])
+    store._conn().close()
+    conn = sqlite3.connect(tmp_path / "stories.db")
+    conn.executescript("""
+        DROP TABLE story_sequence;
+        CREATE TABLE legacy (id TEXT PRIMARY KEY, title TEXT, genre TEXT, gender TEXT, age_group TEXT,
+                             created_at TEXT, metadata TEXT NOT NULL, story TEXT NOT NULL);
+        INSERT INTO legacy SELECT id, title, genre, gender, age_group, created_at, metadata, story FROM stories;
+        DROP TABLE stories;
+        ALTER TABLE legacy RENAME TO stories;
+    """)
+    conn.close()
+
+    store = SQLiteStoryStore(tmp_path / "stories.db")
+    assert sorted(_sequences(store).values()) == [1, 2]
+    store.put(*_story("3"))
+    assert _sequences(store, 2) == {"3": 3}
@@ -0,0 +1,26 @@
+# tests/test_import_budget.py
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from benchmarks.bench_imports import import_main, loaded_deferred
+
+
+def test_startup_defers_sdks_and_writes_nothing():
+    """Importing main must not load a provider SDK or create files in the working directory"""
+    modules, created = import_main()
+    assert loaded_deferred(modules) == []
+    assert created == []
+
+
+@pytest.mark.skipif(not os.getenv("TINYTALES_IMPORT_BUDGET_MS"),
+                    reason="wall-clock budget is opt-in: set TINYTALES_IMPORT_BUDGET_MS")
+def test_import_within_budget():
+    budget_ms = float(os.environ["TINYTALES_IMPORT_BUDGET_MS"])
+    best_ms = min(
+        next(cumulative for name, _, cumulative, _ in import_main()[0] if name == "main") / 1000
+        for _ in range(3)
+    )
+    assert best_ms <= budget_ms
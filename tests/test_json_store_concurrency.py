@@ -0,0 +1,51 @@
+# tests/test_json_store_concurrency.py
+import threading
+import time
+
+from src.storage import JSONStoryStore
+
+PAGES = [{"page_number": 1, "content": "A bunny found a red ball."}]
+
+
+def test_reader_during_save_and_compact(tmp_path):
+    """A second store reading while the writer saves and compacts never errors or loses a story"""
+    writer = JSONStoryStore(tmp_path / "stories.json", snapshot_records=5)
+    reader = JSONStoryStore(tmp_path / "stories.json")
+    saved = []
+    errors = []
+    stop = threading.Event()
+
+    def write():
+        try:
+            for i in range(400):
+                writer.put(str(i), PAGES, {"id": str(i), "title": f"Story {i}"})
+                saved.append(str(i))
+                if i % 7 == 0:
+                    writer.compact()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+
+    def read():
+        try:
+            while not stop.is_set():
+                expected = list(saved)
+                reader.version()
+                stories = reader.all()
+                missing = [story_id for story_id in expected if story_id not in stories]
+                assert not missing, f"reader lost {len(missing)} saved stories"
+                if expected:
+                    assert reader.get(expected[-1]) is not None
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert not errors, repr(errors[0])
+    assert len(reader.all()) == 400
@@ -0,0 +1,68 @@
+# tests/test_library_cache.py
+import pytest
+
+from src.database import QueryCache
+from src.storage import JSONStoryStore, SQLiteStoryStore
+
+PAGES = [{"page_number": 1, "content": "A bunny found a red ball."}]
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def stores(request, tmp_path):
+    """Two handles on one library: ours, and one standing in for another process"""
+    if request.param == "json":
+        return JSONStoryStore(tmp_path / "stories.json"), JSONStoryStore(tmp_path / "stories.json")
+    return SQLiteStoryStore(tmp_path / "stories.db"), SQLiteStoryStore(tmp_path / "stories.db")
+
+
+def _count(cache, store, calls):
+    def query():
+        calls.append(1)
+        return store.count()
+
+    return cache.get(store, ("count", None), query)
+
+
+def test_repeat_query_is_served_from_memory(stores):
+    store, _ = stores
+    cache, calls = QueryCache(), []
+    store.put("1", PAGES, {"id": "1"})
+
+    assert _count(cache, store, calls) == _count(cache, store, calls) == 1
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("writer", ["ours", "theirs"])
+def test_any_write_reruns_the_query(stores, writer):
+    store, other = stores
+    cache, calls = QueryCache(), []
+    assert _count(cache, store, calls) == 0
+
+    (store if writer == "ours" else other).put("1", PAGES, {"id": "1"})
+    assert _count(cache, store, calls) == 1
+    store.delete("1")
+    assert _count(cache, store, calls) == 0
+    assert len(calls) == 3
+
+
+def test_result_of_a_query_overtaken_by_a_write_is_not_kept(stores):
+    store, other = stores
+    cache = QueryCache()
+
+    def racing_query():
+        other.put("1", PAGES, {"id": "1"})
+        return "stale"
+
+    assert cache.get(store, "key", racing_query) == "stale"
+    assert cache.get(store, "key", lambda: "fresh") == "fresh"
+
+
+def test_oldest_result_is_evicted():
+    class FixedStore:
+        def version(self):
+            return 1
+
+    cache = QueryCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.get(FixedStore(), key, lambda: key)
+    assert list(cache.results) == ["b", "c"]
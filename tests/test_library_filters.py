@@ -0,0 +1,41 @@
+# tests/test_library_filters.py
+import pytest
+
+from src.storage import JSONStoryStore, SQLiteStoryStore
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        store = JSONStoryStore(tmp_path / "stories.json")
+    else:
+        store = SQLiteStoryStore(tmp_path / "stories.db")
+    pages = [{"page_number": 1, "content": "A bunny found a red ball."}]
+    store.put_many([
+        ("1", pages, {"id": "1", "title": "Bunny", "genre": "Adventure", "age_group": "3-5",
+                      "created_at": "2024-01-01T00:00:00"}),
+        ("2", pages, {"id": "2", "title": "Ball", "genre": None, "age_group": "3-5",
+                      "created_at": "2024-01-02T00:00:00"}),
+        ("3", pages, {"id": "3", "title": "Fox", "genre": "", "age_group": "6-8",
+                      "created_at": "2024-01-03T00:00:00"}),
+    ])
+    return store
+
+
+def test_none_is_no_filter(store):
+    assert store.count({"genre": None}) == 3
+
+
+def test_unknown_matches_missing_and_blank(store):
+    filters = {"genre": ""}
+    assert store.facet_counts()["genre"][""] == 2
+    assert store.count(filters) == 2
+    assert sorted(s["id"] for s in store.list_summaries(0, 10, filters)) == ["2", "3"]
+    results, total = store.search("bunny", 0, 10, filters)
+    assert total == 2 and sorted(s["id"] for s in results) == ["2", "3"]
+
+
+def test_unknown_with_date_range(store):
+    filters = {"genre": "", "created_from": "2024-01-03"}
+    assert store.count(filters) == 1
+    assert [s["id"] for s in store.list_summaries(0, 10, filters, sort="title")] == ["3"]
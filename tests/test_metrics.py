@@ -0,0 +1,53 @@
+# tests/test_metrics.py
+import time
+
+import src.metrics
+from src.metrics import MetricsRegistry, Trace, current_trace, instrument, stage, traced
+
+
+def _trace(provider="groq"):
+    trace = Trace("generate_story", provider)
+    trace.seconds = 0.5
+    trace.stages = {"provider": 0.4}
+    return trace
+
+
+def test_log_rotates_at_size_cap(tmp_path):
+    log_path = tmp_path / "metrics.jsonl"
+    registry = MetricsRegistry(log_path, log_max_bytes=1000, log_backups=2)
+    for _ in range(40):
+        registry.record(_trace())
+
+    assert not log_path.exists() or log_path.stat().st_size < 1000
+    assert (tmp_path / "metrics.jsonl.1").exists() and (tmp_path / "metrics.jsonl.2").exists()
+    assert not (tmp_path / "metrics.jsonl.3").exists()
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.record(_trace(provider='a "quoted"\\path\nnext'))
+    text = registry.render_prometheus()
+    assert 'provider="a \\"quoted\\"\\\\path\\nnext"' in text
+    assert all(line.count('"') % 2 == 0 for line in text.splitlines())
+
+
+def test_stream_trace_is_current_only_while_the_stream_runs(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(src.metrics, "get_metrics", lambda: registry)
+    traces = []
+
+    @instrument("stream", "test")
+    def stream():
+        traces.append(current_trace())
+        yield 1
+        yield 2
+
+    with traced("page") as page:
+        for _ in stream():
+            assert current_trace() is page
+            with stage("render"):
+                time.sleep(0.01)
+
+    assert traces[0] is not page and traces[0].operation == "stream"
+    assert "render" not in traces[0].stages and "render" in page.stages
+    assert current_trace() is None
@@ -0,0 +1,76 @@
+# tests/test_quota.py
+import asyncio
+import threading
+
+import pytest
+
+from src.quota import QuotaScheduler, QuotaTimeout
+
+LIMITS = {"mock": {"rpm": 60, "tpm": 1000000}}
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return QuotaScheduler(tmp_path / "quota.db", limits=LIMITS, poll_seconds=0.05, stale_seconds=30)
+
+
+def _drain(scheduler):
+    for _ in range(LIMITS["mock"]["rpm"]):
+        scheduler.acquire("mock", 10, "drain")
+
+
+def test_swept_ticket_is_requeued(scheduler):
+    _drain(scheduler)
+    ticket = scheduler.enqueue("mock", 10, "slow")
+    # Its process stalls past stale_seconds, so the next poll from anyone sweeps it
+    scheduler._conn().execute("UPDATE waiters SET heartbeat = 0 WHERE ticket = ?", (ticket,))
+    scheduler.try_acquire(scheduler.enqueue("mock", 10, "other"))
+    with pytest.raises(KeyError):
+        scheduler.try_acquire(ticket)
+
+    new_ticket, position, _ = scheduler._poll(ticket, ("mock", 10, "slow", 0))
+    assert new_ticket != ticket and position == 2
+
+
+def test_acquire_times_out(scheduler):
+    _drain(scheduler)
+    with pytest.raises(QuotaTimeout):
+        scheduler.acquire("mock", 10, "late", max_wait=0.1)
+    assert scheduler._conn().execute("SELECT COUNT(*) FROM waiters").fetchone()[0] == 0
+
+
+def test_acquire_async_polls_off_the_event_loop(scheduler, monkeypatch):
+    _drain(scheduler)
+    loop_thread = threading.get_ident()
+    polled_from = set()
+    try_acquire = scheduler.try_acquire
+
+    def recording_try_acquire(ticket):
+        polled_from.add(threading.get_ident())
+        return try_acquire(ticket)
+
+    monkeypatch.setattr(scheduler, "try_acquire", recording_try_acquire)
+    waits = []
+    asyncio.run(scheduler.acquire_async("mock", 10, "async", on_wait=lambda *args: waits.append(args)))
+    assert waits and loop_thread not in polled_from
+
+
+def _tokens(scheduler):
+    return scheduler._conn().execute("SELECT tokens FROM buckets WHERE provider = 'mock'").fetchone()[0]
+
+
+def test_settle_returns_unused_tokens(tmp_path):
+    scheduler = QuotaScheduler(tmp_path / "quota.db", limits={"mock": {"rpm": 60, "tpm": 1000}})
+    reservation = scheduler.acquire("mock", 600, "s")
+    assert _tokens(scheduler) == pytest.approx(400, abs=5)
+
+    reservation.settle(100)
+    reservation.settle(0)  # only the first settle counts
+    assert _tokens(scheduler) == pytest.approx(900, abs=5)
+
+
+def test_failed_request_is_refunded(tmp_path):
+    scheduler = QuotaScheduler(tmp_path / "quota.db", limits={"mock": {"rpm": 60, "tpm": 1000}})
+    for _ in range(5):
+        scheduler.acquire("mock", 600, "s", max_wait=0.5).settle()
+    assert _tokens(scheduler) == pytest.approx(1000, abs=5)
@@ -0,0 +1,205 @@
+# tests/test_router.py
+import asyncio
+import time
+
+import pytest
+
+import src.router
+from src.quota import QuotaTimeout
+from src.router import StoryRouter
+
+
+class RecordingStreamlit:
+    """Stands in for the streamlit module and remembers what was drawn"""
+
+    def __init__(self):
+        self.calls = []
+        self.session_state = {}
+
+    def empty(self):
+        return self
+
+    def info(self, message):
+        self.calls.append(("info", message))
+
+    def warning(self, message):
+        self.calls.append(("warning", message))
+
+    def error(self, message):
+        self.calls.append(("error", message))
+
+
+@pytest.fixture
+def st(monkeypatch):
+    recorder = RecordingStreamlit()
+    monkeypatch.setattr(src.router, "st", recorder)
+    return recorder
+
+
+@pytest.fixture(autouse=True)
+def claimed(monkeypatch):
+    """Stories the router claimed, instead of allocating real IDs"""
+    stories = []
+
+    def claim(story_data):
+        story_data['metadata']['id'] = f"story_{len(stories) + 1}"
+        stories.append(story_data)
+        return story_data
+
+    monkeypatch.setattr(src.router, "claim_story", claim)
+    return stories
+
+
+def _story(title="A story"):
+    return {"story": [{"page_number": 1, "content": "Once."}], "metadata": {"title": title}}
+
+
+class QueuedBackend:
+    def __init__(self, queued=0.05, error=None):
+        self.queued = queued
+        self.error = error
+
+    async def generate_async(self, story_params, session_id="batch", priority=0, on_wait=None, on_duplicate=None,
+                             claim=True, on_granted=None):
+        if on_wait:
+            on_wait(2, 5.0)
+        await asyncio.sleep(self.queued)
+        if self.error:
+            raise self.error
+        on_granted()
+        if on_duplicate:
+            on_duplicate(0.91)
+        return _story()
+
+
+class FailingBackend:
+    async def generate_async(self, *args, **kwargs):
+        raise ConnectionError("down")
+
+
+def test_generate_story_shows_queue_position_and_duplicate_warning(st):
+    story_data = StoryRouter({"a": QueuedBackend()}, mode="failover").generate_story({})
+
+    assert story_data["metadata"]["backend"] == "a"
+    kinds = [kind for kind, _ in st.calls]
+    assert kinds == ["info", "warning"]
+    assert "number 2 in line" in st.calls[0][1] and "0.91" in st.calls[1][1]
+
+
+def test_generate_story_fails_over_without_extra_errors(st):
+    router = StoryRouter({"down": FailingBackend(), "up": QueuedBackend()}, mode="failover")
+    assert router.generate_story({})["metadata"]["backend"] == "up"
+    assert not [call for call in st.calls if call[0] == "error"]
+
+
+def test_quota_wait_is_not_part_of_the_timeout():
+    router = StoryRouter({"a": QueuedBackend(queued=0.3)}, mode="failover", timeout=0.1)
+    assert asyncio.run(router.route({}))["metadata"]["backend"] == "a"
+    assert not router._failed_at
+
+
+def test_quota_timeout_fails_over_without_cooldown():
+    router = StoryRouter(
+        {"busy": QueuedBackend(queued=0, error=QuotaTimeout("busy")), "up": QueuedBackend(queued=0)},
+        mode="failover"
+    )
+    assert asyncio.run(router.route({}))["metadata"]["backend"] == "up"
+    assert not router._failed_at
+
+
+class StreamBackend:
+    def __init__(self, delay=0.0, error=None, queued=0.0, stall=0.0):
+        self.delay = delay
+        self.error = error
+        self.queued = queued
+        self.stall = stall
+
+    def generate_story_stream(self, story_params, on_error=None, on_granted=None):
+        time.sleep(self.queued)
+        on_granted()
+        time.sleep(self.delay)
+        if self.error:
+            on_error(self.error)
+            yield "done", None
+            return
+        yield "title", "A story"
+        time.sleep(self.stall)
+        yield "page", {"page_number": 1, "content": "Once."}
+        yield "done", _story()
+
+
+@pytest.fixture
+def no_session(monkeypatch):
+    monkeypatch.setattr(src.router, "_attach_session", lambda thread: None)
+
+
+def test_stream_fails_over_after_timeout(st, no_session):
+    router = StoryRouter({"slow": StreamBackend(delay=2), "fast": StreamBackend()}, mode="failover", timeout=0.2)
+    start = time.perf_counter()
+    events = list(router.generate_story_stream({}))
+
+    assert time.perf_counter() - start < 1.5
+    assert events[-1][1]["metadata"]["backend"] == "fast"
+    assert "slow" == router._order()[-1]
+    assert not st.calls
+
+
+def test_stream_waits_out_the_quota_queue(st, no_session):
+    router = StoryRouter({"a": StreamBackend(queued=0.4)}, mode="failover", timeout=0.2)
+    events = list(router.generate_story_stream({}))
+    assert events[-1][1]["metadata"]["backend"] == "a"
+    assert not router._failed_at
+
+
+def test_stream_times_out_when_it_stalls_mid_story(st, no_session):
+    router = StoryRouter({"stalls": StreamBackend(stall=2), "b": StreamBackend()}, mode="failover", timeout=0.2)
+    start = time.perf_counter()
+    events = list(router.generate_story_stream({}))
+
+    assert time.perf_counter() - start < 1.5
+    # The title is already on screen, so the stream ends rather than mixing in another story
+    assert events == [("title", "A story"), ("done", None)]
+    assert "stalls" in router._failed_at
+    assert st.calls == [("error", "Error generating story: stalls sent nothing for 0.2s")]
+
+
+def test_stream_reports_only_the_last_error(st, no_session):
+    router = StoryRouter(
+        {"a": StreamBackend(error=ConnectionError("a down")), "b": StreamBackend(error=ConnectionError("b down"))},
+        mode="failover"
+    )
+    assert list(router.generate_story_stream({})) == [("done", None)]
+    assert st.calls == [("error", "Error generating story: b down")]
+
+
+class SlowBackend:
+    def __init__(self, delay, title):
+        self.delay = delay
+        self.title = title
+        self.claims = []
+
+    async def generate_async(self, story_params, session_id="batch", priority=0, on_wait=None, on_duplicate=None,
+                             claim=True, on_granted=None):
+        self.claims.append(claim)
+        on_granted()
+        await asyncio.sleep(self.delay)
+        return _story(self.title)
+
+
+def test_hedged_claims_only_the_winner(claimed):
+    slow, fast = SlowBackend(0.3, "slow"), SlowBackend(0.05, "fast")
+    router = StoryRouter({"slow": slow, "fast": fast}, mode="hedged")
+    router.hedge_delay = lambda backend: 0.01
+
+    story_data = asyncio.run(router.route({}))
+
+    assert story_data["metadata"]["title"] == "fast"
+    assert slow.claims == fast.claims == [False]
+    assert [story["metadata"]["title"] for story in claimed] == ["fast"]
+
+
+def test_unclaimed_batch(claimed):
+    router = StoryRouter({"a": SlowBackend(0, "a")}, mode="failover")
+    results = asyncio.run(router.generate_many([{}, {}], claim=False))
+    assert [result["story_data"]["metadata"]["title"] for result in results] == ["a", "a"]
+    assert claimed == []
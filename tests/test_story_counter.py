@@ -0,0 +1,21 @@
+# tests/test_story_counter.py
+import os
+
+import pytest
+
+from benchmarks.stress_story_counter import run_stress
+from src.story_counter import StoryIdAllocator
+
+
+@pytest.mark.parametrize("block_size", [1, 20, 100])
+def test_ids_unique_across_processes_and_threads(block_size):
+    assert run_stress(processes=4, threads=4, calls=200, block_size=block_size)
+
+
+def test_ids_continue_after_restart(tmp_path):
+    path = os.path.join(tmp_path, "story_count.json")
+    allocator = StoryIdAllocator(path, block_size=20)
+    first = [allocator.next_id() for _ in range(3)]
+    second = StoryIdAllocator(path, block_size=20).next_id()
+    assert first == [1, 2, 3]
+    assert second > max(first)  # the rest of the first block is skipped, never reused
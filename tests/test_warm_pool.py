@@ -0,0 +1,42 @@
+# tests/test_warm_pool.py
+import src.warm_pool
+from src.warm_pool import WarmPool, pool_key, take_warm_story
+
+PARAMS = {"genre": "Adventure", "gender": "girl", "age_group": "3-5", "story_length": 5,
+          "include_moral": True, "include_dialogue": False, "rhyming": False, "description": ""}
+
+
+def test_served_story_is_claimed_once(tmp_path, monkeypatch):
+    pool = WarmPool(tmp_path / "warm_pool.db")
+    monkeypatch.setattr(src.warm_pool, "get_warm_pool", lambda: pool)
+    claimed = []
+
+    def claim(story_data):
+        story_data["metadata"].update(id=f"story_{len(claimed) + 8}", created_at="2024-02-01T00:00:00")
+        claimed.append(story_data)
+        return story_data
+
+    monkeypatch.setattr(src.warm_pool, "claim_story", claim)
+    pool.add(pool_key(PARAMS), {"story": [], "metadata": {"id": None, "created_at": None}})
+
+    served = take_warm_story(PARAMS)
+    assert served["metadata"]["id"] == "story_8"
+    assert claimed == [served]
+    assert take_warm_story(PARAMS) is None
+
+
+class RecordingGenerator:
+    def __init__(self):
+        self.calls = []
+
+    def generate_batch(self, params_list, claim=True):
+        self.calls.append(claim)
+        return [{"story_data": {"story": [], "metadata": {"id": None}}, "error": None} for _ in params_list]
+
+
+def test_refill_leaves_stories_unclaimed(tmp_path):
+    pool = WarmPool(tmp_path / "warm_pool.db", size=2, min_score=0)
+    pool.record_request(pool_key(PARAMS), PARAMS)
+    generator = RecordingGenerator()
+    assert pool.refill(generator) == 2
+    assert generator.calls == [False]